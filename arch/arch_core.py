@@ -1,7 +1,7 @@
 # Package: BulkDNS
 # Module: arch/arch_core
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-22
+# Rev: 2026-10-18
 
 import logging
 
@@ -31,21 +31,31 @@ def run(config_dta):
     db_retry_sleep_time = int(config_dta['DEFAULT']['db_retry_sleep_time'])
 
     db_backup_type = config_dta['DEFAULT']['db_backup_type']
+    # Tables backed up / restored in parallel and rows per read / write chunk
+    backup_workers = int(config_dta['DEFAULT'].get('backup_workers', 4))
+    backup_chunk_size = int(config_dta['DEFAULT'].get('backup_chunk_size', data_ops.BACKUP_CHUNK_SIZE))
+    # Incremental backup re-reads rows updated up to backup_overlap seconds before the previous backup
+    backup_overlap = int(config_dta['DEFAULT'].get('backup_overlap', data_ops.BACKUP_OVERLAP))
+    # Archive / restore between PostgreSQL DBs on the same server via postgres_fdw (opt-in, see config.cfg)
+    archive_fdw = config_dta['DEFAULT'].get('archive_fdw', 'no') == 'yes'
 
     # Prepare default domain db and domain archive db objects
     if db_domain_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
-        db_domain = sqlite.DB(db_domain_type, db_path, db_domain_name, db_retry_limit)
-        db_domain_arch = sqlite.DB(db_domain_type, db_path, db_domain_archive_name, db_retry_limit)
+        db_pragmas = sqlite.settings(cfg_db)
+        db_domain = sqlite.DB(db_domain_type, db_path, db_domain_name, db_retry_limit, db_pragmas)
+        db_domain_arch = sqlite.DB(db_domain_type, db_path, db_domain_archive_name, db_retry_limit, db_pragmas)
     elif db_domain_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         db_host = cfg_db['db_host']
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
-        db_domain = postgresql.DB(db_domain_type, db_domain_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
-        db_domain_arch = postgresql.DB(db_domain_type, db_domain_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
+        db_domain = postgresql.DB(db_domain_type, db_domain_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
+        db_domain_arch = postgresql.DB(db_domain_type, db_domain_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -54,16 +64,19 @@ def run(config_dta):
     if db_dict_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
-        db_dict = sqlite.DB(db_dict_type, db_path, db_dict_name, db_retry_limit)
-        db_dict_arch = sqlite.DB(db_dict_type, db_path, db_dict_archive_name, db_retry_limit)
+        db_pragmas = sqlite.settings(cfg_db)
+        db_dict = sqlite.DB(db_dict_type, db_path, db_dict_name, db_retry_limit, db_pragmas)
+        db_dict_arch = sqlite.DB(db_dict_type, db_path, db_dict_archive_name, db_retry_limit, db_pragmas)
     elif db_dict_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         db_host = cfg_db['db_host']
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
-        db_dict = postgresql.DB(db_dict_type, db_dict_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
-        db_dict_arch = postgresql.DB(db_dict_type, db_dict_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
+        db_dict = postgresql.DB(db_dict_type, db_dict_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
+        db_dict_arch = postgresql.DB(db_dict_type, db_dict_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -72,20 +85,23 @@ def run(config_dta):
     if db_backup_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
+        db_pragmas = sqlite.settings(cfg_db)
         db_backup_domain_name = f'{db_domain_name}_backup'
-        db_domain_backup = sqlite.DB(db_backup_type, db_path, db_backup_domain_name, db_retry_limit)
+        db_domain_backup = sqlite.DB(db_backup_type, db_path, db_backup_domain_name, db_retry_limit, db_pragmas)
         db_backup_dict_name = f'{db_dict_name}_backup'
-        db_dict_backup = sqlite.DB(db_backup_type, db_path, db_backup_dict_name, db_retry_limit)
+        db_dict_backup = sqlite.DB(db_backup_type, db_path, db_backup_dict_name, db_retry_limit, db_pragmas)
     elif db_backup_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         db_host = cfg_db['db_host']
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
         db_backup_domain_name = f'{db_domain_name}_backup'
-        db_domain_backup = postgresql.DB(db_backup_type, db_backup_domain_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        db_domain_backup = postgresql.DB(db_backup_type, db_backup_domain_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
         db_backup_dict_name = f'{db_dict_name}_backup'
-        db_dict_backup = postgresql.DB(db_backup_type, db_backup_dict_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        db_dict_backup = postgresql.DB(db_backup_type, db_backup_dict_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -94,35 +110,38 @@ def run(config_dta):
     log.info('2 - Restore domains expiring in next 30 days')
     log.info('3 - Migrate / Backup all data to the separate database')
     log.info('4 - Bring back from backup')
+    log.info('5 - Backup data changed since the last backup to the separate database (incremental)')
     log.info('Choose option and press Enter: ')
     user_option = input()
 
     if user_option == '1':
         arch_type = 'archive'
         # domains
-        data_ops.archiver(db_domain, db_domain_arch, tbl_domain_names, tld_domain, arch_type)
+        data_ops.archiver(db_domain, db_domain_arch, tbl_domain_names, tld_domain, arch_type, archive_fdw)
         # dictionary
-        data_ops.archiver(db_dict, db_dict_arch, tbl_dict_names, tld_dict, arch_type)
+        data_ops.archiver(db_dict, db_dict_arch, tbl_dict_names, tld_dict, arch_type, archive_fdw)
 
     elif user_option == '2':
         arch_type = 'restore'
         # domains
-        data_ops.archiver(db_domain, db_domain_arch, tbl_domain_names, tld_domain, arch_type)
+        data_ops.archiver(db_domain, db_domain_arch, tbl_domain_names, tld_domain, arch_type, archive_fdw)
         # dictionary
-        data_ops.archiver(db_dict, db_dict_arch, tbl_dict_names, tld_dict, arch_type)
+        data_ops.archiver(db_dict, db_dict_arch, tbl_dict_names, tld_dict, arch_type, archive_fdw)
 
-    elif user_option == '3':
+    elif user_option in ('3', '5'):
+        backup_mode = 'full' if user_option == '3' else 'incremental'
         # domains
-        data_ops.backup_data(db_domain, db_domain_arch, db_domain_backup, tbl_domain_names, tld_domain)
+        data_ops.backup_data(db_domain, db_domain_arch, db_domain_backup, tbl_domain_names, tld_domain, backup_workers,
+                             backup_chunk_size, backup_mode, backup_overlap)
         # dictionary
-        data_ops.backup_data(db_dict, db_dict_arch, db_dict_backup, tbl_dict_names, tld_dict)
-
+        data_ops.backup_data(db_dict, db_dict_arch, db_dict_backup, tbl_dict_names, tld_dict, backup_workers,
+                             backup_chunk_size, backup_mode, backup_overlap)
 
     elif user_option == '4':
         # domains
-        data_ops.backup_data(db_domain_backup, None, db_domain, tbl_domain_names, tld_domain)
+        data_ops.backup_data(db_domain_backup, None, db_domain, tbl_domain_names, tld_domain, backup_workers, backup_chunk_size)
         # dictionary
-        data_ops.backup_data(db_dict_backup, None, db_dict, tbl_dict_names, tld_dict)
+        data_ops.backup_data(db_dict_backup, None, db_dict, tbl_dict_names, tld_dict, backup_workers, backup_chunk_size)
 
     else:
         log.info('Incorrect option picked')
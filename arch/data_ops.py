@@ -1,102 +1,467 @@
 # Package: BulkDNS
 # Module: arch/data_ops
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2023-12-23
+# Rev: 2026-10-18
 
+import concurrent.futures
+import contextlib
 import datetime
 import logging
 
 log = logging.getLogger('main')
 
+COLUMNS = ('domain', 'name', 'tld', 'avail', 'expiry', 'updated')
+COLUMN_LIST = ', '.join(COLUMNS)
 
-def backup_data(db, db_arch, db_backup, tbl_names, tld):
 
+# Backup / restore streams tables from source into backup (destination) DB:
+#  - tables are processed in parallel by backup_workers threads,
+#  - source rows are read via server side cursor (dedicated connection) and written by chunked bulk_load (COPY), so
+#    memory use does not depend on table size,
+#  - PostgreSQL sources are read in snapshot exported once per source DB, so all tables are consistent,
+#  - source rows are loaded into staging table of backup DB first, destination table is replaced with staging data
+#    in single transaction only when the whole source was read - failed read (e.g. restore into live DB) leaves
+#    destination table untouched,
+#  - secondary indexes of destination table are dropped before the replace and created again after it.
+BACKUP_CHUNK_SIZE = 100000  # Rows per read and write chunk
+STAGING_SUFFIX = '_staging'
+
+# Incremental backup copies only what changed since the previous backup of the table:
+#  - watermark (start time of the previous backup, UTC) is kept per table in backup_state table of backup DB, rows
+#    with updated newer than watermark minus backup_overlap seconds are upserted (lookup result is written with
+#    delay after its updated time is set, overlap covers it),
+#  - inserts and deletes (new names, archive / restore moves, dictionary reloads do not change updated) are logged
+#    into backup_journal table of source DB by triggers created on source tables with the first incremental backup
+#    (together with index on updated, so changed rows are read by index instead of full table scan). Until then
+#    bulk inserts / moves of source tables do not pay for journal writes. Journal entries visible in backup snapshot
+#    are processed and removed by incremental and full backups - inserted domains are upserted, deleted domains
+#    (tombstones) are removed from backup unless they still exist in live or archive DB (archive / restore move),
+#  - table without watermark or with journal just created (first backup, backup after restore) is backed up in full.
+#    Full backup of all tables can be requested any time, it sets new watermarks as well.
+JOURNAL = 'backup_journal'
+STATE = 'backup_state'
+BACKUP_OVERLAP = 3600  # seconds
+
+
+def clean_rows(chunks):
+    # Validate or manipulate source data before insert into destination - strip strings, replace "" with None
+    for chunk in chunks:
+        for row in chunk:
+            yield [(item.strip() or None) if isinstance(item, str) else item for item in row]
+
+
+def clear_query(db_type, table):
+    if db_type == 'sqlite':
+        return f'DELETE FROM {table}'  # Freed pages are reused by the load
+    elif db_type == 'postgresql':
+        return f'TRUNCATE {table}'
+    return None
+
+
+def staging_create(db_backup, staging):
+    # Staging table with the backed up columns and primary key only (loaded rows are not checked, no queue needed)
+    call_id = f'{db_backup.db_type} | {staging} | CREATE TABLE'
+    queries = [(f'DROP TABLE IF EXISTS {staging}', None),
+               (f'CREATE TABLE {staging} (domain VARCHAR(300) PRIMARY KEY NOT NULL, name VARCHAR(255), '
+                f'tld VARCHAR(40), avail CHARACTER(1), expiry TIMESTAMP, updated TIMESTAMP)', None)]
+    return db_backup.execute_transaction(queries, call_id) is not None
+
+
+def staging_drop(db_backup, staging):
+    db_backup.execute_single(f'DROP TABLE IF EXISTS {staging}', f'{db_backup.db_type} | {staging} | DROP TABLE')
+
+
+def journal_table_query(db_type):
+    if db_type == 'sqlite':
+        # AUTOINCREMENT - ids of removed entries are never used again
+        return (f'CREATE TABLE IF NOT EXISTS {JOURNAL} (id INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, '
+                f'domain TEXT NOT NULL, op CHARACTER(1) NOT NULL)')
+    return (f'CREATE TABLE IF NOT EXISTS {JOURNAL} (id BIGSERIAL PRIMARY KEY, tbl VARCHAR(100) NOT NULL, '
+            f'domain VARCHAR(300) NOT NULL, op CHARACTER(1) NOT NULL)')
+
+
+def journal_exists(db, table):
+    # Both journal triggers of source table exist
+    names = [f'{table}_journal_insert', f'{table}_journal_delete']
+    call_id = f'{db.db_type}/{db.db_name}/{table} | JOURNAL SELECT'
+    if db.db_type == 'sqlite':
+        sql_select_param = "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?)"
+        res = db.execute_single_param(sql_select_param, tuple(names), call_id)
+    elif db.db_type == 'postgresql':
+        res = db.execute_single_param('SELECT count(*) FROM pg_trigger WHERE tgname = ANY(%s)', (names,), call_id)
+    else:
+        log.error(f'Error: Incorrect database type')
+        return False
+    return bool(res) and res[0][0] == len(names)
+
+
+def journal_create(db, table):
+    # Journal table, insert / delete triggers and updated index of source table, nothing is changed when they already
+    # exist. Index on updated costs one more index write per check result, it is created only for incremental backup.
+    call_id = f'{db.db_type}/{db.db_name}/{table} | JOURNAL'
+    queries = [(journal_table_query(db.db_type), None),
+               (f'CREATE INDEX IF NOT EXISTS {table}_updated ON {table} (updated)', None)]
+    if db.db_type == 'sqlite':
+        for op, event, row in (('I', 'INSERT', 'new'), ('D', 'DELETE', 'old')):
+            queries.append((f'CREATE TRIGGER IF NOT EXISTS {table}_journal_{event.lower()} AFTER {event} ON {table} '
+                            f"BEGIN INSERT INTO {JOURNAL} (tbl, domain, op) VALUES ('{table}', {row}.domain, '{op}'); END", None))
+    elif db.db_type == 'postgresql':
+        # Statement level triggers with transition tables - one journal INSERT per statement (COPY, set-based moves)
+        sql_select_param = 'SELECT tgname FROM pg_trigger WHERE tgname = ANY(%s)'
+        names = [f'{table}_journal_insert', f'{table}_journal_delete']
+        existing = {row[0] for row in db.execute_single_param(sql_select_param, (names,), f'{call_id} | SELECT') or []}
+        for op, event, row in (('I', 'INSERT', 'NEW'), ('D', 'DELETE', 'OLD')):
+            function = f'{JOURNAL}_{event.lower()}'
+            if f'{table}_journal_{event.lower()}' in existing:
+                continue
+            queries.append((f'CREATE OR REPLACE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+                            f"INSERT INTO {JOURNAL} (tbl, domain, op) SELECT TG_TABLE_NAME, domain, '{op}' FROM changed; "
+                            f'RETURN NULL; END $$', None))
+            queries.append((f'CREATE TRIGGER {table}_journal_{event.lower()} AFTER {event} ON {table} '
+                            f'REFERENCING {row} TABLE AS changed FOR EACH STATEMENT EXECUTE FUNCTION {function}()', None))
+    else:
+        log.error(f'Error: Incorrect database type')
+        return False
+    return db.execute_transaction(queries, call_id) is not None
+
+
+def journal_drop(db, table):
+    # Triggers and journal entries of table removed (e.g. before restore rewrites the whole table)
+    call_id = f'{db.db_type}/{db.db_name}/{table} | JOURNAL DROP'
+    if db.db_type == 'sqlite':
+        queries = [(f'DROP TRIGGER IF EXISTS {table}_journal_{event}', None) for event in ('insert', 'delete')]
+    elif db.db_type == 'postgresql':
+        queries = [(f'DROP TRIGGER IF EXISTS {table}_journal_{event} ON {table}', None) for event in ('insert', 'delete')]
+    else:
+        log.error(f'Error: Incorrect database type')
+        return
+    queries += [(journal_table_query(db.db_type), None), (f"DELETE FROM {JOURNAL} WHERE tbl = '{table}'", None)]
+    db.execute_transaction(queries, call_id)
+
+
+def journal_read(db, table, snapshot, chunk_size):
+    # Journal entries of table visible in snapshot -> (deleted domains, id ranges to be removed after backup)
+    # Ids are kept as ranges of consecutive ids, entries of transactions not visible in snapshot stay for the next run
+    deleted = set()
+    ranges = []
+    query = f"SELECT id, op, domain FROM {JOURNAL} WHERE tbl = '{table}' ORDER BY id"
+    for chunk in db.stream(query, f'{db.db_type} | {JOURNAL} {table} | SELECT', chunk_size, snapshot):
+        for entry_id, op, domain_name in chunk:
+            if ranges and ranges[-1][1] == entry_id - 1:
+                ranges[-1][1] = entry_id
+            else:
+                ranges.append([entry_id, entry_id])
+            if op == 'D':
+                deleted.add(domain_name)
+    return deleted, ranges
+
+
+def journal_clear(db, table, ranges):
+    call_id = f'{db.db_type}/{db.db_name}/{table} | JOURNAL DELETE'
+    if db.db_type == 'sqlite':
+        param_query = f'DELETE FROM {JOURNAL} WHERE id BETWEEN ? AND ?'
+    elif db.db_type == 'postgresql':
+        param_query = f'DELETE FROM {JOURNAL} WHERE id BETWEEN %s AND %s'
+    else:
+        log.error(f'Error: Incorrect database type')
+        return
+    if ranges:
+        db.execute_many_param(param_query, [tuple(item) for item in ranges], call_id)
+
+
+def state_create(db_backup):
+    query = (f'CREATE TABLE IF NOT EXISTS {STATE} (tbl VARCHAR(100) PRIMARY KEY NOT NULL, watermark VARCHAR(19), '
+             f'mode VARCHAR(11), finished VARCHAR(19))')
+    db_backup.execute_single(query, f'{db_backup.db_type} | {STATE} | CREATE TABLE')
+
+
+def state_read(db_backup, table):
+    # Watermark of the previous backup of table, None if there was none
+    call_id = f'{db_backup.db_type} | {STATE} {table} | SELECT'
+    res = db_backup.execute_single(f"SELECT watermark FROM {STATE} WHERE tbl = '{table}'", call_id)
+    return res[0][0] if res else None
+
+
+def state_write(db_backup, table, watermark, mode):
+    call_id = f'{db_backup.db_type} | {STATE} {table} | UPSERT'
+    if db_backup.db_type == 'sqlite':
+        mark = '?'
+    elif db_backup.db_type == 'postgresql':
+        mark = '%s'
+    else:
+        log.error(f'Error: Incorrect backup database type')
+        return
+    param_query = (f'INSERT INTO {STATE} (tbl, watermark, mode, finished) VALUES ({mark}, {mark}, {mark}, {mark}) '
+                   f'ON CONFLICT (tbl) DO UPDATE SET watermark = excluded.watermark, mode = excluded.mode, finished = excluded.finished')
+    db_backup.execute_single_param(param_query, (table, watermark, mode, now_utc()), call_id)
+
+
+def state_clear(db_backup, tbl_names, tld):
+    # Next backup of tables is full one
+    state_create(db_backup)
     for tbl_name in tbl_names:
         table = f'{tbl_name}_{tld}'
+        db_backup.execute_single(f"DELETE FROM {STATE} WHERE tbl = '{table}'", f'{db_backup.db_type} | {STATE} {table} | DELETE')
+
+
+def now_utc():
+    # The same format as updated column values
+    return datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S")
 
-        # If only source and backup provided then it is restore, otherwise it is backup
-        if db_arch is None:
-            log.info(f'Restore {table} from {db.db_type}:{db.db_name} into {db_backup.db_type}:{db_backup.db_name}')
-        else:
-            log.info(f'Backup of {table} from {db.db_type}:{db.db_name} & {db_arch.db_name} into {db_backup.db_type}:{db_backup.db_name}')
 
-        log.debug(f'Phase 1: Getting source DB data (live): {db.db_type}/{db.db_name}/{table}')
-        src_sql_query = f'SELECT domain, name, tld, avail, expiry, updated FROM {table}'
-        call_id = f'{db.db_type} | {table} | SELECT'
-        src_db_dta_live = db.execute_single(src_sql_query, call_id)
+def backup_table(db, db_arch, db_backup, table, snapshots, chunk_size):
+    # Returns amount of rows backed up, raises when destination table was not replaced (it is untouched then)
+    src_sql_query = f'SELECT {COLUMN_LIST} FROM {table}'
+    staging = f'{table}{STAGING_SUFFIX}'
+    sql_clear = clear_query(db_backup.db_type, table)
+    if sql_clear is None:
+        raise RuntimeError(f'Incorrect backup database type: {db_backup.db_type}')
 
+    log.debug(f'Phase 1: Creating staging table: {db_backup.db_type}/{db_backup.db_name}/{staging}')
+    if not staging_create(db_backup, staging):
+        raise RuntimeError(f'{staging} not created')
+
+    try:
+        log.debug(f'Phase 2: Streaming source DB data (live): {db.db_type}/{db.db_name}/{table}')
+        call_id = f'{db_backup.db_type} | {staging} | INSERT'
+        # Stream is closed also when load stops early, so its connection is released in this thread
+        with contextlib.closing(db.stream(src_sql_query, f'{db.db_type} | {table} | SELECT', chunk_size, snapshots[0])) as chunks:
+            loaded = db_backup.bulk_load(staging, COLUMNS, clean_rows(chunks), call_id, chunk_size)
+        if loaded is None:
+            raise RuntimeError(f'{staging} not loaded completely (live)')
+
+        if db_arch is not None:
+            log.debug(f'Phase 3: Streaming source DB data (arch): {db_arch.db_type}/{db_arch.db_name}/{table}')
+            # Domain should never be in live and archive DB at once, skip it if it is
+            with contextlib.closing(db_arch.stream(src_sql_query, f'{db_arch.db_type} | {table} | SELECT', chunk_size,
+                                                   snapshots[1])) as chunks:
+                archived = db_backup.bulk_load(staging, COLUMNS, clean_rows(chunks), call_id, chunk_size, skip_existing=True)
+            if archived is None:
+                raise RuntimeError(f'{staging} not loaded completely (arch)')
+            loaded += archived
+    except Exception:
+        staging_drop(db_backup, staging)  # Destination table is untouched
+        raise
+
+    log.debug(f'Phase 4: Replacing backup table data: {db_backup.db_type}/{db_backup.db_name}/{table}')
+    indexes = db_backup.drop_indexes(table, f'{db_backup.db_type} | {table}')
+    try:
+        queries = [(sql_clear, None),
+                   (f'INSERT INTO {table} ({COLUMN_LIST}) SELECT {COLUMN_LIST} FROM {staging}', None),
+                   (f'DROP TABLE {staging}', None)]
+        res = db_backup.execute_transaction(queries, f'{db_backup.db_type} | {table} | REPLACE')
+    finally:
+        log.debug(f'Phase 5: Creating indexes: {db_backup.db_type}/{db_backup.db_name}/{table}')
+        db_backup.create_indexes(indexes, f'{db_backup.db_type} | {table}')
+    if res is None:
+        staging_drop(db_backup, staging)
+        raise RuntimeError(f'{table} not replaced with {staging}')
+    return loaded
+
+
+def backup_table_incremental(db, db_arch, db_backup, table, snapshots, chunk_size, since):
+    sources = [(db, snapshots[0]), (db_arch, snapshots[1])]
+
+    log.debug(f'Phase 1: Reading journals: {db.db_name} & {db_arch.db_name}/{table}')
+    journals = [journal_read(source, table, snapshot, chunk_size) for source, snapshot in sources]
+
+    log.debug(f'Phase 2: Removing deleted domains from backup: {db_backup.db_type}/{db_backup.db_name}/{table}')
+    deleted = set().union(*(item[0] for item in journals))
+    removed = 0
+    deleted = list(deleted)
+    for i in range(0, len(deleted), chunk_size):
+        keys = set(deleted[i:i + chunk_size])
+        # Domain moved between live and archive DB (or inserted again) is not deleted
+        for source, snapshot in sources:
+            keys -= source.existing_keys(table, 'domain', keys, f'{source.db_type} | {table} | SELECT deleted')
+        if keys:
+            db_backup.delete_keys(table, 'domain', keys, f'{db_backup.db_type} | {table} | DELETE')
+            removed += len(keys)
+
+    log.debug(f'Phase 3: Streaming changed rows: {db.db_name} & {db_arch.db_name}/{table}')
+    # UNION instead of OR - each part is read by its own index (updated / primary key), OR is a full table scan
+    src_sql_query = (f"SELECT {COLUMN_LIST} FROM {table} WHERE updated > '{since}' UNION "
+                     f"SELECT {COLUMN_LIST} FROM {table} WHERE domain IN (SELECT domain FROM {JOURNAL} WHERE tbl = '{table}' AND op = 'I')")
+    call_id = f'{db_backup.db_type} | {table} | UPSERT'
+    loaded = 0
+    for source, snapshot in sources:
+        with contextlib.closing(source.stream(src_sql_query, f'{source.db_type} | {table} | SELECT changed', chunk_size,
+                                              snapshot)) as chunks:
+            upserted = db_backup.bulk_load(table, COLUMNS, clean_rows(chunks), call_id, chunk_size, replace_existing=True)
+        if upserted is None:
+            # Watermark and journal are kept, next backup copies the same changes again
+            raise RuntimeError(f'{table} changed rows not loaded completely')
+        loaded += upserted
+
+    log.debug(f'Phase 4: Removing processed journal entries: {db.db_name} & {db_arch.db_name}/{table}')
+    for (source, snapshot), (deleted_domains, ranges) in zip(sources, journals):
+        journal_clear(source, table, ranges)
+    return loaded, removed
+
+
+def backup_data(db, db_arch, db_backup, tbl_names, tld, workers=1, chunk_size=BACKUP_CHUNK_SIZE, mode='full',
+                overlap=BACKUP_OVERLAP):
+    # If only source and backup provided then it is restore, otherwise it is backup
+    # mode: 'full' - all tables rewritten, 'incremental' - only changes since the previous backup of table
+    if db_arch is None:
+        log.info(f'Restore from {db.db_type}:{db.db_name} into {db_backup.db_type}:{db_backup.db_name}')
+        # Restored tables are rewritten as a whole - their journal is not needed and next backup has to be full one
+        for tbl_name in tbl_names:
+            journal_drop(db_backup, f'{tbl_name}_{tld}')
+        state_clear(db, tbl_names, tld)
+    else:
+        log.info(f'Backup ({mode}) from {db.db_type}:{db.db_name} & {db_arch.db_name} into {db_backup.db_type}:{db_backup.db_name}')
+        state_create(db_backup)
+
+    tables = {}  # table -> watermark of incremental backup, None for full backup
+    journaled = set()  # tables with journal in both source DBs - processed journal entries are removed
+    for tbl_name in tbl_names:
+        table = f'{tbl_name}_{tld}'
+        tables[table] = None
         if db_arch is None:
-            log.info(f'Arch DB not set. Restore mode. Skipping archive DB...')
-            src_db_dta = src_db_dta_live
-        else:
-            log.debug(f'Phase 2: Getting source DB data (arch): {db_arch.db_type}/{db_arch.db_name}/{table}')
-            src_sql_query = f'SELECT domain, name, tld, avail, expiry, updated FROM {table}'
-            call_id = f'{db_arch.db_type} | {table} | SELECT'
-            src_db_dta_arch = db_arch.execute_single(src_sql_query, call_id)
-            src_db_dta = src_db_dta_live + src_db_dta_arch
-
-        src_dta_count = len(src_db_dta)
-        log.info(f'Items to be migrated: {src_dta_count}')
-
-        log.debug(f'Phase 3: Cleaning backup table: {db_backup.db_type}/{db_backup.db_name}/{table}')
-
-        if db_backup.db_type == 'sqlite':
-            call_id = f'{db_backup.db_type} | {table} | DELETE FROM'
-            dst_sql_query = f'DELETE FROM {table}'
-            db_backup.execute_single(dst_sql_query, call_id)
-            call_id = f'{db_backup.db_type} | {table} | VACUUM'
-            dst_sql_query = f'VACUUM'
-            db_backup.execute_single(dst_sql_query, call_id)
-        elif db_backup.db_type == 'postgresql':
-            call_id = f'{db_backup.db_type} | {table} | TRUNCATE'
-            dst_sql_query = f'TRUNCATE {table}'
-            db_backup.execute_single(dst_sql_query, call_id)
-        else:
-            log.error(f'Error: Incorrect backup database type')
-            return
-
-        # Below is to validate or manipulate source data before update to destination - e.g. replace "" with None
-        log.debug(f'Phase 4: Preparing {tbl_name} data...')
-        dst_dta = []
-        to_process_len = src_dta_count
-        counter = 0
-        for src_item in src_db_dta:
-            counter = counter + 1
-            print(f'{counter} of {to_process_len}', end="\r", flush=True)
-            dst_item = []
-            for index in range(len(src_item)):
-                #  Make None if empty
-                if src_item[index] == "":
-                    dst_item.append(None)
-                elif src_item[index] is str:
-                    # If object is string remove any leading and trailing whitespaces by using strip()
-                    stripped = src_item[index].strip()
-                    #  Make None if empty
-                    if stripped == "":
-                        dst_item.append(None)
-                    else:
-                        dst_item.append(stripped)
-                else:
-                    dst_item.append(src_item[index])
-            dst_dta.append(dst_item)
-
-        log.debug(f'Phase 5: Data preparation finished. Executing insert into "{table}"')
-        # Execute insert
-        call_id = f'{db_backup.db_type} | {table} | INSERT'
-        if db_backup.db_type == 'sqlite':
-            param_query = f'INSERT INTO {table}(domain, name, tld, avail, expiry, updated) VALUES(?,?,?,?,?,?)'
-            db_backup.execute_many_param(param_query, dst_dta, call_id)
-        elif db_backup.db_type == 'postgresql':
-            param_query = f'INSERT INTO {table}(domain, name, tld, avail, expiry, updated) VALUES(%s,%s,%s,%s,%s,%s)'
-            db_backup.execute_many_param(param_query, dst_dta, call_id)
-        else:
-            log.error(f'Error: Incorrect backup database type')
-            return
-
-        log.info(f'Backup of {table} finished successfully')
-
-
-def archiver(db, db_arch, tbl_names, tld, arch_type):
+            continue
+        existing = [journal_exists(db, table), journal_exists(db_arch, table)]
+        if mode != 'incremental' and not any(existing):
+            continue  # Incremental backup not used, source tables are not journaled
+        # Journal has to exist before snapshot is taken, so no change after snapshot is missed
+        if not (journal_create(db, table) and journal_create(db_arch, table)):
+            log.error(f'Journal of {table} not created, backup of {table} skipped')
+            del tables[table]
+            continue
+        journaled.add(table)
+        if not all(existing):
+            if mode == 'incremental':
+                log.info(f'Journal of {table} created, full backup of {table} will be done')
+            continue  # Changes before journal was created are not logged
+        watermark = state_read(db_backup, table) if mode == 'incremental' else None
+        if watermark is not None:
+            since = datetime.datetime.strptime(watermark, "%Y-%m-%d %H:%M:%S") - datetime.timedelta(seconds=overlap)
+            tables[table] = since.strftime("%Y-%m-%d %H:%M:%S")
+        elif mode == 'incremental':
+            log.info(f'No previous backup of {table}, full backup of {table} will be done')
+
+    with contextlib.ExitStack() as stack:
+        started = now_utc()
+        snapshots = [stack.enter_context(db.exported_snapshot(f'{db.db_type} | {db.db_name}')), None]
+        if db_arch is not None:
+            snapshots[1] = stack.enter_context(db_arch.exported_snapshot(f'{db_arch.db_type} | {db_arch.db_name}'))
+
+        def run_table(table, since):
+            if since is not None:
+                loaded, removed = backup_table_incremental(db, db_arch, db_backup, table, snapshots, chunk_size, since)
+                state_write(db_backup, table, started, 'incremental')
+                return f'Rows upserted {loaded} | Rows deleted {removed}'
+            if table in journaled:
+                # Everything journaled so far is included in full copy
+                journals = [journal_read(source, table, snapshot, chunk_size) for source, snapshot in zip((db, db_arch), snapshots)]
+            loaded = backup_table(db, db_arch, db_backup, table, snapshots, chunk_size)
+            if table in journaled:
+                for source, (deleted_domains, ranges) in zip((db, db_arch), journals):
+                    journal_clear(source, table, ranges)
+            if db_arch is not None:
+                state_write(db_backup, table, started, 'full')
+            return f'Rows {loaded}'
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(run_table, table, since): table for table, since in tables.items()}
+            for future in concurrent.futures.as_completed(futures):
+                table = futures[future]
+                try:
+                    result = future.result()
+                except Exception as ex:
+                    log.error(f'Backup of {table} failed: {ex!r}')
+                    continue
+                log.info(f'Backup of {table} finished successfully | {result}')
+
+
+# Archive / restore moves rows between live and _taken DB:
+#  - both SQLite: source connection with destination database attached (ATTACH DATABASE), INSERT OR IGNORE ... SELECT
+#    into destination committed first, then DELETE of source rows present in destination,
+#  - both PostgreSQL on the same server and archive_fdw = yes: single statement in source DB with destination table as
+#    postgres_fdw foreign table - DELETE ... RETURNING feeds INSERT ... ON CONFLICT DO NOTHING,
+#  - other combinations (or postgres_fdw not enabled / available): streamed batches - keyset pages of source rows are bulk
+#    inserted into destination (existing skipped) and deleted from source only when present in destination.
+# Rows already existing in destination are removed from source in all cases (destination has current data).
+MOVE_PAGE_SIZE = 10000  # Rows per streamed batch
+
+
+def move_condition(arch_type, exp_date):
+    if arch_type == 'archive':
+        return f"avail = 'N' AND expiry > '{exp_date}'"
+    elif arch_type == 'restore':
+        return f"avail = 'N' AND expiry <= '{exp_date}'"
+    return None
+
+
+def move_attached(src_db, dst_db, table, condition):
+    # SQLite - returns (moved, inserted) or None on error
+    # Commit over attached WAL databases is not atomic across files, so insert is committed first and only rows
+    # present in destination are deleted in second transaction - crash in between leaves rows in both DBs, never in none.
+    call_id = f'{src_db.db_name} -> {dst_db.db_name} | {table} | MOVE'
+    queries = [(f'INSERT OR IGNORE INTO dst.{table} ({COLUMN_LIST}) SELECT {COLUMN_LIST} FROM main.{table} WHERE {condition}', None)]
+    inserted = src_db.execute_transaction(queries, f'{call_id} INSERT', attach={'dst': dst_db})
+    if inserted is None:
+        return None
+    queries = [(f'DELETE FROM main.{table} WHERE {condition} AND domain IN (SELECT domain FROM dst.{table})', None)]
+    moved = src_db.execute_transaction(queries, f'{call_id} DELETE', attach={'dst': dst_db})
+    if moved is None:
+        return None
+    return moved[0], inserted[0]
+
+
+def move_foreign(src_db, dst_db, table, condition):
+    # PostgreSQL - returns (moved, inserted) or None if destination can not be used as foreign table or on error
+    call_id = f'{src_db.db_name} -> {dst_db.db_name} | {table} | MOVE'
+    foreign = src_db.foreign_table(dst_db, table, call_id)
+    if foreign is None:
+        return None
+    query = (f'WITH moved AS (DELETE FROM {table} WHERE {condition} RETURNING {COLUMN_LIST}), '
+             f'inserted AS (INSERT INTO {foreign} ({COLUMN_LIST}) SELECT {COLUMN_LIST} FROM moved ON CONFLICT DO NOTHING RETURNING 1) '
+             f'SELECT (SELECT count(*) FROM moved), (SELECT count(*) FROM inserted)')
+    res = src_db.execute_transaction([(query, None)], call_id)
+    if res is None:
+        return None
+    return res[0][0][0], res[0][0][1]
+
+
+def move_streamed(src_db, dst_db, table, condition):
+    # Any DB types - returns (moved, inserted)
+    if src_db.db_type == 'sqlite':
+        mark = '?'
+    elif src_db.db_type == 'postgresql':
+        mark = '%s'
+    else:
+        log.error(f'Error: Incorrect database type')
+        return 0, 0
+    sql_select_param = (f'SELECT {COLUMN_LIST} FROM {table} WHERE {condition} AND domain > {mark} '
+                        f'ORDER BY domain LIMIT {mark}')
+    last = ''
+    moved = 0
+    inserted = 0
+    while True:
+        page = src_db.execute_single_param(sql_select_param, (last, MOVE_PAGE_SIZE), f'{table} | SELECT page after "{last}"')
+        if not page:
+            break
+        last = page[-1][0]
+        domains = [row[0] for row in page]
+        loaded = dst_db.bulk_load(table, COLUMNS, page, f'{dst_db.db_type} | {table} | INSERT', skip_existing=True)
+        if loaded is None:
+            log.error(f'{table} | Insert into destination failed, move stopped - remaining rows kept in source')
+            break
+        inserted += loaded
+        # Only rows safely stored in destination are removed from source
+        stored = dst_db.existing_keys(table, 'domain', domains, f'{dst_db.db_type} | {table} | SELECT moved')
+        if len(stored) < len(domains):
+            log.error(f'{table} | {len(domains) - len(stored)} rows not stored in destination, kept in source')
+        if stored:
+            src_db.delete_keys(table, 'domain', stored, f'{src_db.db_type}/{src_db.db_name}/{table} | DELETE')
+        moved += len(stored)
+        print(f'{moved} moved', end="\r", flush=True)
+    return moved, inserted
+
+
+def archiver(db, db_arch, tbl_names, tld, arch_type, use_fdw=False):
+    # use_fdw - PostgreSQL DBs on the same server are moved via postgres_fdw foreign table (archive_fdw config)
 
     exp_date = datetime.datetime.now() + datetime.timedelta(days=30)
     exp_date = datetime.datetime(exp_date.year, exp_date.month, exp_date.day, 0, 0, 0)
@@ -110,6 +475,7 @@ def archiver(db, db_arch, tbl_names, tld, arch_type):
     else:
         log.error(f'Incorrect archiver type: {arch_type}')
         return
+    condition = move_condition(arch_type, exp_date)
 
     for tbl_name in tbl_names:
         table = f'{tbl_name}_{tld}'
@@ -118,68 +484,28 @@ def archiver(db, db_arch, tbl_names, tld, arch_type):
         count_sql_query = f"SELECT count(*) FROM {table}"
         call_id = f'{src_db.db_type} | {table} | SELECT'
         count_result = src_db.execute_single(count_sql_query, call_id)
-
-        log.debug(f'Archiver step 2: Getting domains data to be archived/restored: {src_db.db_type}/{src_db.db_name}/{table}')
-        call_id = f'{src_db.db_type} | {table} | SELECT'
-        if arch_type == 'archive':
-            select_sql_query = f"SELECT domain, name, tld, avail, expiry, updated FROM {table} WHERE avail = 'N' AND expiry > '{exp_date}'"
-        elif arch_type == 'restore':
-            select_sql_query = f"SELECT domain, name, tld, avail, expiry, updated FROM {table} WHERE avail = 'N' AND expiry <= '{exp_date}'"
-        else:
-            log.error(f'Incorrect archiver type: {arch_type}')
-            return
-        src_db_dta = src_db.execute_single(select_sql_query, call_id)
-
-        # Prepare and show some stats
-        src_dta_count = len(src_db_dta)
-        domains_amount = int(count_result[0][0])
+        domains_amount = int(count_result[0][0]) if count_result else 0
         if domains_amount == 0:
             log.error(f'No data in source table: {src_db.db_type}/{src_db.db_name}/{table}')
             continue
 
+        log.debug(f'Archiver step 2: Moving domains: {src_db.db_name}/{table} -> {dst_db.db_name}/{table}')
+        res = None
+        if src_db.db_type == dst_db.db_type == 'sqlite':
+            res = move_attached(src_db, dst_db, table, condition)
+        elif (use_fdw and src_db.db_type == dst_db.db_type == 'postgresql'
+              and (src_db.db_host, src_db.db_port) == (dst_db.db_host, dst_db.db_port)):
+            res = move_foreign(src_db, dst_db, table, condition)
+            if res is None:
+                log.warning(f'{table} | Set based move not possible (postgres_fdw), moving in streamed batches')
+        if res is None:
+            res = move_streamed(src_db, dst_db, table, condition)
+        moved, inserted = res
+
         # Percent value:
-        percent = (src_dta_count / domains_amount) * 100
+        percent = (moved / domains_amount) * 100
         # Percent formatted value:
         percent = "{0:.2f}".format(percent)
-        log.info(f'{table} | {arch_type} | {percent} % | {src_dta_count} of {domains_amount}')
-
-        log.debug(f'Archiver step 3: Validating insert data and skipping duplicates')
-        call_id = f'{src_db.db_type} | {table} | SELECT'
-        select_sql_query = f"SELECT domain FROM {table}"
-        res = dst_db.execute_single(select_sql_query, call_id)
-        src_dta = []
-        dst_db_dta = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-        for src_itm in src_db_dta:
-            if src_itm[0] in dst_db_dta:
-                log.error(f'Domain already exist in destination table: {src_itm[0]}. Will be removed from source table.')
-            else:
-                src_dta.append(src_itm)
-
-        log.debug(f'Archiver step 4: Executing data insert into {dst_db.db_type}/{dst_db.db_name}/{table}')
-        call_id = f'{dst_db.db_type} | {table} | INSERT'
-        if dst_db.db_type == 'sqlite':
-            param_query = f'INSERT INTO {table}(domain, name, tld, avail, expiry, updated) VALUES(?,?,?,?,?,?)'
-            dst_db.execute_many_param(param_query, src_dta, call_id)
-        elif dst_db.db_type == 'postgresql':
-            param_query = f'INSERT INTO {table}(domain, name, tld, avail, expiry, updated) VALUES(%s,%s,%s,%s,%s,%s)'
-            dst_db.execute_many_param(param_query, src_dta, call_id)
-        else:
-            log.error(f'Error: Incorrect database type')
-            return
-
-        log.debug(f'Archiver step 5: Preparing data to delete from {src_db.db_type}/{src_db.db_name}/{table}')
-        src_dta_del = []
-        for item in src_db_dta:
-            src_dta_del.append([item[0]])
-
-        log.debug(f'Archiver step 6: Delete {len(src_dta_del)} domains from {src_db.db_type}/{src_db.db_name}/{table}')
-        call_id = f'{src_db.db_type}/{src_db.db_name}/{table} | DELETE'
-        if src_db.db_type == 'sqlite':
-            param_query = f'DELETE FROM {table} WHERE domain=?'
-            src_db.execute_many_param(param_query, src_dta_del, call_id)
-        elif src_db.db_type == 'postgresql':
-            param_query = f'DELETE FROM {table} WHERE domain=%s'
-            src_db.execute_many_param(param_query, src_dta_del, call_id)
-        else:
-            log.error(f'Error: Incorrect database type')
-            return
+        log.info(f'{table} | {arch_type} | {percent} % | {moved} of {domains_amount}')
+        if moved > inserted:
+            log.error(f'{table} | {moved - inserted} domains already existed in destination table, removed from source table')
@@ -0,0 +1,47 @@
+# Package: common
+# Module: dates
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Dates as days since 1970-01-01 (0 = NULL), used by dense status store arrays and check queue due times.
+# Standard library only, so check modes do not need NumPy.
+
+import datetime
+import logging
+
+log = logging.getLogger('main')
+
+EPOCH = datetime.date(1970, 1, 1)
+DATE_FORMATS = ('%d-%b-%Y', '%Y.%m.%d', '%d.%m.%Y', '%Y/%m/%d')  # Non ISO formats seen in WHOIS expiry dates
+
+
+def to_day(value):
+    # datetime / date / date string -> days since 1970-01-01, 0 for NULL or unknown format
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return 0
+        try:
+            value = datetime.datetime.fromisoformat(text)
+        except ValueError:
+            for date_format in DATE_FORMATS:
+                try:
+                    value = datetime.datetime.strptime(text.split()[0], date_format)
+                    break
+                except ValueError:
+                    continue
+            else:
+                log.debug(f'Unknown date format: {text}')
+                return 0
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return max(0, (value - EPOCH).days)
+
+
+def from_day(day):
+    # Days since 1970-01-01 -> datetime, None for 0
+    if not day:
+        return None
+    return datetime.datetime.combine(EPOCH + datetime.timedelta(days=int(day)), datetime.time())
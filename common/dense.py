@@ -0,0 +1,166 @@
+# Package: common
+# Module: dense
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Dense status store for generated tables (pattern keyspaces, see common/name_gen), alternative to DB table rows.
+# Instead of row with domain, name and tld strings per name, status is kept in three memory mapped arrays (NumPy
+# .npy files) indexed by name rank within pattern keyspace:
+#   <table>.status.npy  - uint8: 0 never checked, 1 available ('Y'), 2 taken ('N')
+#   <table>.expiry.npy  - uint32: expiry date as days since 1970-01-01, 0 = NULL
+#   <table>.updated.npy - uint32: last check date as days since 1970-01-01, 0 = NULL
+# 9 bytes per name, new store (all names never checked) is created as sparse files instantly, no generation needed.
+# <table>.json keeps pattern signature, so store is never read with different pattern (ranks would not match).
+# select() / pages() select names to be checked with the same rules as check queue of DB tables (core/check_queue,
+# with day precision), update() takes the same (avail, expiry, updated, domain) rows as result_writer.update().
+
+import datetime
+import json
+import os
+import logging
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from common import dates
+
+log = logging.getLogger('main')
+
+NEW = 0
+AVAILABLE = 1
+TAKEN = 2
+STATUS = {None: NEW, 'Y': AVAILABLE, 'N': TAKEN}
+
+SCAN_CHUNK = 1 << 22  # Names scanned per vectorized select step
+
+
+def signature(pattern):
+    # Per block per position chars - changes whenever pattern keyspace (rank of any name) changes
+    return '|'.join(','.join(item.tobytes().decode('ascii') for item in codes) for offset, codes, radices in pattern.blocks)
+
+
+class Store:
+    def __init__(self, location, table, pattern, tld):
+        self.table = table
+        self.pattern = pattern
+        self.tld = tld
+        base = os.path.join(location, table)
+        meta = {'pattern': pattern.name, 'size': pattern.size, 'signature': signature(pattern)}
+        exists = os.path.exists(f'{base}.json')
+        if exists:
+            with open(f'{base}.json') as file:
+                stored = json.load(file)
+            if stored != meta:
+                raise ValueError(f'Store does not match pattern {pattern.name} (created with {stored["pattern"]}, {stored["size"]} names)')
+        else:
+            os.makedirs(location, exist_ok=True)
+        mode = 'r+' if exists else 'w+'
+        self.status = open_memmap(f'{base}.status.npy', mode, dtype=numpy.uint8, shape=(pattern.size,))
+        self.expiry = open_memmap(f'{base}.expiry.npy', mode, dtype=numpy.uint32, shape=(pattern.size,))
+        self.updated = open_memmap(f'{base}.updated.npy', mode, dtype=numpy.uint32, shape=(pattern.size,))
+        if not exists:
+            with open(f'{base}.json', 'w') as file:
+                json.dump(meta, file)
+        log.info(f'{table} | Dense store {"opened" if exists else "created"} | Names {pattern.size} | '
+                 f'Size {pattern.size * 9} bytes')
+
+    def mask(self, check_type, exp_day, updated_day, start, stop):
+        # Names to be checked within ranks [start, stop), the same rules as check queue of DB tables (core/check_queue)
+        status = self.status[start:stop]
+        expiry = self.expiry[start:stop]
+        updated = self.updated[start:stop]
+        outdated = (updated != 0) & (updated < updated_day)
+        if check_type == 'expiring':
+            # Never checked OR expiring and not checked recently OR taken without known expiry and not checked recently
+            return (status == NEW) | (outdated & (((expiry != 0) & (expiry < exp_day)) | ((status == TAKEN) & (expiry == 0))))
+        # This covers check_type == 'recheck'
+        return outdated & (status == AVAILABLE)
+
+    def pages(self, check_type, exp_date, updated_date, page_size=1000):
+        # Yields ascending arrays of ranks of names to be checked, at most page_size each
+        exp_day = dates.to_day(exp_date)
+        updated_day = dates.to_day(updated_date)
+        for start in range(0, self.pattern.size, SCAN_CHUNK):
+            ranks = numpy.flatnonzero(self.mask(check_type, exp_day, updated_day, start, start + SCAN_CHUNK)) + start
+            for i in range(0, len(ranks), page_size):
+                yield ranks[i:i + page_size]
+
+    def select(self, check_type, exp_date, updated_date):
+        # All ranks of names to be checked
+        pages = list(self.pages(check_type, exp_date, updated_date, SCAN_CHUNK))
+        return numpy.concatenate(pages) if pages else numpy.empty(0, dtype=numpy.int64)
+
+    def rows(self, ranks):
+        # Ranks -> (name, tld, domain, expiry) rows, the same as check_queue.claim() result
+        expiry = [dates.from_day(day) for day in self.expiry[ranks].tolist()]
+        return [(name, self.tld, f'{name}.{self.tld}', expiry[i]) for i, name in enumerate(self.pattern.unranks(ranks).tolist())]
+
+    def ranks_of(self, domains):
+        names = [item.partition('.')[0] for item in domains]
+        ranks = self.pattern.ranks(names)
+        if (ranks < 0).any():
+            log.error(f'{self.table} | Names out of dense store pattern skipped: {numpy.asarray(names)[ranks < 0].tolist()[:10]}')
+        return ranks
+
+    def update(self, rows):
+        # rows: (avail, expiry, updated, domain) tuples - the same params as domain.update_query()
+        ranks = self.ranks_of([row[3] for row in rows])
+        valid = ranks >= 0
+        ranks = ranks[valid]
+        self.status[ranks] = numpy.array([STATUS.get(row[0], NEW) for row in rows], dtype=numpy.uint8)[valid]
+        self.expiry[ranks] = numpy.array([dates.to_day(row[1]) for row in rows], dtype=numpy.uint32)[valid]
+        self.updated[ranks] = numpy.array([dates.to_day(row[2]) for row in rows], dtype=numpy.uint32)[valid]
+        return len(ranks)
+
+    def mark_delegated(self, delegated):
+        # DNS pre-filter result: (name, tld) items without known expiry marked taken (see domain.dns_mark_delegated())
+        if not delegated:
+            return
+        ranks = self.ranks_of([item[0] for item in delegated])
+        ranks = ranks[ranks >= 0]
+        self.status[ranks] = TAKEN
+        self.updated[ranks] = dates.to_day(datetime.datetime.now(datetime.UTC))
+
+    def import_table(self, db, page_size=100000):
+        # Copies current state of DB table with the same name into store (keyset pagination over primary key)
+        if db.db_type == 'sqlite':
+            mark = '?'
+        elif db.db_type == 'postgresql':
+            mark = '%s'
+        else:
+            log.error(f'Error: Incorrect database type')
+            return 0
+        sql_select_param = (f'SELECT avail, expiry, updated, domain FROM {self.table} '
+                            f'WHERE domain > {mark} ORDER BY domain LIMIT {mark}')
+        last = ''
+        imported = 0
+        while True:
+            page = db.execute_single_param(sql_select_param, (last, page_size), f'{self.table} | SELECT page after "{last}"')
+            if not page:
+                break
+            last = page[-1][3]
+            imported += self.update(page)
+            print(f'{imported} imported', end="\r", flush=True)
+        self.flush()
+        log.info(f'{self.table} | {imported} rows imported into dense store')
+        return imported
+
+    def flush(self):
+        for array in (self.status, self.expiry, self.updated):
+            array.flush()
+
+
+def open_stores(location, tbl_names, tld, patterns):
+    # {table: Store} for tables with known pattern, tables with missing or mismatching pattern are skipped
+    stores = {}
+    for tbl_name in tbl_names:
+        pattern = patterns.get(tbl_name)
+        if pattern is None:
+            log.error(f'No names pattern defined for dense table {tbl_name}. Skipping...')
+            continue
+        table = f'{tbl_name}_{tld}'
+        try:
+            stores[table] = Store(location, table, pattern, tld)
+        except (ValueError, OSError) as err:
+            log.error(f'{table} | Dense store not opened: {err}')
+    return stores
@@ -0,0 +1,231 @@
+# Package: common
+# Module: name_gen
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Pattern driven names generator.
+# Pattern defines allowed characters for each position of the name (as character classes) and classes that have to
+# appear in the name at least once (require). Classes:
+#   d - digits, l - letters, c - consonants, v - vowels, '-' - hyphen
+# Position can allow more classes at once, e.g. 'dl-' (digit, letter or hyphen).
+# Pattern is defined in config.cfg section [PATTERN.<table name>] either per position:
+#   positions = c, v, c, v
+# or by length, allowed classes and classes allowed on first/last position (edges, default the same as chars):
+#   length = 4
+#   chars = dl-
+#   edges = dl
+#   require = -
+# Built-in patterns (DEFAULT_PATTERNS) cover standard digit / letter / digit_letter / special tables.
+#
+# Valid names are enumerated directly - requirements are resolved upfront into disjoint blocks, each of them plain
+# Cartesian product of per position character sets (split by position of the first occurrence of required class).
+# Names of block are produced in NumPy batches by mixed radix decomposition of index range, nothing is generated
+# and then filtered out.
+#
+# Index of the name in pattern keyspace (rank) is block offset + mixed radix number of char positions within
+# per position sorted char sets. rank() / unrank() map name to index and back in O(length), ranks() / unranks() do
+# the same for NumPy arrays. Any index range (shard, see shards()) can be generated independently of the rest,
+# e.g. in separate process or on separate machine.
+
+import itertools
+import bisect
+import logging
+
+import numpy
+
+log = logging.getLogger('main')
+
+CLASSES = {
+    'd': '0123456789',
+    'l': 'abcdefghijklmnopqrstuvwxyz',
+    'c': 'bcdfghjklmnpqrstvwxyz',
+    'v': 'aeiou',
+    '-': '-',
+}
+
+BATCH_SIZE = 100000  # Names per generated NumPy batch
+
+DEFAULT_PATTERNS = {}
+for length, prefix in ((2, 'two'), (3, 'three'), (4, 'four'), (5, 'five')):
+    DEFAULT_PATTERNS[f'{prefix}_digit'] = {'length': str(length), 'chars': 'd'}
+    DEFAULT_PATTERNS[f'{prefix}_letter'] = {'length': str(length), 'chars': 'l'}
+    DEFAULT_PATTERNS[f'{prefix}_digit_letter'] = {'length': str(length), 'chars': 'dl', 'require': 'd, l'}
+    if length > 2:  # two_special is always empty - '-' is not allowed as first or last char
+        DEFAULT_PATTERNS[f'{prefix}_special'] = {'length': str(length), 'chars': 'dl-', 'edges': 'dl', 'require': '-'}
+
+
+def chars_of(spec):
+    # 'dl-' -> set of all chars of given classes
+    chars = set()
+    for item in spec.replace(" ", ""):
+        if item not in CLASSES:
+            raise ValueError(f'Unknown character class: {item}')
+        chars.update(CLASSES[item])
+    return frozenset(chars)
+
+
+def split_blocks(sets, requirements):
+    # Returns list of disjoint blocks (lists of per position char sets) covering exactly names that contain at least
+    # one char of each requirement
+    if not requirements:
+        return [sets]
+    required, rest = requirements[0], requirements[1:]
+    if any(chars <= required for chars in sets):
+        return split_blocks(sets, rest)  # Every name of block already contains required class
+    blocks = []
+    for first in range(len(sets)):
+        hit = sets[first] & required
+        if not hit:
+            continue
+        # Required class first appears at position 'first': not in any position before it, anything after it
+        block = [chars - required for chars in sets[:first]] + [hit] + sets[first + 1:]
+        if all(block):
+            blocks.extend(split_blocks(block, rest))
+    return blocks
+
+
+class Pattern:
+    def __init__(self, name, positions, require=()):
+        self.name = name
+        self.length = len(positions)
+        self.blocks = []  # (offset, per position sorted chars as uint8 codes, radices)
+        self.offsets = []  # Block offsets, for bisect in unrank()
+        self.lookups = []  # Per block: per position char -> digit dicts and 256 items digit arrays (-1 not allowed)
+        self.size = 0  # Amount of names in pattern keyspace
+        sets = [chars_of(spec) for spec in positions]
+        for block in split_blocks(sets, [chars_of(spec) for spec in require]):
+            codes = [numpy.frombuffer(''.join(sorted(chars)).encode('ascii'), dtype=numpy.uint8) for chars in block]
+            radices = [len(item) for item in codes]
+            digits = [{chr(code): digit for digit, code in enumerate(item)} for item in codes]
+            tables = []
+            for item in codes:
+                table = numpy.full(256, -1, dtype=numpy.int64)
+                table[item] = numpy.arange(len(item))
+                tables.append(table)
+            self.blocks.append((self.size, codes, radices))
+            self.offsets.append(self.size)
+            self.lookups.append((digits, tables))
+            self.size += int(numpy.prod(radices, dtype=object))
+        log.debug(f'Pattern {name} | Length {self.length} | Blocks {len(self.blocks)} | Names {self.size}')
+
+    @classmethod
+    def from_spec(cls, name, spec):
+        if spec.get('positions'):
+            positions = spec['positions'].replace(" ", "").split(",")
+        else:
+            length = int(spec['length'])
+            chars = spec.get('chars', 'dl')
+            edges = spec.get('edges') or chars
+            positions = [edges] + [chars] * (length - 2) + [edges] if length > 1 else [edges]
+        require = [item for item in spec.get('require', '').replace(" ", "").split(",") if item]
+        return cls(name, positions, require)
+
+    def block_names(self, codes, radices, index):
+        # Names of single block for NumPy array of block indexes as NumPy unicode array
+        out = numpy.empty((len(index), self.length), dtype=numpy.uint8)
+        for position in range(self.length - 1, -1, -1):
+            index, digit = numpy.divmod(index, radices[position])
+            out[:, position] = codes[position][digit]
+        return out.view(f'S{self.length}').ravel().astype(f'U{self.length}')
+
+    def block_batch(self, codes, radices, start, stop):
+        # Names of single block for block indexes [start, stop) as NumPy unicode array
+        return self.block_names(codes, radices, numpy.arange(start, stop, dtype=numpy.int64))
+
+    def batches(self, start=0, stop=None, batch_size=BATCH_SIZE):
+        # Yields NumPy arrays of names with pattern index (rank) in [start, stop)
+        stop = self.size if stop is None else min(stop, self.size)
+        if self.size >= 2 ** 63:
+            raise ValueError(f'Pattern {self.name} keyspace too big: {self.size}')
+        for offset, codes, radices in self.blocks:
+            block_size = int(numpy.prod(radices, dtype=object))
+            lo = max(start, offset) - offset
+            hi = min(stop, offset + block_size) - offset
+            for batch_start in range(lo, hi, batch_size):
+                yield self.block_batch(codes, radices, batch_start, min(batch_start + batch_size, hi))
+
+    def names(self, start=0, stop=None):
+        # Lazy names (str) iterator, e.g. for DB bulk_load rows
+        return itertools.chain.from_iterable(batch.tolist() for batch in self.batches(start, stop))
+
+    def rank(self, name):
+        # Name -> index in pattern keyspace, None if name does not match pattern
+        if len(name) != self.length:
+            return None
+        for (offset, codes, radices), (digits, tables) in zip(self.blocks, self.lookups):
+            index = 0
+            for position, char in enumerate(name):
+                digit = digits[position].get(char)
+                if digit is None:
+                    break
+                index = index * radices[position] + digit
+            else:
+                return offset + index  # Blocks are disjoint, so the first matching block is the only one
+        return None
+
+    def unrank(self, index):
+        # Index in pattern keyspace -> name
+        if not 0 <= index < self.size:
+            raise IndexError(f'Pattern {self.name} index out of range: {index}')
+        block = bisect.bisect_right(self.offsets, index) - 1
+        offset, codes, radices = self.blocks[block]
+        index -= offset
+        chars = []
+        for position in range(self.length - 1, -1, -1):
+            index, digit = divmod(index, radices[position])
+            chars.append(chr(codes[position][digit]))
+        return ''.join(reversed(chars))
+
+    def unranks(self, indexes):
+        # Vectorized unrank() for array of indexes (any order) -> NumPy unicode array of names
+        indexes = numpy.asarray(indexes, dtype=numpy.int64)
+        result = numpy.empty(len(indexes), dtype=f'U{self.length}')
+        if len(indexes) and (indexes.min() < 0 or indexes.max() >= self.size):
+            raise IndexError(f'Pattern {self.name} index out of range')
+        blocks = numpy.searchsorted(numpy.asarray(self.offsets, dtype=numpy.int64), indexes, side='right') - 1
+        for block in numpy.unique(blocks):
+            offset, codes, radices = self.blocks[block]
+            selected = blocks == block
+            result[selected] = self.block_names(codes, radices, indexes[selected] - offset)
+        return result
+
+    def ranks(self, names):
+        # Vectorized rank() for array / list of names, -1 for names not matching pattern
+        names = numpy.asarray(names, dtype=f'U{self.length}')
+        result = numpy.full(len(names), -1, dtype=numpy.int64)
+        if not len(names):
+            return result
+        lengths = numpy.char.str_len(names)
+        # Non ASCII chars are mapped to 0 which is never allowed char
+        matrix = numpy.char.encode(names, 'ascii', 'replace').astype(f'S{self.length}').view(numpy.uint8).reshape(len(names), self.length)
+        for (offset, codes, radices), (digits, tables) in zip(self.blocks, self.lookups):
+            index = numpy.zeros(len(names), dtype=numpy.int64)
+            valid = lengths == self.length
+            for position in range(self.length):
+                digit = tables[position][matrix[:, position]]
+                valid &= digit >= 0
+                index = index * radices[position] + digit
+            result[valid] = offset + index[valid]
+        return result
+
+    def shards(self, count):
+        # Split keyspace into 'count' index ranges [start, stop) of (almost) equal size
+        count = max(1, min(count, self.size))
+        bounds = [self.size * item // count for item in range(count + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+
+def load_patterns(config_dta=None):
+    # Built-in patterns extended / overridden by [PATTERN.<table name>] config sections
+    specs = dict(DEFAULT_PATTERNS)
+    if config_dta is not None:
+        for section in config_dta.sections():
+            if section.startswith('PATTERN.'):
+                specs[section[8:]] = config_dta[section]
+    patterns = {}
+    for name, spec in specs.items():
+        try:
+            patterns[name] = Pattern.from_spec(name, spec)
+        except (KeyError, ValueError) as err:
+            log.error(f'Incorrect pattern definition {name}: {err!r}')
+    return patterns
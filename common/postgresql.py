@@ -1,7 +1,7 @@
 # Package: common
 # Module: postgresql
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-01-23
+# Rev: 2026-10-18
 
 # TO DO con.autocommit = True - to check efficiency as in sqlite it almost kills processing
 # Probably should be .autocommit = False
@@ -33,15 +33,57 @@
 #
 # *** to close the cursor automatically when the block is exited.
 
+# Connection pooling (pool_max_size > 0 in [DB.postgres] config section):
+# All execute_* methods get connection from psycopg_pool.ConnectionPool instead of psycopg.connect() per statement,
+# so connect and authentication handshakes are done once per pooled connection, not once per query / batch.
+# Pool with the same connection (pool) parameters is shared by all DB objects of the process. Pools are kept per
+# process id, so forked or spawned multi_proc workers never use connections opened by parent process.
+# Pooled connection is checked before use (broken ones are replaced) and connection broken during execution is
+# discarded by pool, execute_* retry logic then gets new one.
+# Pool connection context works the same as psycopg.connect() context - commit on success, rollback on exception.
+
 import psycopg
+import psycopg.sql
+import contextlib
+import itertools
+import threading
+import atexit
 import time
+import os
 import logging
 
+try:
+    import psycopg_pool
+except ImportError:
+    psycopg_pool = None
+
 log = logging.getLogger('main')
 
+pools = {}  # (pid, conninfo, min size, max size) -> ConnectionPool
+pools_lock = threading.Lock()
+
+
+def close_pools():
+    # Close pools opened by current process only (pools inherited via fork belong to parent process)
+    pid = os.getpid()
+    with pools_lock:
+        for key in [key for key in pools if key[0] == pid]:
+            pools.pop(key).close()
+
+
+atexit.register(close_pools)
+
+
+def chunks(rows, chunk_size):
+    # Split any iterable (list, generator) into lists of max chunk_size items without materializing all of it
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        yield chunk
+
 
 class DB:
-    def __init__(self, db_type, db_name, db_host, db_port, db_user, db_password, db_retry, db_retry_sleep_time):
+    def __init__(self, db_type, db_name, db_host, db_port, db_user, db_password, db_retry, db_retry_sleep_time,
+                 pool_min_size=0, pool_max_size=0):
         self.db_type = db_type
         self.db_name = db_name
         self.db_host = db_host
@@ -50,6 +92,39 @@ class DB:
         self.db_password = db_password
         self.db_retry = db_retry
         self.db_retry_sleep_time = db_retry_sleep_time
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size  # 0 - pooling disabled, new connection per statement
+
+    def get_pool(self):
+        # Pool is not stored in DB object - object stays picklable for multi_proc tasks and db_name can be changed
+        conninfo = psycopg.conninfo.make_conninfo(user=self.db_user, password=self.db_password, host=self.db_host,
+                                                  port=self.db_port, dbname=self.db_name)
+        key = (os.getpid(), conninfo, self.pool_min_size, self.pool_max_size)
+        pool = pools.get(key)
+        if pool is None:
+            with pools_lock:
+                pool = pools.get(key)
+                if pool is None:
+                    pool = psycopg_pool.ConnectionPool(conninfo, min_size=min(self.pool_min_size, self.pool_max_size),
+                                                       max_size=self.pool_max_size, open=True,
+                                                       check=psycopg_pool.ConnectionPool.check_connection,
+                                                       name=f'{self.db_name}-{os.getpid()}')
+                    pools[key] = pool
+                    log.debug(f'{self.db_name} | Connection pool opened | Min {self.pool_min_size} Max {self.pool_max_size}')
+        return pool
+
+    @contextlib.contextmanager
+    def connection(self):
+        if self.pool_max_size > 0 and psycopg_pool is not None:
+            with self.get_pool().connection() as conn:
+                yield conn
+        else:
+            if self.pool_max_size > 0:
+                log.warning(f'psycopg_pool not installed, connection pooling disabled')
+                self.pool_max_size = 0
+            with psycopg.connect(user=self.db_user, password=self.db_password, host=self.db_host, port=self.db_port,
+                                 dbname=self.db_name) as conn:
+                yield conn
 
     def create_new_db(self, db_name, call_id):
         try:
@@ -71,7 +146,7 @@ class DB:
         error = None
         while exec_count <= retry_count < self.db_retry:
             try:
-                with psycopg.connect(user=self.db_user, password=self.db_password, host=self.db_host, port=self.db_port, dbname=self.db_name) as conn:
+                with self.connection() as conn:
                     with conn.cursor() as cur:
                         cur.execute(query)
                         # Validate result by checking existence of cursor description,
@@ -118,8 +193,7 @@ class DB:
         error = None
         while exec_count <= retry_count < self.db_retry:
             try:
-                with psycopg.connect(user=self.db_user, password=self.db_password, host=self.db_host, port=self.db_port,
-                                     dbname=self.db_name) as conn:
+                with self.connection() as conn:
                     with conn.cursor() as cur:
                         cur.executemany(param_query, params_array)
                         # Validate result by checking existence of cursor description,
@@ -166,8 +240,7 @@ class DB:
         error = None
         while exec_count <= retry_count < self.db_retry:
             try:
-                with psycopg.connect(user=self.db_user, password=self.db_password, host=self.db_host, port=self.db_port,
-                                     dbname=self.db_name) as conn:
+                with self.connection() as conn:
                     with conn.cursor() as cur:
                         cur.execute(param_query, params)
                         # Validate result by checking existence of cursor description,
@@ -206,3 +279,213 @@ class DB:
 
         log.debug(f'{call_id} | Returning DB data: {res}')
         return res
+
+    # Several statements executed in single transaction (all or nothing), e.g. set-based data moves.
+    # queries: list of (query, params or None). Returns per statement result rows (statements returning data) or
+    # affected rows count, None on error (nothing is committed then).
+    def execute_transaction(self, queries, call_id):
+        exec_count = 0
+        retry_count = 0
+        res = None
+        error = None
+        while exec_count <= retry_count < self.db_retry:
+            try:
+                with self.connection() as conn:
+                    with conn.cursor() as cur:
+                        res = []
+                        for query, params in queries:
+                            cur.execute(query, params)
+                            res.append(cur.fetchall() if cur.description else cur.rowcount)
+                exec_count += 1
+                error = None
+
+            except (psycopg.ProgrammingError, psycopg.IntegrityError, psycopg.DataError, psycopg.NotSupportedError) as err:
+                exec_count += 1
+                log.debug(f'{call_id} | DB error: {err} | No retries')
+                error = err
+                continue
+
+            except psycopg.Error as err:
+                retry_count += 1
+                exec_count += 1
+                log.debug(f'{call_id} | DB error: {err} | Retrying {retry_count}')
+                time.sleep(self.db_retry_sleep_time)
+                error = err
+                continue
+
+        if error is None:
+            log.debug(f'{call_id} | DB execute successful | Retry count: {retry_count}')
+            return res
+        log.error(f'{call_id} | DB Error: {error} | Retried: {retry_count} | No more retries...')
+        return None
+
+    # Foreign table (postgres_fdw) in this DB for table of other DB on the same server, so both can be used in single
+    # statement. Extension (when missing), server, user mapping (with user name and password of other DB) and schema
+    # fdw_<other db name> are created on first use, foreign table definition is imported again every time (table
+    # structure may change). Returns qualified foreign table name or None if postgres_fdw is not available.
+    def foreign_table(self, other, table, call_id):
+        server = f'bulkdns_{other.db_name}'
+        schema = f'fdw_{other.db_name}'
+        options = psycopg.sql.SQL(', ').join(
+            psycopg.sql.SQL('{} {}').format(psycopg.sql.Identifier(key), psycopg.sql.Literal(str(value)))
+            for key, value in (('host', other.db_host), ('port', other.db_port), ('dbname', other.db_name)))
+        user_options = [('user', other.db_user)] + ([('password', other.db_password)] if other.db_password else [])
+        user_options = psycopg.sql.SQL(', ').join(
+            psycopg.sql.SQL('{} {}').format(psycopg.sql.Identifier(key), psycopg.sql.Literal(str(value)))
+            for key, value in user_options)
+        # CREATE EXTENSION needs elevated privileges, it is executed only when extension is not installed by DBA yet
+        sql_select = "SELECT 1 FROM pg_extension WHERE extname = 'postgres_fdw'"
+        installed = self.execute_single(sql_select, f'{call_id} | SELECT extension')
+        queries = [] if installed else [('CREATE EXTENSION postgres_fdw', None)]
+        queries += [
+            (psycopg.sql.SQL('CREATE SERVER IF NOT EXISTS {} FOREIGN DATA WRAPPER postgres_fdw OPTIONS ({})').format(
+                psycopg.sql.Identifier(server), options), None),
+            (psycopg.sql.SQL('CREATE USER MAPPING IF NOT EXISTS FOR CURRENT_USER SERVER {} OPTIONS ({})').format(
+                psycopg.sql.Identifier(server), user_options), None),
+            (f'CREATE SCHEMA IF NOT EXISTS {schema}', None),
+            (f'DROP FOREIGN TABLE IF EXISTS {schema}.{table}', None),
+            (f'IMPORT FOREIGN SCHEMA public LIMIT TO ({table}) FROM SERVER {server} INTO {schema}', None),
+        ]
+        if self.execute_transaction(queries, f'{call_id} | FOREIGN TABLE') is None:
+            return None
+        return f'{schema}.{table}'
+
+    # Exported snapshot (pg_export_snapshot) of this DB - transaction is kept open for the time of context, other
+    # connections reading with stream(..., snapshot=id) see exactly the same data. Yields snapshot id, None on error.
+    @contextlib.contextmanager
+    def exported_snapshot(self, call_id):
+        conn = None
+        snapshot = None
+        try:
+            conn = psycopg.connect(user=self.db_user, password=self.db_password, host=self.db_host, port=self.db_port,
+                                   dbname=self.db_name)
+            conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+            snapshot = conn.execute('SELECT pg_export_snapshot()').fetchone()[0]
+            log.debug(f'{call_id} | Snapshot exported: {snapshot}')
+        except psycopg.Error as err:
+            log.error(f'{call_id} | DB error: {err} | Reading without common snapshot')
+        try:
+            yield snapshot
+        finally:
+            if conn is not None:
+                conn.close()
+
+    # Query result streamed in chunks (lists of rows) via server side cursor, so memory use does not depend on result
+    # size. Dedicated connection (not pooled one) is used - it is held until the stream is consumed. Stream can not
+    # be resumed, so there are no retries - DB error is logged and raised.
+    def stream(self, query, call_id, chunk_size=10000, snapshot=None):
+        try:
+            with psycopg.connect(user=self.db_user, password=self.db_password, host=self.db_host, port=self.db_port,
+                                 dbname=self.db_name) as conn:
+                if snapshot is not None:
+                    conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+                    conn.execute(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+                with conn.cursor(name='stream') as cur:
+                    cur.itersize = chunk_size
+                    cur.execute(query)
+                    while rows := cur.fetchmany(chunk_size):
+                        yield rows
+            log.debug(f'{call_id} | DB stream finished')
+        except psycopg.Error as err:
+            log.error(f'{call_id} | DB error: {err}')
+            raise
+
+    # Secondary (non constraint) indexes of table are dropped before bulk load and created again after it, which
+    # is faster than maintaining them row by row. drop_indexes() returns index definitions for create_indexes().
+    def drop_indexes(self, table, call_id):
+        sql_select_param = ('SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s '
+                            'AND indexname NOT IN (SELECT conname FROM pg_constraint)')
+        indexes = self.execute_single_param(sql_select_param, (table,), f'{call_id} | SELECT indexes')
+        for name, definition in indexes:
+            self.execute_single(f'DROP INDEX {name}', f'{call_id} | DROP INDEX {name}')
+        return [definition for name, definition in indexes]
+
+    def create_indexes(self, definitions, call_id):
+        for definition in definitions:
+            self.execute_single(definition, f'{call_id} | CREATE INDEX')
+
+    # Existing values of key column (e.g. primary key) out of given keys, looked up in single query
+    def existing_keys(self, table, column, keys, call_id):
+        res = self.execute_single_param(f'SELECT {column} FROM {table} WHERE {column} = ANY(%s)', (list(keys),), call_id)
+        return {row[0] for row in res or []}
+
+    def delete_keys(self, table, column, keys, call_id):
+        self.execute_single_param(f'DELETE FROM {table} WHERE {column} = ANY(%s)', (list(keys),), call_id)
+
+    # Bulk insert streamed via COPY ... FROM STDIN instead of executemany() INSERT statements.
+    # rows can be any iterable (e.g. generator) - it is consumed in chunks of chunk_size rows, each chunk is copied
+    # in its own transaction (and retried as a whole), so memory use does not depend on amount of rows.
+    # skip_existing: chunk is copied into temporary staging table and inserted with ON CONFLICT DO NOTHING,
+    # rows with already existing primary key are skipped by DB. replace_existing: the same staging table, inserted
+    # with ON CONFLICT (first column - primary key) DO UPDATE, rows with already existing primary key are overwritten.
+    # Returns amount of rows inserted (or updated), None on error - loading stops at the chunk failed after retries
+    # (chunks before it stay committed), so lost rows are never mistaken for skipped existing ones.
+    def bulk_load(self, table, columns, rows, call_id, chunk_size=100000, skip_existing=False, replace_existing=False):
+        column_list = ", ".join(columns)
+        if skip_existing or replace_existing:
+            stage = f'bulk_{table}'
+            if replace_existing:
+                on_conflict = (f'ON CONFLICT ({columns[0]}) DO UPDATE SET '
+                               f'{", ".join(f"{column} = EXCLUDED.{column}" for column in columns[1:])}')
+            else:
+                on_conflict = 'ON CONFLICT DO NOTHING'
+            queries = (f'CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table}) ON COMMIT DELETE ROWS',
+                       f'COPY {stage} ({column_list}) FROM STDIN',
+                       f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {stage} {on_conflict}')
+        else:
+            queries = (None, f'COPY {table} ({column_list}) FROM STDIN', None)
+        loaded = 0
+        processed = 0
+        for chunk in chunks(rows, chunk_size):
+            inserted = self.copy_chunk(queries, chunk, f'{call_id} | COPY {processed + 1}-{processed + len(chunk)}')
+            if inserted is None:
+                log.error(f'{call_id} | Loading stopped | Rows inserted before error: {loaded}')
+                return None
+            processed += len(chunk)
+            loaded += inserted
+        log.debug(f'{call_id} | Rows processed: {processed} | Rows inserted: {loaded}')
+        return loaded
+
+    def copy_chunk(self, queries, chunk, call_id):
+        # queries: (staging table query or None, COPY query, staging insert query or None). Returns rows inserted,
+        # None on error (nothing of chunk is committed then).
+        stage_query, copy_query, insert_query = queries
+        exec_count = 0
+        retry_count = 0
+        inserted = 0
+        error = None
+        while exec_count <= retry_count < self.db_retry:
+            try:
+                with self.connection() as conn:
+                    with conn.cursor() as cur:
+                        if stage_query is not None:
+                            cur.execute(stage_query)
+                        with cur.copy(copy_query) as copy:
+                            for row in chunk:
+                                copy.write_row(row)
+                        inserted = len(chunk)
+                        if insert_query is not None:
+                            cur.execute(insert_query)
+                            inserted = cur.rowcount
+                exec_count += 1
+                error = None
+
+            except (psycopg.ProgrammingError, psycopg.IntegrityError, psycopg.DataError) as err:
+                exec_count += 1
+                log.debug(f'{call_id} | DB error: {err} | No retries')
+                error = err
+                continue
+
+            except psycopg.Error as err:
+                retry_count += 1
+                exec_count += 1
+                log.debug(f'{call_id} | DB error: {err} | Retrying {retry_count}')
+                time.sleep(self.db_retry_sleep_time)
+                error = err
+                continue
+
+        if error is None:
+            log.debug(f'{call_id} | DB execute successful | Retry count: {retry_count}')
+            return inserted
+        log.error(f'{call_id} | DB Error: {error} | Retried: {retry_count} | No more retries...')
+        return None
@@ -1,24 +1,128 @@
 # Package: common
 # Module: sqlite
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2023-12-10
+# Rev: 2026-10-18
 
 # sqlite3.connect.autocommit = True is extremely inefficient for executemany() function
 # using sqlite3.connect.commit() after executemany() instead
 
+# Connections are persistent - opened once per database file in each thread (and each process) and reused by all
+# execute_* calls of that thread. Connection is configured with WAL journal mode (readers do not block writer
+# and writer does not block readers, so multi_proc workers do not serialize on rollback journal) and pragmas from
+# [DB.sqlite] config section (see settings()).
+# WAL checkpoint policy: automatic checkpoint every wal_autocheckpoint pages, passive checkpoint at least every
+# checkpoint_interval seconds from writing connection, WAL file truncated to journal_size_limit after checkpoint
+# and fully (TRUNCATE checkpoint) when connections are closed at process exit.
+
 import os
 import sqlite3
+import json
+import contextlib
+import itertools
+import threading
+import atexit
+import weakref
+import time
 import logging
 
 log = logging.getLogger('main')
 
+thread_data = threading.local()  # db_file -> Handle of current thread
+handles = weakref.WeakSet()  # Handles of all threads, connection is closed with thread end (handle garbage collection)
+
+
+def settings(cfg_db):
+    # Translate [DB.sqlite] config section items into DB() pragmas argument
+    return {
+        'journal_mode': cfg_db.get('journal_mode', 'wal'),
+        'synchronous': cfg_db.get('synchronous', 'normal'),
+        'cache_size': int(cfg_db.get('cache_size', -65536)),
+        'mmap_size': int(cfg_db.get('mmap_size', 268435456)),
+        'temp_store': cfg_db.get('temp_store', 'memory'),
+        'wal_autocheckpoint': int(cfg_db.get('wal_autocheckpoint', 1000)),
+        'journal_size_limit': int(cfg_db.get('journal_size_limit', 67108864)),
+        'checkpoint_interval': float(cfg_db.get('checkpoint_interval', 60)),
+    }
+
+
+class Handle:
+    # Persistent connection of single thread in single process
+    def __init__(self, con):
+        self.con = con
+        self.pid = os.getpid()
+        self.last_checkpoint = time.monotonic()
+
+
+def close_connections():
+    # Close connections opened by current process only (connections inherited via fork belong to parent process)
+    pid = os.getpid()
+    for handle in list(handles):
+        if handle.pid != pid:
+            continue
+        try:
+            handle.con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            handle.con.close()
+        except sqlite3.Error as err:
+            log.debug(f'Connection close error: {err}')
+        handles.discard(handle)
+
+
+atexit.register(close_connections)
+
+
+def chunks(rows, chunk_size):
+    # Split any iterable (list, generator) into lists of max chunk_size items without materializing all of it
+    iterator = iter(rows)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        yield chunk
+
 
 class DB:
-    def __init__(self, db_type, db_path, db_name, db_retry):
+    def __init__(self, db_type, db_path, db_name, db_retry, pragmas=None):
         self.db_type = db_type
         self.db_path = db_path
         self.db_name = db_name
         self.db_retry = db_retry
+        self.pragmas = pragmas if pragmas is not None else settings({})
+
+    def connect(self):
+        # Returns persistent connection of current thread, opens and configures it on first use
+        # In sqlite database is its physical file location (preferred dynamically calculated absolute path)
+        db_file = self.db_file()
+        connections = getattr(thread_data, 'connections', None)
+        if connections is None:
+            connections = thread_data.connections = {}
+        handle = connections.get(db_file)
+        if handle is not None and handle.pid == os.getpid():
+            return handle
+        # check_same_thread disabled only to allow close_connections() at exit, connection is used by one thread
+        con = sqlite3.connect(database=db_file, check_same_thread=False)
+        pragmas = self.pragmas
+        con.execute("PRAGMA busy_timeout = 600000")  # set execution timeout in milliseconds
+        con.execute(f"PRAGMA journal_mode = {pragmas['journal_mode']}")
+        con.execute(f"PRAGMA synchronous = {pragmas['synchronous']}")
+        con.execute(f"PRAGMA cache_size = {pragmas['cache_size']}")
+        con.execute(f"PRAGMA mmap_size = {pragmas['mmap_size']}")
+        con.execute(f"PRAGMA temp_store = {pragmas['temp_store']}")
+        con.execute(f"PRAGMA wal_autocheckpoint = {pragmas['wal_autocheckpoint']}")
+        con.execute(f"PRAGMA journal_size_limit = {pragmas['journal_size_limit']}")
+        handle = Handle(con)
+        connections[db_file] = handle
+        handles.add(handle)
+        log.debug(f'{self.db_name} | Persistent connection opened | PID {handle.pid} | Thread {threading.current_thread().name}')
+        return handle
+
+    def db_file(self):
+        return os.path.abspath(f'{self.db_path}/{self.db_name}.sqlite3')
+
+    def checkpoint(self, handle):
+        # Passive checkpoint does not wait for readers, WAL is reset once all readers moved past it
+        now = time.monotonic()
+        if now - handle.last_checkpoint < self.pragmas['checkpoint_interval']:
+            return
+        handle.last_checkpoint = now
+        busy, wal_pages, checkpointed = handle.con.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        log.debug(f'{self.db_name} | WAL checkpoint | Busy {busy} | WAL pages {wal_pages} | Checkpointed {checkpointed}')
 
     def create_new_db(self, call_id):
         # Initialize DB local file which is database for sqlite
@@ -38,12 +142,10 @@ class DB:
     # Prepare param data sets first and then execute massive insert is much more efficient
     # To avid SQL Injection it is suggested to use execute_single_param (not predefined full query as in execute_single)
     def execute_single(self, query, call_id):
-        # In sqlite database is its physical file location (preferred dynamically calculated absolute path)
-        db_file = os.path.abspath(f'{self.db_path}/{self.db_name}.sqlite3')
         try:
-            with sqlite3.connect(database=db_file) as con:
+            handle = self.connect()
+            with handle.con as con:  # Commit on success, rollback on exception (connection stays open)
                 cur = con.cursor()
-                cur.execute("PRAGMA busy_timeout = 600000")  # set execution timeout in milliseconds
                 cur.execute(query)
                 # Return all rows
                 res = cur.fetchall()
@@ -54,28 +156,25 @@ class DB:
             log.error(f'{call_id} | DB error: {err}')
 
     def execute_many_param(self, param_query, params_array, call_id):
-        # In sqlite database is its physical file location (preferred dynamically calculated absolute path)
-        db_file = os.path.abspath(f'{self.db_path}/{self.db_name}.sqlite3')
         try:
-            with sqlite3.connect(database=db_file) as con:
+            handle = self.connect()
+            with handle.con as con:  # Commit on success, rollback on exception (connection stays open)
                 cur = con.cursor()
-                cur.execute("PRAGMA busy_timeout = 600000")  # set execution timeout in milliseconds
                 cur.executemany(param_query, params_array)
                 # Return all rows
                 res = cur.fetchall()
                 cur.close()
                 log.debug(f'{call_id} | DB execute successful')
+            self.checkpoint(handle)
             return res
         except sqlite3.Error as err:
             log.error(f'{call_id} | DB error: {err}')
 
     def execute_single_param(self, param_query, params, call_id):
-        # In sqlite database is its physical file location (preferred dynamically calculated absolute path)
-        db_file = os.path.abspath(f'{self.db_path}/{self.db_name}.sqlite3')
         try:
-            with sqlite3.connect(database=db_file) as con:
+            handle = self.connect()
+            with handle.con as con:  # Commit on success, rollback on exception (connection stays open)
                 cur = con.cursor()
-                cur.execute("PRAGMA busy_timeout = 600000")  # set execution timeout in milliseconds
                 cur.execute(param_query, params)
                 # Return all rows
                 res = cur.fetchall()
@@ -84,3 +183,109 @@ class DB:
             return res
         except sqlite3.Error as err:
             log.error(f'{call_id} | DB error: {err}')
+
+    # Several statements executed in single transaction, e.g. set-based data moves.
+    # queries: list of (query, params or None). attach: {alias: sqlite DB object} attached to connection for the
+    # time of transaction, so tables of other databases can be used as alias.table. Transaction is all or nothing
+    # only per database file - in WAL mode commit is not atomic across attached databases (crash during commit may
+    # leave changes of one file committed and of other not), so statements changing more files must be safe to commit
+    # separately. Returns per statement result rows (statements returning data) or affected rows count, None on error.
+    def execute_transaction(self, queries, call_id, attach=None):
+        attach = attach or {}
+        try:
+            handle = self.connect()
+            con = handle.con
+            for alias, other in attach.items():
+                con.execute(f'ATTACH DATABASE ? AS {alias}', (other.db_file(),))
+            try:
+                with con:  # Commit on success, rollback on exception (connection stays open)
+                    res = []
+                    for query, params in queries:
+                        cur = con.execute(query, params or ())
+                        res.append(cur.fetchall() if cur.description else cur.rowcount)
+            finally:
+                for alias in attach:
+                    con.execute(f'DETACH DATABASE {alias}')
+            log.debug(f'{call_id} | DB execute successful')
+            self.checkpoint(handle)
+            return res
+        except sqlite3.Error as err:
+            log.error(f'{call_id} | DB error: {err}')
+            return None
+
+    # The same interface as postgresql.DB.exported_snapshot(). SQLite can not share snapshot between connections,
+    # each stream() reads consistent data of its own (single read transaction), so no snapshot id is provided.
+    @contextlib.contextmanager
+    def exported_snapshot(self, call_id):
+        yield None
+
+    # Query result streamed in chunks (lists of rows) on dedicated connection, memory use does not depend on result
+    # size. DB error is logged and raised (stream can not be resumed).
+    def stream(self, query, call_id, chunk_size=10000, snapshot=None):
+        try:
+            con = sqlite3.connect(database=self.db_file())
+            try:
+                con.execute("PRAGMA busy_timeout = 600000")
+                cur = con.execute(query)
+                while rows := cur.fetchmany(chunk_size):
+                    yield rows
+            finally:
+                con.close()
+            log.debug(f'{call_id} | DB stream finished')
+        except sqlite3.Error as err:
+            log.error(f'{call_id} | DB error: {err}')
+            raise
+
+    # Secondary indexes (not automatic primary key / unique ones) dropped before bulk load and created after it
+    def drop_indexes(self, table, call_id):
+        sql_select_param = "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL"
+        indexes = self.execute_single_param(sql_select_param, (table,), f'{call_id} | SELECT indexes') or []
+        for name, definition in indexes:
+            self.execute_single(f'DROP INDEX {name}', f'{call_id} | DROP INDEX {name}')
+        return [definition for name, definition in indexes]
+
+    def create_indexes(self, definitions, call_id):
+        for definition in definitions:
+            self.execute_single(definition, f'{call_id} | CREATE INDEX')
+
+    # Existing values of key column (e.g. primary key) out of given keys, looked up in single query
+    def existing_keys(self, table, column, keys, call_id):
+        param_query = f'SELECT {column} FROM {table} WHERE {column} IN (SELECT value FROM json_each(?))'
+        res = self.execute_single_param(param_query, (json.dumps(list(keys)),), call_id)
+        return {row[0] for row in res or []}
+
+    def delete_keys(self, table, column, keys, call_id):
+        param_query = f'DELETE FROM {table} WHERE {column} IN (SELECT value FROM json_each(?))'
+        self.execute_single_param(param_query, (json.dumps(list(keys)),), call_id)
+
+    # Bulk insert - the same interface as postgresql.DB.bulk_load(). rows can be any iterable (e.g. generator),
+    # it is consumed in chunks of chunk_size rows, each chunk inserted by executemany() in single transaction
+    # on persistent connection. skip_existing: INSERT OR IGNORE - rows with already existing primary key are skipped.
+    # replace_existing: INSERT OR REPLACE - rows with already existing primary key are overwritten.
+    # Returns amount of rows inserted (or replaced), None on error - loading stops at the failed chunk (chunks before
+    # it stay committed), so lost rows are never mistaken for skipped existing ones.
+    def bulk_load(self, table, columns, rows, call_id, chunk_size=100000, skip_existing=False, replace_existing=False):
+        if replace_existing:
+            insert = 'INSERT OR REPLACE'
+        elif skip_existing:
+            insert = 'INSERT OR IGNORE'
+        else:
+            insert = 'INSERT'
+        param_query = f'{insert} INTO {table}({", ".join(columns)}) VALUES({", ".join("?" * len(columns))})'
+        loaded = 0
+        processed = 0
+        for chunk in chunks(rows, chunk_size):
+            chunk_call_id = f'{call_id} | INSERT {processed + 1}-{processed + len(chunk)}'
+            processed += len(chunk)
+            try:
+                handle = self.connect()
+                with handle.con as con:
+                    # Cursor rowcount does not include rows changed by triggers (unlike total_changes)
+                    loaded += con.executemany(param_query, chunk).rowcount
+                log.debug(f'{chunk_call_id} | DB execute successful')
+                self.checkpoint(handle)
+            except sqlite3.Error as err:
+                log.error(f'{chunk_call_id} | DB error: {err} | Rows inserted before error: {loaded}')
+                return None
+        log.debug(f'{call_id} | Rows processed: {processed} | Rows inserted: {loaded}')
+        return loaded
@@ -0,0 +1,221 @@
+# Package: BulkDNS
+# Module: core/async_proc
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Domain check within single asyncio event loop. Instead of OS thread (multi_thread) or whole process (multi_proc)
+# per in-flight lookup, external rdap / whois binaries are driven via asyncio.create_subprocess_exec() and number of
+# in-flight lookups is bounded by semaphore (async_concurrency in [CHECK] config section).
+# If native engine is configured (rdap_engine / whois_engine = native) in-process clients are used in the same loop.
+# DB calls are executed in default thread pool executor, so they do not block the loop.
+
+import asyncio
+import datetime
+import random
+import logging
+import gc
+
+from core import domain
+from core import rdap
+from core import rdap_native
+from core import whois_native
+from core import whois_thin
+from core import dns_filter
+from core import check_queue
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+from core import drop_lane
+from core import result_writer
+
+log = logging.getLogger('main')
+
+CMD_TIMEOUT = 30  # seconds, the same as rdap.rdap() subprocess timeout
+DB_UPDATE_BATCH = 40  # Checked domains per DB update, the same as in domain.run_domain_check_param_*()
+
+
+async def run_cmd(cmd, args):
+    try:
+        proc = await asyncio.create_subprocess_exec(cmd, *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except OSError as err:
+        log.debug(f'Command Line call: "{cmd} {" ".join(args)}" failed: {err}')
+        return -1, str(err)
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), CMD_TIMEOUT)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        log.debug(f'Command Line call: "{cmd} {" ".join(args)}" timeout')
+        return -1, 'Command timeout'
+    # Mimic rdap.rdap() output - stdout when executed correctly, stderr otherwise
+    if proc.returncode == 0:
+        return 0, stdout.decode('utf-8', errors='replace')
+    return proc.returncode, stderr.decode('utf-8', errors='replace')
+
+
+async def rdap_subprocess_run(domain_name, tld):
+    res = await run_cmd('rdap', ['-r', domain_name])
+    raw_archive.append('rdap', domain_name, res[0], res[1])
+    return rdap.rdap_parse(res, domain_name)
+
+
+async def whois_subprocess_run(domain_name, tld):
+    res = await run_cmd('whois', [domain_name])
+    raw_archive.append('whois', domain_name, res[0], res[1])
+    if res[0] != 0:
+        return -1, None, None, 'WhoisCommandFailed'
+    if whois_thin.is_thin(tld):
+        parsed = whois_thin.classify(res[1])
+        if parsed[0] == 0:
+            return parsed
+    return whois_native.parse(res[1])
+
+
+async def subprocess_query(run, protocol, name, tld, retry):
+    # Retry logic of rdap.query(), non-blocking
+    cached = await lookup_cache.get_async(name, tld)
+    if cached is not None:
+        return cached
+
+    available = None
+    expiry_date = None
+    updated = None
+    exec_code = None
+    err_msg = None
+    retry_count = 0
+
+    domain_name = f'{name}.{tld}'
+
+    limit_key = f'{protocol}:{tld}'
+
+    while retry_count <= retry:
+        await rate_limit.acquire_async(limit_key)
+        exec_code, available, expiry_date, err_msg = await run(domain_name, tld)
+        throttled = rate_limit.report(limit_key, exec_code, err_msg)
+        if exec_code == 0:
+            dt = datetime.datetime.now(datetime.UTC)
+            updated = dt.strftime("%Y-%m-%d %H:%M:%S")
+            break
+        else:
+            if not throttled:  # Throttled key is already paused by rate limiter
+                await asyncio.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
+            retry_count += 1
+            updated = None
+
+    log.debug(f'{domain_name} | Returning domain data: {domain_name, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count}')
+    return lookup_cache.put((domain_name, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count))
+
+
+def get_lookup(protocol, check_cfg):
+    # Returns coroutine function lookup(name, tld) -> domain data 9 items tuple, or None if protocol unknown
+    if protocol == 'rdap':
+        if check_cfg.get('rdap_engine', 'subprocess') == 'native':
+            client = rdap_native.Client(**rdap_native.client_settings(check_cfg))
+            return lambda name, tld: client.query(name, tld, 10)
+        return lambda name, tld: subprocess_query(rdap_subprocess_run, protocol, name, tld, 10)
+    elif protocol == 'whois':
+        if check_cfg.get('whois_engine', 'whoisdomain') == 'native':
+            client = whois_native.Client(**whois_native.client_settings(check_cfg))
+            return lambda name, tld: client.query(name, tld, 10)
+        return lambda name, tld: subprocess_query(whois_subprocess_run, protocol, name, tld, 10)
+    return None
+
+
+async def process(db, tasks, lookup, concurrency, check_cfg):
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    batches = {}  # table -> sql params array waiting for DB update
+    stats = {'checked': 0, 'failed': 0}
+
+    async def flush(table, sql_params_array):
+        if result_writer.enabled():
+            result_writer.submit(table, sql_params_array)  # DB update executed by dedicated writer thread
+            return
+        call_id = f'{table} | UPDATE at {sql_params_array[-1][3]}'
+        sql_update_param = domain.update_query(db.db_type, table)
+        if sql_update_param is None:
+            log.error(f'Error: Incorrect database type')
+            return
+        await asyncio.to_thread(db.execute_many_param, sql_update_param, check_queue.params(sql_params_array), call_id)
+
+    async def check(table, name, tld):
+        # Exception must not escape - task done callback drops it unseen, gather() of in-flight tasks would abort run
+        try:
+            domain_dta = await lookup(name, tld)
+        except Exception as ex:
+            log.error(f'{name}.{tld} | Exception: {ex}')
+            stats['failed'] += 1
+            return
+        finally:
+            semaphore.release()
+
+        stats['checked'] += 1
+        if domain_dta[6] == 0:
+            log.debug(f'{domain_dta[0]} | Domain available: {domain_dta[3]} | Retries: {domain_dta[8]}')
+            batch = batches.setdefault(table, [])
+            batch.append((domain_dta[3], domain_dta[4], domain_dta[5], domain_dta[0]))
+            if len(batch) >= DB_UPDATE_BATCH:
+                batches[table] = []
+                await flush(table, batch)
+        else:
+            log.error(f'{domain_dta[0]} | Error getting domain data after {domain_dta[8]} retries: {domain_dta[7]}')
+            stats['failed'] += 1
+
+    for task in tasks:
+        table = task[1]
+        param = task[2]
+        check_type = task[5]
+
+        sql_result = await asyncio.to_thread(domain.select_task, db, table, check_type, check_cfg)
+        if sql_result and check_cfg.get('dns_prefilter', 'no') == 'yes':
+            delegated, sql_result = await dns_filter.prefilter_async(sql_result, check_cfg)
+            await asyncio.to_thread(domain.dns_mark_delegated, db, table, param, delegated)
+        if not sql_result:
+            log.info(f'No {param} items to process in {table}.')
+            continue
+        print(f'Task \033[93m{param}\033[00m {table} \033[94m|\033[00m Items to process \033[91m{len(sql_result)}\033[00m '
+              f'\033[94m|\033[00m Checked \033[92m{stats["checked"]}\033[00m Failed \033[91m{stats["failed"]}\033[00m')
+
+        lease = check_queue.Lease(db, table, sql_result, check_queue.settings(check_cfg)['lease'])
+        for item in sql_result:
+            await semaphore.acquire()  # Wait for free lookup slot
+            if lease.due():
+                await asyncio.to_thread(lease.keep)  # Rows waiting for lookup slot or DB update stay claimed
+            future = asyncio.create_task(check(table, item[0], item[1]))
+            in_flight.add(future)
+            future.add_done_callback(in_flight.discard)
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+    # Update what is left in batches
+    for table, batch in batches.items():
+        if batch:
+            await flush(table, batch)
+
+    log.info(f'Checked {stats["checked"]} | Failed {stats["failed"]}')
+
+
+def async_run(db, tbl_names, tld, check_type, protocol, check_cfg):
+    gc.enable()  # Enable automatic garbage collection.
+
+    concurrency = int(check_cfg.get('async_concurrency', 100))
+    rate_limit.start(check_cfg)
+    lookup_cache.start(check_cfg)
+    raw_archive.start(check_cfg)
+    drop_lane.start(check_cfg)
+    lookup = get_lookup(protocol, check_cfg)
+    if lookup is None:
+        log.error(f'Unidentified domain check protocol: {protocol}')
+        return
+
+    log.info(f'Parallel lookups to be executed in single event loop: {concurrency}')
+    log.info(f'Preparing params data...')
+    tasks = domain.params_preparation(db, tbl_names, tld, check_type, protocol, check_cfg)
+    result_writer.start(db, check_cfg)
+    try:
+        asyncio.run(process(db, tasks, lookup, concurrency, check_cfg))
+    except KeyboardInterrupt:
+        log.error("Caught KeyboardInterrupt, pending lookups cancelled")
+    finally:
+        result_writer.stop()
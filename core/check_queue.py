@@ -0,0 +1,205 @@
+# Package: BulkDNS
+# Module: core/check_queue
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Materialized check queue of domain tables. Every table has next_check column - time when the domain is due for the
+# next check, computed whenever check result is written (domain.update_query(), result_writer.update(),
+# domain.dns_mark_delegated()) with the same rules as original per run conditions:
+#   never checked                   - EPOCH (column default, so newly generated rows are due immediately)
+#   available                       - updated + RECHECK_DAYS (re-check)
+#   taken with known expiry         - expiry - EXPIRING_DAYS, but not sooner than updated + RECHECK_DAYS
+#   taken without known expiry      - updated + RECHECK_DAYS (e.g. taken by DNS pre-filter)
+# Index (avail, next_check) makes candidate selection indexed range read ordered by due time - 'expiring' check reads
+# avail IS NULL and avail = 'N' ranges, 'recheck' reads avail = 'Y' range - so run planning counts due rows instead
+# of grouping whole tables.
+# Candidates are claimed in batches (claim()): next_check of claimed rows is moved queue_lease seconds ahead in the
+# same statement (PostgreSQL skips rows locked by other claims), so parallel tasks never get the same domains and
+# domains failed to check (or lost in crashed run) are due again when lease expires. Task checking its rows longer
+# (retries, rate limiter pauses) renews lease of rows not checked yet (Lease), so other task never gets them.
+# Existing tables get column and index on the first run (prepare()), rows with check result but without next_check
+# (existing data, rows restored from backup / archive) are filled in at the same time.
+
+import datetime
+import json
+import time
+import logging
+
+from common import dates
+
+log = logging.getLogger('main')
+
+COLUMN = 'next_check'
+EPOCH = '1970-01-01 00:00:00'  # Never checked
+RECHECK_DAYS = 7
+EXPIRING_DAYS = 30
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+PREPARE_PAGE_SIZE = 10000
+
+
+def settings(check_cfg):
+    return {
+        'batch': int(check_cfg.get('queue_batch', 1000)),
+        'lease': int(check_cfg.get('queue_lease', 3600)),
+    }
+
+
+def now_utc():
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def next_check(avail, expiry, updated):
+    # Due time of the next check as 'YYYY-MM-DD HH:MM:SS' (UTC, the same as updated)
+    if updated is None:
+        return EPOCH
+    if not isinstance(updated, datetime.datetime):
+        try:
+            updated = datetime.datetime.fromisoformat(str(updated))
+        except ValueError:
+            return EPOCH
+    due = updated.replace(tzinfo=None) + datetime.timedelta(days=RECHECK_DAYS)
+    if avail != 'Y':
+        expiry_day = dates.to_day(expiry)
+        if expiry_day:
+            due = max(due, dates.from_day(expiry_day) - datetime.timedelta(days=EXPIRING_DAYS))
+    return due.strftime(TIME_FORMAT)
+
+
+def params(rows):
+    # (avail, expiry, updated, domain) rows -> (avail, expiry, updated, next_check, domain) domain.update_query() params
+    return [(row[0], row[1], row[2], next_check(row[0], row[1], row[2]), row[3]) for row in rows]
+
+
+def column_exists(db, table):
+    call_id = f'{table} | SELECT columns'
+    if db.db_type == 'sqlite':
+        res = db.execute_single(f'PRAGMA table_info({table})', call_id) or []
+        return any(row[1] == COLUMN for row in res)
+    res = db.execute_single_param('SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s',
+                                  (table, COLUMN), call_id)
+    return bool(res)
+
+
+def prepare(db, table):
+    # Adds queue column and index to table created before check queue existed and fills in next_check of checked rows
+    if db.db_type == 'sqlite':
+        mark = '?'
+    elif db.db_type == 'postgresql':
+        mark = '%s'
+    else:
+        log.error(f'Error: Incorrect database type')
+        return False
+    if not column_exists(db, table):
+        log.info(f'{table} | Adding check queue column {COLUMN}')
+        db.execute_single(f"ALTER TABLE {table} ADD COLUMN {COLUMN} TIMESTAMP DEFAULT '{EPOCH}'", f'{table} | ALTER TABLE')
+        if not column_exists(db, table):
+            return False
+    db.execute_single(f'CREATE INDEX IF NOT EXISTS {table}_{COLUMN} ON {table} (avail, {COLUMN})', f'{table} | CREATE INDEX')
+
+    # Checked rows still at EPOCH - index range read, empty unless table was just migrated or rows were restored.
+    # Streamed on dedicated connection, updated rows leave the range.
+    sql_select = (f"SELECT avail, expiry, updated, domain FROM {table} WHERE avail IN ('Y', 'N') AND {COLUMN} = '{EPOCH}' "
+                  f"AND updated IS NOT NULL")
+    sql_update_param = f'UPDATE {table} SET {COLUMN} = {mark} WHERE domain = {mark}'
+    filled = 0
+    try:
+        for page in db.stream(sql_select, f'{table} | SELECT not scheduled', PREPARE_PAGE_SIZE):
+            db.execute_many_param(sql_update_param, [(next_check(*row[:3]), row[3]) for row in page], f'{table} | UPDATE {COLUMN}')
+            filled += len(page)
+            print(f'{table} | {filled} rows scheduled', end="\r", flush=True)
+    except Exception as ex:
+        log.error(f'{table} | Check queue not filled in: {ex}')
+        return False
+    if filled:
+        log.info(f'{table} | Check queue: next check time of {filled} rows filled in')
+    return True
+
+
+def ranges(check_type):
+    # avail values of index ranges read by check type, in order of reading (never checked first)
+    if check_type == 'expiring':
+        return [None, 'N']
+    return ['Y']  # This covers check_type == 'recheck'
+
+
+def condition(avail):
+    return 'avail IS NULL' if avail is None else f"avail = '{avail}'"
+
+
+def due_count(db, table, check_type, due=None):
+    # Count of rows due for check (index range count), None on DB error
+    due = due or now_utc().strftime(TIME_FORMAT)
+    mark = '?' if db.db_type == 'sqlite' else '%s'
+    count = 0
+    for avail in ranges(check_type):
+        sql_select_param = f'SELECT count(*) FROM {table} WHERE {condition(avail)} AND {COLUMN} <= {mark}'
+        res = db.execute_single_param(sql_select_param, (due,), f'{table} | SELECT due count')
+        if not res:
+            return None
+        count += res[0][0]
+    return count
+
+
+def claim(db, table, check_type, limit, lease, due=None):
+    # Up to limit rows (name, tld, domain, expiry) due for check (next_check <= due, default now) in order of due time.
+    # Claimed rows are leased - their next_check is set lease seconds ahead until check result is written.
+    now = now_utc()
+    due = due or now.strftime(TIME_FORMAT)
+    leased = (now + datetime.timedelta(seconds=lease)).strftime(TIME_FORMAT)
+    if db.db_type == 'sqlite':
+        mark = '?'
+        lock = ''
+    elif db.db_type == 'postgresql':
+        mark = '%s'
+        lock = ' FOR UPDATE SKIP LOCKED'
+    else:
+        log.error(f'Error: Incorrect database type')
+        return []
+    claimed = []
+    for avail in ranges(check_type):
+        if len(claimed) >= limit:
+            break
+        sql_claim_param = (f'UPDATE {table} SET {COLUMN} = {mark} WHERE domain IN (SELECT domain FROM {table} '
+                           f'WHERE {condition(avail)} AND {COLUMN} <= {mark} ORDER BY {COLUMN} LIMIT {mark}{lock}) '
+                           f'RETURNING name, tld, domain, expiry')
+        res = db.execute_single_param(sql_claim_param, (leased, due, limit - len(claimed)), f'{table} | CLAIM {avail or "new"}')
+        claimed.extend(res or [])
+    return claimed
+
+
+def renew(db, table, domains, until, lease):
+    # Moves lease of claimed domains lease seconds ahead from now and returns new lease end. Only rows still leased
+    # (next_check <= until) are renewed - written check result moves next_check at least RECHECK_DAYS ahead.
+    leased = (now_utc() + datetime.timedelta(seconds=lease)).strftime(TIME_FORMAT)
+    call_id = f'{table} | RENEW {len(domains)}'
+    if db.db_type == 'sqlite':
+        sql_update_param = (f'UPDATE {table} SET {COLUMN} = ? WHERE domain IN (SELECT value FROM json_each(?)) '
+                            f'AND {COLUMN} <= ?')
+        db.execute_single_param(sql_update_param, (leased, json.dumps(domains), until), call_id)
+    elif db.db_type == 'postgresql':
+        sql_update_param = f'UPDATE {table} SET {COLUMN} = %s WHERE domain = ANY(%s) AND {COLUMN} <= %s'
+        db.execute_single_param(sql_update_param, (leased, domains, until), call_id)
+    else:
+        log.error(f'Error: Incorrect database type')
+    return leased
+
+
+class Lease:
+    # Lease of rows claimed by single task - renewed whenever half of lease time elapsed, so rows waiting for lookup,
+    # being checked or waiting for DB update are not claimed by other task
+    def __init__(self, db, table, rows, lease):
+        self.db = db
+        self.table = table
+        self.rows = rows
+        self.lease = lease
+        self.renewed = time.monotonic()
+        self.until = (now_utc() + datetime.timedelta(seconds=lease)).strftime(TIME_FORMAT)  # Not sooner than claim()
+
+    def due(self):
+        return time.monotonic() - self.renewed >= self.lease / 2
+
+    def keep(self):
+        if not self.due():
+            return
+        self.renewed = time.monotonic()
+        self.until = renew(self.db, self.table, [row[2] for row in self.rows], self.until, self.lease)
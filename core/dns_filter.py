@@ -0,0 +1,192 @@
+# Package: BulkDNS
+# Module: core/dns_filter
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# DNS delegation pre-filter executed before (rate limited) RDAP / WHOIS check.
+# Domain with NS delegation in the zone is definitely taken, so only NXDOMAIN, undelegated (NODATA) or unresolved
+# (SERVFAIL / timeout) names have to be sent to registry. NS queries are sent in batches over single UDP socket to
+# configurable resolver (dns_resolver in [CHECK] config section) - recursive resolver or TLD authoritative server
+# (NS records are searched in answer and authority section, so referral response is recognized as well).
+# Only never checked names and names without known expiry are pre-filtered - delegated domain with known (expiring)
+# expiry goes to RDAP / WHOIS, otherwise its renewal (new expiry) would never be seen.
+
+import asyncio
+import struct
+import random
+import logging
+
+log = logging.getLogger('main')
+
+DNS_PORT = 53
+TYPE_NS = 2
+CLASS_IN = 1
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+# Statuses returned by Resolver.ns_status()
+DELEGATED = 'delegated'
+NXDOMAIN = 'nxdomain'
+UNDELEGATED = 'undelegated'
+ERROR = 'error'
+
+
+def resolver_settings(check_cfg):
+    # Translate [CHECK] config section items into Resolver() keyword arguments
+    if check_cfg is None:
+        check_cfg = {}
+    host, _, port = check_cfg.get('dns_resolver', '8.8.8.8').partition(':')
+    return {
+        'host': host,
+        'port': int(port) if port else DNS_PORT,
+        'timeout': float(check_cfg.get('dns_timeout', 2)),
+        'retries': int(check_cfg.get('dns_retries', 2)),
+        'concurrency': int(check_cfg.get('dns_concurrency', 200)),
+    }
+
+
+def build_query(query_id, domain):
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)  # Recursion desired, single question
+    qname = b''.join(bytes([len(label)]) + label for label in domain.rstrip('.').encode('idna').split(b'.')) + b'\x00'
+    return header + qname + struct.pack('!HH', TYPE_NS, CLASS_IN)
+
+
+def read_name(data, offset):
+    # Returns (lowercase dotted name, offset after name); follows compression pointers
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            jumps += 1
+            if jumps > 64:
+                raise ValueError('DNS name compression loop')
+            continue
+        if length == 0:
+            offset += 1
+            break
+        labels.append(data[offset + 1:offset + 1 + length].decode('ascii', errors='replace').lower())
+        offset += length + 1
+    return '.'.join(labels), end if end is not None else offset
+
+
+def parse_response(data):
+    # Returns (query_id, qname, rcode, amount of NS records owned by qname in answer and authority sections)
+    query_id, flags, qdcount, ancount, nscount, arcount = struct.unpack_from('!HHHHHH', data)
+    rcode = flags & 0x000F
+    offset = 12
+    qname = ''
+    for _ in range(qdcount):
+        qname, offset = read_name(data, offset)
+        offset += 4
+    ns_records = 0
+    for _ in range(ancount + nscount):
+        owner, offset = read_name(data, offset)
+        rtype, rclass, ttl, rdlength = struct.unpack_from('!HHIH', data, offset)
+        offset += 10 + rdlength
+        if rtype == TYPE_NS and owner == qname:
+            ns_records += 1
+    return query_id, qname, rcode, ns_records
+
+
+class Resolver(asyncio.DatagramProtocol):
+    def __init__(self, host, port=DNS_PORT, timeout=2.0, retries=2, concurrency=200):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = concurrency
+        self.transport = None
+        self.pending = {}  # query_id -> (qname, future)
+        self.next_id = random.randrange(65536)
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, remote_addr=(self.host, self.port))
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            query_id, qname, rcode, ns_records = parse_response(data)
+        except (struct.error, IndexError, ValueError) as err:
+            log.debug(f'Malformed DNS response: {err}')
+            return
+        entry = self.pending.get(query_id)
+        if entry is None or entry[0] != qname or entry[1].done():
+            return  # Late answer for already timed out query or spoofed packet
+        if rcode == RCODE_NXDOMAIN:
+            entry[1].set_result(NXDOMAIN)
+        elif rcode == RCODE_NOERROR:
+            entry[1].set_result(DELEGATED if ns_records > 0 else UNDELEGATED)
+        else:
+            entry[1].set_result(ERROR)
+
+    def error_received(self, exc):
+        log.debug(f'DNS socket error: {exc}')
+
+    def allocate_id(self):
+        for _ in range(65536):
+            self.next_id = (self.next_id + 1) % 65536
+            if self.next_id not in self.pending:
+                return self.next_id
+        raise RuntimeError('No free DNS query id')
+
+    async def ns_status(self, domain):
+        qname = domain.rstrip('.').lower()
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            query_id = self.allocate_id()
+            future = loop.create_future()
+            self.pending[query_id] = (qname, future)
+            try:
+                self.transport.sendto(build_query(query_id, qname))
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                log.debug(f'{domain} | DNS timeout, attempt {attempt + 1}')
+            finally:
+                self.pending.pop(query_id, None)
+        return ERROR
+
+    async def statuses(self, domains):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(domain):
+            async with semaphore:
+                return await self.ns_status(domain)
+
+        return await asyncio.gather(*(bounded(domain) for domain in domains))
+
+
+async def prefilter_async(items, check_cfg):
+    # items: (name, tld, domain, expiry) rows as selected for check. Returns (delegated items, items to be checked
+    # via RDAP/WHOIS). Items with known expiry are passed to RDAP/WHOIS check without DNS query.
+    candidates = [item for item in items if item[3] is not None]
+    items = [item for item in items if item[3] is None]
+    resolver = Resolver(**resolver_settings(check_cfg))
+    await resolver.open()
+    try:
+        statuses = await resolver.statuses([f'{item[0]}.{item[1]}' for item in items])
+    finally:
+        resolver.close()
+    delegated = []
+    for item, status in zip(items, statuses):
+        if status == DELEGATED:
+            delegated.append(item)
+        else:
+            candidates.append(item)
+    log.debug(f'DNS pre-filter | Delegated {len(delegated)} | To check {len(candidates)}')
+    return delegated, candidates
+
+
+def prefilter(items, check_cfg):
+    return asyncio.run(prefilter_async(items, check_cfg))
@@ -1,71 +1,124 @@
 # Package: BulkDNS
 # Module: core/domain
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-22
+# Rev: 2026-10-18
 
 import datetime
 import logging
 
 from core import rdap
+from core import rdap_native
 from core import whois
+from core import whois_native
+from core import dns_filter
+from core import check_queue
+from core import result_writer
 
 log = logging.getLogger('main')
 
-tbl_names_none_param = ['two_digit', 'two_letter', 'two_digit_letter']
-tbl_names_short_param = ['three_digit', 'three_letter', 'three_special','generic']
-tbl_names_medium_param = ['three_digit_letter', 'four_digit', 'four_letter', 'four_digit_letter', 'four_special', 'english']
+# Expiry date limit (in 30 days) and last check date limit (7 days ago) for domains to be checked
+# (dense status store conditions, DB tables are selected by check_queue)
+def check_dates():
+    exp_date = datetime.datetime.now() + datetime.timedelta(days=30)
+    exp_date = datetime.datetime(exp_date.year, exp_date.month, exp_date.day, 0, 0, 0)
+    updated_date = datetime.datetime.now() - datetime.timedelta(days=7)
+    updated_date = datetime.datetime(updated_date.year, updated_date.month, updated_date.day, 0, 0, 0)
+    return exp_date, updated_date
 
 
-def params_preparation(db, tbl_names, tld, check_type, protocol):
+# Tasks of check run: due rows of each table (check_queue index range count) split into claim batches of queue_batch
+# rows. Task param is batch number, the rows are claimed when task is executed (see check_queue.claim()).
+def params_preparation(db, tbl_names, tld, check_type, protocol, check_cfg):
     params_to_process = []
+    batch = check_queue.settings(check_cfg)['batch']
+    # Kept in tasks for compatibility of workers signature, due time is read from check queue
+    exp_date, updated_date = check_dates()
     for tbl_name in tbl_names:
         table = f'{tbl_name}_{tld}'
-        call_id = f'{table} | SELECT'
-
-        # Get all that has never been checked OR expiring in next 30 days but not checked within last 7 days
-        exp_date = datetime.datetime.now() + datetime.timedelta(days=30)
-        exp_date = datetime.datetime(exp_date.year, exp_date.month, exp_date.day, 0, 0, 0)
-        updated_date = datetime.datetime.now() - datetime.timedelta(days=7)
-        updated_date = datetime.datetime(updated_date.year, updated_date.month, updated_date.day, 0, 0, 0)
-
-        if tbl_name in tbl_names_none_param:
-            substr = 'substr(name, 1, 0)'
-        elif tbl_name in tbl_names_short_param:
-            substr = 'substr(name, 1, 1)'
-        elif tbl_name in tbl_names_medium_param:
-            substr = 'substr(name, 1, 2)'
-        else:
-            substr = 'substr(name, 1, 3)'
-
-        # Expiring domains check or available domains re-check will be executed only for domains with last check earlier than 7 days ago
-        if check_type == 'expiring':
-            sql_select = (f"SELECT DISTINCT {substr}, count(*) FROM {table} WHERE updated is null OR (expiry<='{exp_date}' AND updated<='{updated_date}') GROUP BY {substr} ORDER BY count(*), {substr}")
-        else:  # This covers check_type == 'recheck'
-            sql_select = (f"SELECT DISTINCT {substr}, count(*) FROM {table} WHERE avail='Y' AND updated<='{updated_date}' GROUP BY {substr} ORDER BY count(*), {substr}")
 
-        result = db.execute_single(sql_select, call_id)
-
-        if result is []:
+        if not check_queue.prepare(db, table):
+            log.error(f'{table} | Check queue not available. Skipping...')
             continue
-        else:
-            for param in result:
-                params_to_process.append([db, table, param[0], exp_date, updated_date, check_type, protocol])
+        due = check_queue.due_count(db, table, check_type)
+        if not due:
+            continue
+        log.info(f'{table} | Domains due for check: {due}')
+        for i in range(-(-due // batch)):
+            params_to_process.append([db, table, f'#{i + 1}', exp_date, updated_date, check_type, protocol, check_cfg])
 
     log.info(f'Tasks (params) to process: {len(params_to_process)}')
     return params_to_process
 
 
-# This use single query to select all domains from single table that should be checked and starts with 'param' value
+# Rows (name, tld, domain) of single task - batch of due domains claimed from check queue
+def select_task(db, table, check_type, check_cfg):
+    cfg = check_queue.settings(check_cfg)
+    return check_queue.claim(db, table, check_type, cfg['batch'], cfg['lease'])
+
+
+# Single domain check with protocol engine selected in [CHECK] config section. Returns domain data 9 items tuple.
+def lookup(name, tld, protocol, check_cfg):
+    if protocol == 'rdap':
+        # RDAP engine: external rdap binary (default) or in-process asyncio client
+        if check_cfg.get('rdap_engine', 'subprocess') == 'native':
+            return rdap_native.query(name, tld, 10, check_cfg)
+        return rdap.query(name, tld, 10)
+    elif protocol == 'whois':
+        # WHOIS engine: whoisdomain package with whois binary (default) or in-process asyncio port 43 client
+        if check_cfg.get('whois_engine', 'whoisdomain') == 'native':
+            return whois_native.query(name, tld, 10, check_cfg)
+        return whois.get_domain_data(name, tld, 10)  # Execute whois check
+    return None
+
+
+# Param query updating single checked domain; params: (avail, expiry, updated, next_check, domain) - domain_dta items
+# 3, 4, 5, 0 rows converted by check_queue.params()
+def update_query(db_type, table):
+    if db_type == 'sqlite':
+        return f'UPDATE {table} SET avail = ?, expiry = ?, updated = ?, next_check = ? WHERE domain = ?'
+    elif db_type == 'postgresql':
+        return f'UPDATE {table} SET avail = %s, expiry = %s, updated = %s, next_check = %s WHERE domain = %s'
+    else:
+        return None
+
+
+# DNS pre-filter: mark names delegated in zone as taken. Pre-filter is applied only to names without known expiry
+# (see core/dns_filter), so such domains are re-checked (by DNS first) every 7 days as any other taken domain without
+# known expiry.
+def dns_mark_delegated(db, table, param, delegated):
+    if not delegated:
+        return
+    dt = datetime.datetime.now(datetime.UTC)
+    updated = dt.strftime("%Y-%m-%d %H:%M:%S")
+    next_check = check_queue.next_check('N', None, updated)
+    sql_params_array = [('N', updated, next_check, f'{item[0]}.{item[1]}') for item in delegated]
+    call_id = f'{table} {param} | UPDATE DNS delegated'
+    if db.db_type == 'sqlite':
+        db.execute_many_param(f'UPDATE {table} SET avail = ?, updated = ?, next_check = ? WHERE domain = ?', sql_params_array, call_id)
+    elif db.db_type == 'postgresql':
+        db.execute_many_param(f'UPDATE {table} SET avail = %s, updated = %s, next_check = %s WHERE domain = %s', sql_params_array, call_id)
+    else:
+        log.error(f'Error: Incorrect database type')
+
+
+def dns_prefilter(db, table, param, sql_result, check_cfg):
+    # Returns items that still have to be checked via RDAP/WHOIS
+    if check_cfg.get('dns_prefilter', 'no') != 'yes' or not sql_result:
+        return sql_result
+    delegated, candidates = dns_filter.prefilter(sql_result, check_cfg)
+    log.debug(f'{param} {table} | DNS pre-filter | Delegated {len(delegated)} | To check {len(candidates)}')
+    dns_mark_delegated(db, table, param, delegated)
+    return candidates
+
+
+# This claims single batch (task 'param') of domains due for check in single table from check queue
 # Is using multi param query to execute update of checked domains in the groups of 40 or less if items left < 40
-def run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id):
-
-    if check_type == 'expiring':
-        sql_select = f"SELECT name, tld FROM {table} WHERE (updated is null AND domain LIKE '{param}%') OR (expiry<='{exp_date}' AND updated<='{updated_date}' AND domain LIKE '{param}%')"
-    else:  # This covers check_type == 'recheck'
-        sql_select = f"SELECT name, tld FROM {table} WHERE avail='Y' AND updated<='{updated_date}' AND domain LIKE '{param}%'"
+# (groups are passed to core/result_writer instead, if enabled)
+def run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg):
 
-    call_id = f'{table} {param} | SELECT'
-    sql_result = db.execute_single(sql_select, call_id)
+    sql_result = select_task(db, table, check_type, check_cfg)
+    sql_result = dns_prefilter(db, table, param, sql_result, check_cfg)
+    lease = check_queue.Lease(db, table, sql_result, check_queue.settings(check_cfg)['lease'])
 
     items_amount = len(sql_result)  # Items to be processed
     if items_amount == 0:
@@ -84,10 +137,11 @@ def run_domain_check_param_whois(db, table, param, exp_date, updated_date, check
 
     # Check each domain from the list one by one
     for item in sql_result:
+        lease.keep()  # Long running task keeps its rows claimed
         name = item[0]
         tld = item[1]
 
-        domain_dta = whois.get_domain_data(name, tld, 10)  # Execute whois check
+        domain_dta = lookup(name, tld, 'whois', check_cfg)  # Execute whois check
 
         items_left -= 1
         processed_counter += 1
@@ -148,15 +202,14 @@ def run_domain_check_param_whois(db, table, param, exp_date, updated_date, check
                   f'Processed \033[92m{percent:>6}%\033[00m ({processed_counter}/{items_amount}) \033[94m|\033[00m '
                   f'Failed \033[91m{failed}\033[00m Left \033[92m{items_left}\033[00m')
 
-            if db.db_type == 'sqlite':
-                sql_update_param = f'UPDATE {table} SET avail = ?, expiry = ?, updated = ? WHERE domain = ?'
-                db.execute_many_param(sql_update_param, sql_params_array, call_id)
-            elif db.db_type == 'postgresql':
-                sql_update_param = f'UPDATE {table} SET avail = %s, expiry = %s, updated = %s WHERE domain = %s'
-                db.execute_many_param(sql_update_param, sql_params_array, call_id)
+            if result_writer.enabled():
+                result_writer.submit(table, sql_params_array)  # DB update executed by dedicated writer
             else:
-                log.error(f'Error: Incorrect database type')
-                return  # Stop further processing
+                sql_update_param = update_query(db.db_type, table)
+                if sql_update_param is None:
+                    log.error(f'Error: Incorrect database type')
+                    return  # Stop further processing
+                db.execute_many_param(sql_update_param, check_queue.params(sql_params_array), call_id)
 
             db_execute_trigger = 0
             processed_current_round = 0
@@ -167,15 +220,11 @@ def run_domain_check_param_whois(db, table, param, exp_date, updated_date, check
             continue
 
 
-def run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id):
-
-    if check_type == 'expiring':
-        sql_select = f"SELECT name, tld FROM {table} WHERE (updated is null AND domain LIKE '{param}%') OR (expiry<='{exp_date}' AND updated<='{updated_date}' AND domain LIKE '{param}%')"
-    else:  # This covers check_type == 'recheck'
-        sql_select = f"SELECT name, tld FROM {table} WHERE avail='Y' AND updated<='{updated_date}' AND domain LIKE '{param}%'"
+def run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg):
 
-    call_id = f'{table} {param} | SELECT'
-    sql_result = db.execute_single(sql_select, call_id)
+    sql_result = select_task(db, table, check_type, check_cfg)
+    sql_result = dns_prefilter(db, table, param, sql_result, check_cfg)
+    lease = check_queue.Lease(db, table, sql_result, check_queue.settings(check_cfg)['lease'])
 
     items_amount = len(sql_result)  # Items to be processed
 
@@ -194,10 +243,11 @@ def run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_
 
     # Check each domain from the list one by one
     for item in sql_result:
+        lease.keep()  # Long running task keeps its rows claimed
         name = item[0]
         tld = item[1]
 
-        domain_dta = rdap.query(name, tld, 10)
+        domain_dta = lookup(name, tld, 'rdap', check_cfg)
 
         items_left -= 1
         processed_current_round += 1
@@ -247,15 +297,14 @@ def run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_
             print(f'Worker \033[95m{worker_id:>3}\033[00m \033[94m|\033[00m \033[93m{param}\033[00m {table} \033[94m|\033[00m '
                   f'Items \033[93m{items_amount}\033[00m Failed \033[91m{failed}\033[00m Left \033[92m{items_left}\033[00m')
 
-            if db.db_type == 'sqlite':
-                sql_update_param = f'UPDATE {table} SET avail = ?, expiry = ?, updated = ? WHERE domain = ?'
-                db.execute_many_param(sql_update_param, sql_params_array, call_id)
-            elif db.db_type == 'postgresql':
-                sql_update_param = f'UPDATE {table} SET avail = %s, expiry = %s, updated = %s WHERE domain = %s'
-                db.execute_many_param(sql_update_param, sql_params_array, call_id)
+            if result_writer.enabled():
+                result_writer.submit(table, sql_params_array)  # DB update executed by dedicated writer
             else:
-                log.error(f'Error: Incorrect database type')
-                return  # Stop further processing
+                sql_update_param = update_query(db.db_type, table)
+                if sql_update_param is None:
+                    log.error(f'Error: Incorrect database type')
+                    return  # Stop further processing
+                db.execute_many_param(sql_update_param, check_queue.params(sql_params_array), call_id)
 
             db_execute_trigger = 0
             processed_current_round = 0
@@ -0,0 +1,230 @@
+# Package: BulkDNS
+# Module: core/drop_lane
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Drop-catch fast lane (drop_lane = yes in [CHECK] config section).
+# Every RDAP response (any check mode, rdap binary or native client) is inspected for domain status values of
+# deletion phase - 'redemption period' (or 'pending restore') and 'pending delete'. Such domain is put into lane
+# (local SQLite DB shared by all threads and processes, see common/sqlite) with predicted drop time:
+#   phase start + drop_redemption_days + drop_pending_delete_days  for redemption period
+#   phase start + drop_pending_delete_days                          for pending delete
+# Phase start is 'last changed' RDAP event (registry changes the domain when it enters the phase), time when the
+# phase was seen for the first time otherwise.
+# Lane runner (proc_core option 15) polls only domains in lane, each of them by its own timer - interval is quarter
+# of the time left to predicted drop within drop_min_interval / drop_max_interval limits, so polling gets more
+# frequent as the drop approaches, and drop_min_interval after predicted drop. Domain leaves lane when it is not in
+# deletion phase any more - dropped (available) or restored. Check result is written into domain tables as usual.
+
+import concurrent.futures
+import datetime
+import time
+import logging
+
+from common import sqlite
+from core import rate_limit
+from core import lookup_cache
+from core import result_writer
+
+log = logging.getLogger('main')
+
+TABLE = 'drop_lane'
+PHASES = {'redemptionperiod': 'redemption', 'pendingrestore': 'redemption', 'pendingdelete': 'pending_delete'}
+IDLE_SLEEP = 60  # Max seconds between looks for due domains
+
+lane = None  # Lane of current process, None when drop lane is disabled
+
+
+def settings(check_cfg):
+    return {
+        'location': check_cfg.get('drop_lane_location', './db'),
+        'redemption_days': float(check_cfg.get('drop_redemption_days', 30)),
+        'pending_delete_days': float(check_cfg.get('drop_pending_delete_days', 5)),
+        'min_interval': float(check_cfg.get('drop_min_interval', 60)),
+        'max_interval': float(check_cfg.get('drop_max_interval', 86400)),
+        'workers': int(check_cfg.get('drop_workers', 4)),
+    }
+
+
+def phase_of(json_data):
+    # RDAP status values ('pending delete', 'pendingDelete', ...) -> deletion phase or None
+    statuses = {str(item).lower().replace(' ', '') for item in json_data.get('status', [])}
+    if 'pendingdelete' in statuses:
+        return 'pending_delete'
+    for status in statuses:
+        if status in PHASES:
+            return PHASES[status]
+    return None
+
+
+def last_changed(json_data):
+    # 'last changed' RDAP event as timestamp, None if missing or unknown format
+    for event in json_data.get('events', []):
+        if event.get('eventAction') == 'last changed':
+            try:
+                return datetime.datetime.fromisoformat(event['eventDate']).timestamp()
+            except (KeyError, TypeError, ValueError):
+                return None
+    return None
+
+
+class Lane:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.db = sqlite.DB('sqlite', cfg['location'], TABLE, 10)
+
+    def create(self):
+        queries = [(f'CREATE TABLE IF NOT EXISTS {TABLE} (domain TEXT PRIMARY KEY NOT NULL, name TEXT, tld TEXT, '
+                    f'phase TEXT, since REAL, predicted REAL, seen REAL, next_check REAL, checks INTEGER)', None),
+                   (f'CREATE INDEX IF NOT EXISTS {TABLE}_next_check ON {TABLE} (next_check)', None)]
+        return self.db.execute_transaction(queries, f'{TABLE} | CREATE TABLE') is not None
+
+    def interval(self, predicted, now):
+        # Quarter of time left to predicted drop, the closer the drop the more frequent polling
+        return min(self.cfg['max_interval'], max(self.cfg['min_interval'], (predicted - now) / 4))
+
+    def observe(self, domain, json_data):
+        phase = phase_of(json_data)
+        if phase is None:
+            return
+        now = time.time()
+        call_id = f'{domain} | Drop lane'
+        res = self.db.execute_single_param(f'SELECT phase, since FROM {TABLE} WHERE domain = ?', (domain,), f'{call_id} SELECT')
+        if res and res[0][0] == phase:
+            since = res[0][1]  # Phase start does not move while domain stays in the same phase
+        else:
+            changed = last_changed(json_data)
+            since = changed if changed is not None and changed <= now else now
+        days = self.cfg['pending_delete_days']
+        if phase == 'redemption':
+            days += self.cfg['redemption_days']
+        predicted = since + days * 86400
+        name, dot, tld = domain.partition('.')
+        sql_upsert_param = (f'INSERT INTO {TABLE} (domain, name, tld, phase, since, predicted, seen, next_check, checks) '
+                            f'VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0) ON CONFLICT (domain) DO UPDATE SET phase = excluded.phase, '
+                            f'since = excluded.since, predicted = excluded.predicted, seen = excluded.seen, '
+                            f'next_check = min(next_check, excluded.next_check)')
+        params = (domain, name, tld, phase, since, predicted, now, now + self.interval(predicted, now))
+        self.db.execute_single_param(sql_upsert_param, params, f'{call_id} UPSERT')
+        if not res or res[0][0] != phase:
+            log.info(f'{domain} | Drop lane | {phase} | Predicted drop {datetime.datetime.fromtimestamp(predicted, datetime.UTC):%Y-%m-%d %H:%M} UTC')
+
+    def due(self, tlds, limit):
+        marks = ', '.join('?' * len(tlds))
+        sql_select_param = (f'SELECT domain, name, tld, predicted FROM {TABLE} WHERE next_check <= ? AND tld IN ({marks}) '
+                            f'ORDER BY next_check LIMIT ?')
+        return self.db.execute_single_param(sql_select_param, (time.time(), *tlds, limit), f'{TABLE} | SELECT due') or []
+
+    def next_check(self, tlds):
+        marks = ', '.join('?' * len(tlds))
+        res = self.db.execute_single_param(f'SELECT min(next_check) FROM {TABLE} WHERE tld IN ({marks})', tuple(tlds), f'{TABLE} | SELECT next')
+        return res[0][0] if res else None
+
+    def seen(self, domain):
+        res = self.db.execute_single_param(f'SELECT seen FROM {TABLE} WHERE domain = ?', (domain,), f'{domain} | Drop lane SELECT')
+        return res[0][0] if res else None
+
+    def schedule(self, domain, next_check):
+        sql_update_param = f'UPDATE {TABLE} SET next_check = ?, checks = checks + 1 WHERE domain = ?'
+        self.db.execute_single_param(sql_update_param, (next_check, domain), f'{domain} | Drop lane UPDATE')
+
+    def remove(self, domain):
+        self.db.execute_single_param(f'DELETE FROM {TABLE} WHERE domain = ?', (domain,), f'{domain} | Drop lane DELETE')
+
+
+def start(check_cfg):
+    # Called by main process before check run. Returns settings for pool workers or None if disabled.
+    global lane
+    if check_cfg.get('drop_lane', 'no') != 'yes':
+        lane = None
+        return None
+    lane = Lane(settings(check_cfg))
+    if not lane.create():
+        log.error(f'Drop lane not available, deletion phase statuses are not tracked')
+        lane = None
+        return None
+    return lane.cfg
+
+
+def attach(cfg):
+    # Called in multi_proc pool worker initializer
+    global lane
+    lane = Lane(cfg) if cfg is not None else None
+
+
+def observe(domain, json_data):
+    # Called with every parsed RDAP response
+    if lane is not None:
+        lane.observe(domain, json_data)
+
+
+def poll(item, targets, check_cfg, stats):
+    # Single lane domain check, result is written into tables of all targets with the same TLD
+    from core import domain as domain_check  # core.domain imports RDAP engines, which import this module
+    domain_name, name, tld, predicted = item
+    started = time.time()
+    try:
+        domain_dta = domain_check.lookup(name, tld, 'rdap', check_cfg)
+    except Exception as ex:
+        log.error(f'{domain_name} | Exception: {ex}')
+        domain_dta = (domain_name, name, tld, None, None, None, -1, f'Exception: {ex}', 0)
+    stats['checked'] += 1
+    if domain_dta[6] != 0:
+        log.debug(f'{domain_name} | Drop lane check failed: {domain_dta[7]}')
+        stats['failed'] += 1
+        lane.schedule(domain_name, time.time() + lane.cfg['min_interval'])
+        return
+    rows = [(domain_dta[3], domain_dta[4], domain_dta[5], domain_dta[0])]
+    for db, tbl_names, target_tld in targets:
+        if target_tld == tld:
+            for tbl_name in tbl_names:
+                table = f'{tbl_name}_{tld}'
+                result_writer.update(db, table, rows, f'{table} | UPDATE drop lane {domain_name}')
+    seen = lane.seen(domain_name)
+    if seen is not None and seen >= started:
+        # Still in deletion phase (observe() refreshed the entry during lookup)
+        lane.schedule(domain_name, time.time() + lane.interval(predicted, time.time()))
+        return
+    lane.remove(domain_name)
+    if domain_dta[3] == 'Y':
+        stats['dropped'] += 1
+        print(f'Dropped \033[92m{domain_name}\033[00m \033[94m|\033[00m Predicted '
+              f'{datetime.datetime.fromtimestamp(predicted, datetime.UTC):%Y-%m-%d %H:%M} UTC')
+        log.info(f'{domain_name} | Dropped | Available')
+    else:
+        stats['restored'] += 1
+        log.info(f'{domain_name} | Left deletion phase | Available: {domain_dta[3]} | Expiry: {domain_dta[4]}')
+
+
+def run(targets, check_cfg):
+    # targets: [(db, tbl_names, tld)] - tables updated with lane check results. Runs until lane is empty
+    # (or KeyboardInterrupt), idle time is spent sleeping until the nearest domain timer.
+    if start(check_cfg) is None:
+        log.error(f'Drop lane is disabled (drop_lane = yes in [CHECK] config section)')
+        return
+    rate_limit.start(check_cfg)
+    lookup_cache.start({})  # Lane polls have to reach registry, cached results would hide the drop
+    tlds = sorted({target[2] for target in targets})
+    workers = max(1, lane.cfg['workers'])
+    stats = {'checked': 0, 'failed': 0, 'dropped': 0, 'restored': 0}
+    log.info(f'Drop lane | TLDs {", ".join(tlds)} | Workers {workers}')
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                due = lane.due(tlds, 4 * workers)
+                if not due:
+                    next_check = lane.next_check(tlds)
+                    if next_check is None:
+                        log.info(f'Drop lane is empty')
+                        break
+                    wait = min(IDLE_SLEEP, max(0.0, next_check - time.time()))
+                    print(f'Drop lane \033[94m|\033[00m Checked \033[92m{stats["checked"]}\033[00m Dropped '
+                          f'\033[92m{stats["dropped"]}\033[00m Restored \033[93m{stats["restored"]}\033[00m Failed '
+                          f'\033[91m{stats["failed"]}\033[00m \033[94m|\033[00m Next check in {int(wait)}s', end="\r", flush=True)
+                    time.sleep(wait)
+                    continue
+                list(executor.map(lambda item: poll(item, targets, check_cfg, stats), due))
+    except KeyboardInterrupt:
+        log.error("Caught KeyboardInterrupt, drop lane stopped")
+    log.info(f'Drop lane | Checked {stats["checked"]} | Dropped {stats["dropped"]} | Restored {stats["restored"]} | '
+             f'Failed {stats["failed"]}')
@@ -0,0 +1,206 @@
+# Package: BulkDNS
+# Module: core/lookup_cache
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Lookup results cache shared by all threads, all multi_proc workers and consecutive runs (lookup_cache = yes in
+# [CHECK] config section). RDAP / WHOIS query functions consult it before going to the network, so domain present
+# in more tables (two_letter and generic_comb), domain failing again and again or rerun after crash is not queried
+# repeatedly.
+# Results are kept in local SQLite DB (WAL, persistent connection per thread and process, see common/sqlite) keyed
+# by domain. Each outcome has its own time to live - available, taken, error (0 = outcome is not cached). Errors
+# caused by registry throttling are never cached (they say nothing about the domain).
+# Lookup threads never write into cache DB: stored results and hits (last use time, recorded only when older than
+# TOUCH_AFTER seconds) are buffered in memory and written by writer thread of each process in single transaction
+# every FLUSH_MAX_AGE seconds, when FLUSH_SIZE results are waiting or at process exit, so processes do not contend
+# for SQLite writer lock per lookup. Buffered results are visible to get() of the same process.
+# Least recently used entries are evicted by writer thread when cache grows over lookup_cache_size entries, expired
+# entries are removed at the same time (every EVICT_EVERY stored results per process).
+# Main process creates cache with start(), pool workers attach via attach() in pool initializer (see core/multi_proc).
+# Coroutines read cache via get_async() - SQLite read is executed in default thread pool executor.
+
+import multiprocessing.util
+import threading
+import atexit
+import asyncio
+import time
+import logging
+
+from common import sqlite
+from core import rate_limit
+
+log = logging.getLogger('main')
+
+TABLE = 'lookup_cache'
+EVICT_EVERY = 10000  # Stored results per process between eviction runs
+FLUSH_SIZE = 1000  # Buffered results written in single transaction
+FLUSH_MAX_AGE = 5  # seconds
+TOUCH_AFTER = 60  # seconds, precision of least recently used order
+
+cache = None  # Cache of current process, None when lookup cache is disabled
+
+
+def settings(check_cfg):
+    return {
+        'location': check_cfg.get('lookup_cache_location', './db'),
+        'ttl_available': float(check_cfg.get('lookup_cache_ttl_available', 3600)),
+        'ttl_taken': float(check_cfg.get('lookup_cache_ttl_taken', 86400)),
+        'ttl_error': float(check_cfg.get('lookup_cache_ttl_error', 300)),
+        'size': int(check_cfg.get('lookup_cache_size', 1000000)),
+    }
+
+
+class Cache:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.db = sqlite.DB('sqlite', cfg['location'], TABLE, 10)
+        self.stored = 0  # Results stored by this process since the last eviction
+        self.lock = threading.Lock()  # Buffers, shared by all threads of process
+        self.flush_lock = threading.Lock()  # Writer thread and flush at process exit
+        self.pending = {}  # domain -> row of stored result not written yet
+        self.flushing = {}  # domain -> row of stored result being written
+        self.touched = {}  # domain -> last use time of cache hit not written yet
+        self.wakeup = threading.Event()
+        self.closed = False
+        threading.Thread(target=self.writer, name='LookupCache', daemon=True).start()
+        # Buffers are written at process exit before common/sqlite closes connections (atexit handlers run in reverse
+        # order of registration), Finalize covers multi_proc pool workers where atexit handlers are not executed
+        atexit.register(self.close)
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def create(self):
+        queries = [(f'CREATE TABLE IF NOT EXISTS {TABLE} (domain TEXT PRIMARY KEY NOT NULL, avail CHARACTER(1), '
+                    f'expiry TEXT, updated TEXT, exec_code INTEGER, err_msg TEXT, expires REAL, used REAL)', None),
+                   (f'CREATE INDEX IF NOT EXISTS {TABLE}_expires ON {TABLE} (expires)', None),
+                   (f'CREATE INDEX IF NOT EXISTS {TABLE}_used ON {TABLE} (used)', None)]
+        return self.db.execute_transaction(queries, f'{TABLE} | CREATE TABLE') is not None
+
+    def ttl(self, exec_code, available, err_msg):
+        if exec_code == 0:
+            return self.cfg['ttl_available'] if available == 'Y' else self.cfg['ttl_taken']
+        if rate_limit.is_throttle(err_msg):
+            return 0
+        return self.cfg['ttl_error']
+
+    def get(self, name, tld):
+        # Cached domain data 9 items tuple (updated is time of the original lookup, 0 retries) or None
+        domain = f'{name}.{tld}'
+        now = time.time()
+        with self.lock:
+            row = self.pending.get(domain) or self.flushing.get(domain)
+        if row is not None and row[6] > now:
+            available, expiry_date, updated, exec_code, err_msg = row[1:6]
+        else:
+            sql_select_param = (f'SELECT avail, expiry, updated, exec_code, err_msg, used FROM {TABLE} '
+                                f'WHERE domain = ? AND expires > ?')
+            res = self.db.execute_single_param(sql_select_param, (domain, now), f'{domain} | Lookup cache SELECT')
+            if not res:
+                return None
+            available, expiry_date, updated, exec_code, err_msg, used = res[0]
+            if now - (used or 0) >= TOUCH_AFTER:
+                with self.lock:
+                    self.touched[domain] = now
+        log.debug(f'{domain} | Lookup cache hit: {available, expiry_date, updated, exec_code, err_msg}')
+        if exec_code != 0:
+            err_msg = f'{err_msg} (cached)'
+        return domain, name, tld, available, expiry_date, updated, exec_code, err_msg, 0
+
+    def put(self, domain_dta):
+        # Result is buffered only, writer thread writes it
+        domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count = domain_dta
+        ttl = self.ttl(exec_code, available, err_msg)
+        if ttl <= 0:
+            return
+        now = time.time()
+        row = (domain, available, None if expiry_date is None else str(expiry_date), updated, exec_code,
+               None if err_msg is None else str(err_msg), now + ttl, now)
+        with self.lock:
+            self.pending[domain] = row
+            self.touched.pop(domain, None)
+            if len(self.pending) >= FLUSH_SIZE:
+                self.wakeup.set()
+
+    def writer(self):
+        while not self.closed:
+            self.wakeup.wait(FLUSH_MAX_AGE)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                self.flushing, self.pending = self.pending, {}
+                touched, self.touched = self.touched, {}
+            if self.flushing:
+                sql_insert_param = f'INSERT OR REPLACE INTO {TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+                self.db.execute_many_param(sql_insert_param, list(self.flushing.values()), f'{TABLE} | INSERT {len(self.flushing)}')
+            if touched:
+                sql_update_param = f'UPDATE {TABLE} SET used = ? WHERE domain = ?'
+                params = [(used, domain) for domain, used in touched.items()]
+                self.db.execute_many_param(sql_update_param, params, f'{TABLE} | UPDATE used {len(touched)}')
+            self.stored += len(self.flushing)
+            with self.lock:
+                self.flushing = {}
+            if self.stored >= EVICT_EVERY:
+                self.stored = 0
+                self.evict()
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.flush()
+
+    def evict(self):
+        call_id = f'{TABLE} | EVICT'
+        queries = [(f'DELETE FROM {TABLE} WHERE expires <= ?', (time.time(),)),
+                   (f'DELETE FROM {TABLE} WHERE domain IN (SELECT domain FROM {TABLE} ORDER BY used '
+                    f'LIMIT max(0, (SELECT count(*) FROM {TABLE}) - ?))', (self.cfg['size'],))]
+        res = self.db.execute_transaction(queries, call_id)
+        if res is not None:
+            log.debug(f'{call_id} | Expired {res[0]} | Least recently used {res[1]}')
+
+
+def start(check_cfg):
+    # Called by main process before check run. Returns settings for pool workers or None if disabled.
+    global cache
+    if cache is not None:
+        cache.close()  # Cache of previous run in this process
+    if check_cfg.get('lookup_cache', 'no') != 'yes':
+        cache = None
+        return None
+    cache = Cache(settings(check_cfg))
+    if not cache.create():
+        log.error(f'Lookup cache not available, lookups are not cached')
+        cache = None
+        return None
+    cache.evict()
+    log.info(f'Lookup cache: {cache.db.db_file()} | Max entries {cache.cfg["size"]}')
+    return cache.cfg
+
+
+def attach(cfg):
+    # Called in multi_proc pool worker initializer
+    global cache
+    if cache is not None:
+        cache.close()
+    cache = Cache(cfg) if cfg is not None else None
+
+
+def get(name, tld):
+    if cache is None:
+        return None
+    return cache.get(name, tld)
+
+
+async def get_async(name, tld):
+    # get() for coroutines, SQLite read does not block event loop
+    if cache is None:
+        return None
+    return await asyncio.to_thread(cache.get, name, tld)
+
+
+def put(domain_dta):
+    # Returns domain_dta, so lookup function can end with: return lookup_cache.put(domain_dta)
+    if cache is not None:
+        cache.put(domain_dta)
+    return domain_dta
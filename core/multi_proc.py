@@ -1,7 +1,7 @@
 # Package: BulkDNS
 # Module: core/multi_proc
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-22
+# Rev: 2026-10-18
 
 import multiprocessing
 import signal
@@ -10,14 +10,26 @@ import logging
 import gc
 
 from core import domain
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+from core import drop_lane
+from core import result_writer
 
 
 log = logging.getLogger('main')
 
 
 # Below is for keyboard interrupt Signal catch
-def init_worker():
+# Rate limiter shared memory, result writer queue, lookup cache, raw archive and drop lane (created by main process)
+# are attached in each worker process
+def init_worker(rate_limit_shared, result_queue, lookup_cache_cfg, raw_archive_cfg, drop_lane_cfg):
     signal.signal(signal.SIGINT, signal.SIG_IGN)
+    rate_limit.attach(rate_limit_shared)
+    lookup_cache.attach(lookup_cache_cfg)
+    raw_archive.attach(raw_archive_cfg)
+    drop_lane.attach(drop_lane_cfg)
+    result_writer.attach(result_queue)
 
 
 def worker(task):
@@ -28,6 +40,7 @@ def worker(task):
     updated_date = task[4]
     check_type = task[5]
     protocol = task[6]
+    check_cfg = task[7]
 
     process = multiprocessing.current_process()
     worker_id = process.name[16:]  # Remove 'SpawnPoolWorker-' from thread.name()
@@ -35,9 +48,9 @@ def worker(task):
     log.debug(f'{process.name} PID {process.pid} | Task: {param} / {table} | START')
 
     if protocol == 'rdap':
-        domain.run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id)
+        domain.run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg)
     elif protocol == 'whois':
-        domain.run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id)
+        domain.run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg)
     else:
         log.error(f'Unidentified protocol: {protocol}')
         return
@@ -51,7 +64,7 @@ def worker(task):
     log.debug(f'{process.name} PID {process.pid} | Task: {param} / {table} | END')
 
 
-def multiprocess_run(db, tbl_names, tld, check_type, protocol):
+def multiprocess_run(db, tbl_names, tld, check_type, protocol, check_cfg):
     gc.enable()  # Enable automatic garbage collection.
 
     cpu = multiprocessing.cpu_count()
@@ -60,10 +73,15 @@ def multiprocess_run(db, tbl_names, tld, check_type, protocol):
 
     log.info(f'Available CPU: {cpu} | Parallel process to be executed: {processes_limit}')
     log.info(f'Preparing params data...')
-    tasks = domain.params_preparation(db, tbl_names, tld, check_type, protocol)
+    tasks = domain.params_preparation(db, tbl_names, tld, check_type, protocol, check_cfg)
 
     # Start processing
-    pool = multiprocessing.Pool(processes_limit, init_worker, maxtasksperchild=process_clean)
+    rate_limit_shared = rate_limit.start(check_cfg)
+    lookup_cache_cfg = lookup_cache.start(check_cfg)
+    raw_archive_cfg = raw_archive.start(check_cfg)
+    drop_lane_cfg = drop_lane.start(check_cfg)
+    result_queue = result_writer.start(db, check_cfg, process=True)
+    pool = multiprocessing.Pool(processes_limit, init_worker, (rate_limit_shared, result_queue, lookup_cache_cfg, raw_archive_cfg, drop_lane_cfg), maxtasksperchild=process_clean)
     result = pool.map_async(worker, tasks, chunksize=1)  # chunksize - batch of params for each worker (group tasks and pass each group to worker)
     try:
         # This loop is to monitor and identify Keyboard interrupt exception
@@ -77,6 +95,7 @@ def multiprocess_run(db, tbl_names, tld, check_type, protocol):
         log.info("Multiprocessing finished")
         pool.close()
         pool.join()
+    result_writer.stop()  # Save results submitted by workers
 
     # # Old code that is not able to handle Keyboard Interrupt. Just for reference.
     # with multiprocessing.Pool(processes=max_processes) as pool:
@@ -1,7 +1,7 @@
 # Package: BulkDNS
 # Module: core/multi_thread
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-16
+# Rev: 2026-10-18
 
 
 import concurrent.futures
@@ -11,6 +11,11 @@ import logging
 import gc
 
 from core import domain
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+from core import drop_lane
+from core import result_writer
 
 log = logging.getLogger('main')
 
@@ -23,6 +28,7 @@ def worker(task):
     updated_date = task[4]
     check_type = task[5]
     protocol = task[6]
+    check_cfg = task[7]
 
     thread = threading.current_thread()
     worker_id = thread.name[21:]  # Remove 'ThreadPoolExecutor-0_' from thread.name()
@@ -31,9 +37,9 @@ def worker(task):
     log.debug(f'Worker {worker_id} | TID {thread_tid} | Task {param} / {table} | START')
 
     if protocol == 'rdap':
-        domain.run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id)
+        domain.run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg)
     elif protocol == 'whois':
-        domain.run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id)
+        domain.run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg)
     else:
         log.error(f'Unidentified protocol: {protocol}')
         return
@@ -63,7 +69,7 @@ def create_threads(thread_limit, tasks):
                 # pass
 
 
-def multithreading_run(db, tbl_names, tld, check_type, protocol):
+def multithreading_run(db, tbl_names, tld, check_type, protocol, check_cfg):
     gc.enable()  # Enable automatic garbage collection.
     
     cpu = int(multiprocessing.cpu_count())
@@ -76,8 +82,16 @@ def multithreading_run(db, tbl_names, tld, check_type, protocol):
         log.error (f'Unidentified domain check protocol: {protocol}')        
         return
 
+    rate_limit.start(check_cfg)  # Shared by all threads
+    lookup_cache.start(check_cfg)
+    raw_archive.start(check_cfg)
+    drop_lane.start(check_cfg)
     log.info(f'Available CPU: {cpu} | Parallel threads to be executed: {thread_limit}')
     log.info(f'Preparing params data...')
-    tasks = domain.params_preparation(db, tbl_names, tld, check_type, protocol)
+    tasks = domain.params_preparation(db, tbl_names, tld, check_type, protocol, check_cfg)
     log.info(f'Creating threads...')
-    create_threads(thread_limit, tasks)
+    result_writer.start(db, check_cfg)
+    try:
+        create_threads(thread_limit, tasks)
+    finally:
+        result_writer.stop()  # Save pending results also on keyboard interrupt
@@ -0,0 +1,215 @@
+# Package: BulkDNS
+# Module: core/pipeline
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Streaming producer/consumer domain check, alternative to tasks of claim batches (domain.params_preparation) where
+# every task materializes all its domains at once and lookups of the task are executed by single worker.
+# Pipeline has three stages connected with bounded queues:
+#  - reader thread streams domains to be checked table by table claiming pages of due domains from check queue
+#    (core/check_queue) and applies DNS pre-filter per page if enabled,
+#  - pool of lookup worker threads executes RDAP / WHOIS checks (engine as configured in [CHECK] config section),
+#  - writer thread (core/result_writer loop) collects results and executes DB updates in batches.
+# Bounded queues keep memory flat (reader waits when workers are busy) and all workers stay busy until the end of run.
+# Tables kept in dense status store (common/dense) are read by vectorized scan of store arrays instead of DB pages
+# and their results are written into the store.
+
+import threading
+import multiprocessing
+import queue
+import datetime
+import logging
+import time
+import gc
+
+from core import domain
+from core import dns_filter
+from core import check_queue
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+from core import drop_lane
+from core import result_writer
+
+log = logging.getLogger('main')
+
+STOP = None  # End of stream marker put to candidates queue
+
+
+class Stats:
+    # Counters shared by reader, lookup workers, writer and progress printer - += of dict item is not atomic
+    def __init__(self, *names):
+        self.lock = threading.Lock()
+        self.counts = dict.fromkeys(names, 0)
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def __getitem__(self, name):
+        return self.counts[name]
+
+
+def put(q, item, stop_event):
+    # Blocking put which gives up when pipeline is stopped (e.g. KeyboardInterrupt in main thread)
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def db_pages(db, table, check_type, page_size, lease, started, stop_event):
+    # Pages of (name, tld, domain, expiry) rows to be checked from DB table, claimed from check queue by due time.
+    # Only domains due before pipeline start are claimed, so domains failed in this run are not claimed again.
+    if not check_queue.prepare(db, table):
+        log.error(f'{table} | Check queue not available. Skipping...')
+        return
+    while not stop_event.is_set():
+        page = check_queue.claim(db, table, check_type, page_size, lease, started)
+        if not page:
+            break
+        yield page
+
+
+def store_pages(store, check_type, page_size, stop_event):
+    # Pages of (name, tld, domain, expiry) rows to be checked from dense status store
+    exp_date, updated_date = domain.check_dates()
+    for ranks in store.pages(check_type, exp_date, updated_date, page_size):
+        if stop_event.is_set():
+            break
+        yield store.rows(ranks)
+
+
+def reader(db, tables, check_type, check_cfg, page_size, candidates, workers, stop_event, stats, stores):
+    dns_prefilter = check_cfg.get('dns_prefilter', 'no') == 'yes'
+    lease = check_queue.settings(check_cfg)['lease']
+    started = check_queue.now_utc().strftime(check_queue.TIME_FORMAT)
+    try:
+        for table in tables:
+            store = stores.get(table)
+            leases = []
+            if store is not None:
+                pages = store_pages(store, check_type, page_size, stop_event)
+            else:
+                pages = db_pages(db, table, check_type, page_size, lease, started, stop_event)
+            for page in pages:
+                stats.add('read', len(page))
+                if dns_prefilter:
+                    delegated, page = dns_filter.prefilter(page, check_cfg)
+                    if store is not None:
+                        store.mark_delegated(delegated)
+                    else:
+                        domain.dns_mark_delegated(db, table, 'pipeline', delegated)
+                    stats.add('delegated', len(delegated))
+                if store is None:
+                    # Rows of previous page may still be queued, checked or waiting for DB update
+                    leases = leases[-1:] + [check_queue.Lease(db, table, page, lease)]
+                for item in page:
+                    for page_lease in leases:
+                        page_lease.keep()  # Rows waiting for free queue slot stay claimed
+                    if not put(candidates, (table, item[0], item[1]), stop_event):
+                        return
+            log.info(f'{table} | All domains to be checked read | Read so far {stats["read"]}')
+    except Exception as ex:
+        log.error(f'Reader | Exception: {ex}')
+    finally:
+        # One end marker per lookup worker
+        for _ in range(workers):
+            if not put(candidates, STOP, stop_event):
+                break
+        log.debug(f'Reader | END')
+
+
+def lookup_worker(protocol, check_cfg, candidates, results, stop_event, stats):
+    while not stop_event.is_set():
+        try:
+            item = candidates.get(timeout=1)
+        except queue.Empty:
+            continue
+        if item is STOP:
+            break
+        table, name, tld = item
+        try:
+            domain_dta = domain.lookup(name, tld, protocol, check_cfg)
+        except Exception as ex:
+            log.error(f'{name}.{tld} | Exception: {ex}')
+            stats.add('failed')
+            continue
+        if domain_dta[6] == 0:
+            log.debug(f'{domain_dta[0]} | Domain available: {domain_dta[3]} | Retries: {domain_dta[8]}')
+            stats.add('checked')
+            # Checked domain is passed to writer also when pipeline is being stopped
+            results.put((table, [(domain_dta[3], domain_dta[4], domain_dta[5], domain_dta[0])]))
+        else:
+            log.error(f'{domain_dta[0]} | Error getting domain data after {domain_dta[8]} retries: {domain_dta[7]}')
+            stats.add('failed')
+
+
+def pipeline_run(db, tbl_names, tld, check_type, protocol, check_cfg, stores=None):
+    # stores - {table: common.dense.Store} for tables kept in dense status store instead of DB
+    gc.enable()  # Enable automatic garbage collection.
+
+    cpu = int(multiprocessing.cpu_count())
+
+    if protocol == 'rdap':
+        default_workers = 2 * cpu
+    elif protocol == 'whois':
+        default_workers = 12 * cpu
+    else:
+        log.error(f'Unidentified domain check protocol: {protocol}')
+        return
+
+    workers = int(check_cfg.get('pipeline_workers', 0)) or default_workers
+    page_size = int(check_cfg.get('pipeline_page_size', 1000))
+    queue_size = int(check_cfg.get('pipeline_queue_size', 0)) or 4 * workers
+
+    rate_limit.start(check_cfg)  # Shared by all threads
+    lookup_cache.start(check_cfg)
+    raw_archive.start(check_cfg)
+    drop_lane.start(check_cfg)
+    tables = [f'{tbl_name}_{tld}' for tbl_name in tbl_names]
+    stores = stores or {}
+    candidates = queue.Queue(maxsize=queue_size)
+    results = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    stats = Stats('read', 'delegated', 'checked', 'failed', 'written')
+    writer_cfg = result_writer.settings(check_cfg)
+
+    log.info(f'Available CPU: {cpu} | Lookup worker threads: {workers} | Page size: {page_size} | Queue size: {queue_size}')
+
+    threads = [threading.Thread(target=reader, name='Reader',
+                                args=(db, tables, check_type, check_cfg, page_size, candidates, workers, stop_event, stats, stores))]
+    for i in range(workers):
+        threads.append(threading.Thread(target=lookup_worker, name=f'Lookup-{i}',
+                                        args=(protocol, check_cfg, candidates, results, stop_event, stats)))
+    writer = threading.Thread(target=result_writer.run, name='Writer',
+                              args=(db, results, writer_cfg['batch_size'], writer_cfg['max_latency'], stats, stores))
+
+    start = time.time()
+    writer.start()
+    for thread in threads:
+        thread.start()
+    try:
+        # Join with timeout, so main thread can catch KeyboardInterrupt and print progress
+        while any(thread.is_alive() for thread in threads):
+            next(thread for thread in threads if thread.is_alive()).join(timeout=10)
+            elapsed = str(datetime.timedelta(seconds=int(time.time() - start)))
+            print(f'Pipeline \033[93m{protocol}\033[00m {tld} \033[94m|\033[00m Read \033[91m{stats["read"]}\033[00m '
+                  f'DNS delegated \033[92m{stats["delegated"]}\033[00m Checked \033[92m{stats["checked"]}\033[00m '
+                  f'Saved \033[92m{stats["written"]}\033[00m Failed \033[91m{stats["failed"]}\033[00m '
+                  f'\033[94m|\033[00m Queued \033[93m{candidates.qsize()}\033[00m \033[94m|\033[00m Elapsed {elapsed}')
+    except KeyboardInterrupt:
+        log.error("Caught KeyboardInterrupt, stopping pipeline (checked domains are still saved)")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+    # All lookups finished, write what is left in writer batches
+    results.put(result_writer.STOP)
+    writer.join()
+
+    log.info(f'Read {stats["read"]} | DNS delegated {stats["delegated"]} | Checked {stats["checked"]} | '
+             f'Saved {stats["written"]} | Failed {stats["failed"]}')
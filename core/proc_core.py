@@ -1,7 +1,7 @@
 # Package: BulkDNS
 # Module: core/proc_core
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-16
+# Rev: 2026-10-18
 
 import logging
 
@@ -10,6 +10,9 @@ from common import postgresql
 from core import single_proc
 from core import multi_proc
 from core import multi_thread
+from core import async_proc
+from core import pipeline
+from core import drop_lane
 
 log = logging.getLogger('main')
 
@@ -20,6 +23,9 @@ def run(config_dta):
     tld_domain = config_dta['DOMAIN']['tld']
     # remove spaces and split key/value(string) to list using comma as separator of items
     tbl_domain_names = config_dta['DOMAIN']['tbl_names'].replace(" ", "").split(",")
+    # Tables kept in dense status store instead of DB (checked by pipeline mode only)
+    tbl_dense_names = [item for item in config_dta['DOMAIN'].get('dense_tables', '').replace(" ", "").split(",") if item]
+    dense_location = config_dta['DOMAIN'].get('dense_location', './db/dense')
 
     db_dict_type = config_dta['DICTIONARY']['db_type']
     db_dict_name = config_dta['DICTIONARY']['db_name']
@@ -30,18 +36,24 @@ def run(config_dta):
     db_retry_limit = int(config_dta['DEFAULT']['db_retry_limit'])
     db_retry_sleep_time = int(config_dta['DEFAULT']['db_retry_sleep_time'])
 
+    # Domain check engines settings, passed down to workers as plain dict (config section object is not picklable)
+    check_cfg = dict(config_dta['CHECK'])
+
     # Prepare default domain db object
     if db_domain_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
-        db_domain = sqlite.DB(db_domain_type, db_path, db_domain_name, db_retry_limit)
+        db_pragmas = sqlite.settings(cfg_db)
+        db_domain = sqlite.DB(db_domain_type, db_path, db_domain_name, db_retry_limit, db_pragmas)
     elif db_domain_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         db_host = cfg_db['db_host']
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
-        db_domain = postgresql.DB(db_domain_type, db_domain_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
+        db_domain = postgresql.DB(db_domain_type, db_domain_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -50,14 +62,17 @@ def run(config_dta):
     if db_dict_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
-        db_dict = sqlite.DB(db_dict_type, db_path, db_dict_name, db_retry_limit)
+        db_pragmas = sqlite.settings(cfg_db)
+        db_dict = sqlite.DB(db_dict_type, db_path, db_dict_name, db_retry_limit, db_pragmas)
     elif db_dict_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         db_host = cfg_db['db_host']
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
-        db_dict = postgresql.DB(db_dict_type, db_dict_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
+        db_dict = postgresql.DB(db_dict_type, db_dict_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -68,45 +83,115 @@ def run(config_dta):
     log.info('4 - Available domains re-check RDAP [single processing]')
     log.info('5 - Available domains re-check RDAP [multiprocessing]')
     log.info('6 - Available domains re-check WHOIS [multithreading]')
+    log.info('7 - New and expiring domains RDAP [asyncio]')
+    log.info('8 - New and expiring domains WHOIS [asyncio]')
+    log.info('9 - Available domains re-check RDAP [asyncio]')
+    log.info('10 - Available domains re-check WHOIS [asyncio]')
+    log.info('11 - New and expiring domains RDAP [pipeline]')
+    log.info('12 - New and expiring domains WHOIS [pipeline]')
+    log.info('13 - Available domains re-check RDAP [pipeline]')
+    log.info('14 - Available domains re-check WHOIS [pipeline]')
+    log.info('15 - Drop-catch fast lane RDAP (redemption / pending delete domains)')
 
     log.info('Choose option and press Enter: ')
     user_option = input()
 
+    stores = {}
+    if tbl_dense_names:
+        if user_option in ('11', '12', '13', '14'):
+            from common import name_gen  # NumPy is needed by dense tables only
+            from common import dense
+            stores = dense.open_stores(dense_location, tbl_dense_names, tld_domain, name_gen.load_patterns(config_dta))
+        else:
+            log.warning(f'Dense tables are checked by pipeline mode only, skipping: {", ".join(tbl_dense_names)}')
+            tbl_domain_names = [item for item in tbl_domain_names if item not in tbl_dense_names]
+
     if user_option == '1':
         protocol = 'rdap'
         check_type = 'expiring'
-        single_proc.single_process_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol)
-        single_proc.single_process_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol)
+        single_proc.single_process_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        single_proc.single_process_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
 
     elif user_option == '2':
         protocol = 'rdap'
         check_type = 'expiring'
-        multi_proc.multiprocess_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol)
-        multi_proc.multiprocess_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol)
+        multi_proc.multiprocess_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        multi_proc.multiprocess_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
 
     elif user_option == '3':
         protocol = 'whois'
         check_type = 'expiring'
-        multi_thread.multithreading_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol)
-        multi_thread.multithreading_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol)
+        multi_thread.multithreading_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        multi_thread.multithreading_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
     
     elif user_option == '4':
         protocol = 'rdap'
         check_type = 'recheck'
-        single_proc.single_process_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol)
-        single_proc.single_process_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol)
+        single_proc.single_process_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        single_proc.single_process_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
 
     elif user_option == '5':
         protocol = 'rdap'
         check_type = 'recheck'
-        multi_proc.multiprocess_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol)
-        multi_proc.multiprocess_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol)
+        multi_proc.multiprocess_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        multi_proc.multiprocess_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
 
     elif user_option == '6':
         protocol = 'whois'
         check_type = 'recheck'
-        multi_thread.multithreading_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol)
-        multi_thread.multithreading_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol)
+        multi_thread.multithreading_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        multi_thread.multithreading_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '7':
+        protocol = 'rdap'
+        check_type = 'expiring'
+        async_proc.async_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        async_proc.async_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '8':
+        protocol = 'whois'
+        check_type = 'expiring'
+        async_proc.async_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        async_proc.async_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '9':
+        protocol = 'rdap'
+        check_type = 'recheck'
+        async_proc.async_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        async_proc.async_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '10':
+        protocol = 'whois'
+        check_type = 'recheck'
+        async_proc.async_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg)
+        async_proc.async_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '11':
+        protocol = 'rdap'
+        check_type = 'expiring'
+        pipeline.pipeline_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg, stores)
+        pipeline.pipeline_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '12':
+        protocol = 'whois'
+        check_type = 'expiring'
+        pipeline.pipeline_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg, stores)
+        pipeline.pipeline_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '13':
+        protocol = 'rdap'
+        check_type = 'recheck'
+        pipeline.pipeline_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg, stores)
+        pipeline.pipeline_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '14':
+        protocol = 'whois'
+        check_type = 'recheck'
+        pipeline.pipeline_run(db_domain, tbl_domain_names, tld_domain, check_type, protocol, check_cfg, stores)
+        pipeline.pipeline_run(db_dict, tbl_dict_names, tld_dict, check_type, protocol, check_cfg)
+
+    elif user_option == '15':
+        drop_lane.run([(db_domain, tbl_domain_names, tld_domain), (db_dict, tbl_dict_names, tld_dict)], check_cfg)
 
     else:
         log.info('Incorrect option picked')
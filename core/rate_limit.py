@@ -0,0 +1,182 @@
+# Package: BulkDNS
+# Module: core/rate_limit
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Rate limiter per registry / server (e.g. 'rdap:com', 'whois:com'), shared by all threads and all multi_proc workers.
+# Token bucket per key with AIMD rate adjustment: each successful query adds 'rate_increase' to the rate, throttling
+# signal (HTTP 429, WhoisQuotaExceeded etc.) multiplies the rate by 'rate_decrease' and pauses the key for
+# 'rate_backoff' seconds. This way aggregate query rate settles right under registry limit instead of
+# hammering it with retries.
+# Buckets live in shared memory (multiprocessing RawArray) guarded by multiprocessing Lock. Main process creates
+# them with start(), pool workers attach via attach() in pool initializer (see core/multi_proc).
+
+import multiprocessing
+import hashlib
+import asyncio
+import time
+import re
+import logging
+
+log = logging.getLogger('main')
+
+SLOTS = 256  # Max amount of keys (registries / servers)
+# Bucket values layout in shared array (per slot)
+TOKENS = 0
+RATE = 1
+LAST = 2
+BACKOFF_UNTIL = 3
+FIELDS = 4
+
+# 429 only in HTTP status context and quota only as 'quota exceeded' - domain names (429.com, quota.net) in error
+# messages must not throttle the whole registry key
+THROTTLE_RE = re.compile(r'(?:HTTP(?:/[\d.]+)?|status(?:\s*code)?|returned)\s*:?\s*429\b|too many requests|quota\s*exceeded|'
+                         r'rate limit|limit exceeded', re.IGNORECASE)
+
+limiter = None  # Limiter of current process, None when rate limiting is disabled
+
+
+def settings(check_cfg):
+    return {
+        'initial': float(check_cfg.get('rate_initial', 10)),
+        'minimum': float(check_cfg.get('rate_min', 0.5)),
+        'maximum': float(check_cfg.get('rate_max', 50)),
+        'burst': float(check_cfg.get('rate_burst', 10)),
+        'increase': float(check_cfg.get('rate_increase', 0.05)),
+        'decrease': float(check_cfg.get('rate_decrease', 0.5)),
+        'backoff': float(check_cfg.get('rate_backoff', 5)),
+    }
+
+
+def is_throttle(err_msg):
+    return err_msg is not None and THROTTLE_RE.search(str(err_msg)) is not None
+
+
+def key_hash(key):
+    # Stable across processes (built-in hash() is randomized per process); 0 marks empty slot
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') | 1
+
+
+class Limiter:
+    def __init__(self, cfg, keys=None, values=None, lock=None):
+        self.cfg = cfg
+        self.keys = keys if keys is not None else multiprocessing.RawArray('Q', SLOTS)
+        self.values = values if values is not None else multiprocessing.RawArray('d', SLOTS * FIELDS)
+        self.lock = lock if lock is not None else multiprocessing.Lock()
+        self.slot_cache = {}  # key -> slot index (slots are never reassigned)
+
+    def shared(self):
+        # Picklable state for multiprocessing pool initializer
+        return self.cfg, self.keys, self.values, self.lock
+
+    def slot(self, key, now):
+        # Must be called with lock held
+        index = self.slot_cache.get(key)
+        if index is not None:
+            return index
+        hashed = key_hash(key)
+        for probe in range(SLOTS):
+            index = (hashed + probe) % SLOTS
+            if self.keys[index] == hashed:
+                break
+            if self.keys[index] == 0:
+                self.keys[index] = hashed
+                base = index * FIELDS
+                self.values[base + TOKENS] = self.cfg['burst']
+                self.values[base + RATE] = self.cfg['initial']
+                self.values[base + LAST] = now
+                self.values[base + BACKOFF_UNTIL] = 0.0
+                break
+        else:
+            raise RuntimeError('Rate limiter slots exhausted')
+        self.slot_cache[key] = index
+        return index
+
+    def take(self, key):
+        # Takes token if available. Returns 0 on success, otherwise seconds to wait before next attempt.
+        with self.lock:
+            now = time.time()
+            base = self.slot(key, now) * FIELDS
+            values = self.values
+            rate = values[base + RATE]
+            tokens = min(self.cfg['burst'], values[base + TOKENS] + (now - values[base + LAST]) * rate)
+            values[base + LAST] = now
+            if now < values[base + BACKOFF_UNTIL]:
+                values[base + TOKENS] = tokens
+                return values[base + BACKOFF_UNTIL] - now
+            if tokens >= 1.0:
+                values[base + TOKENS] = tokens - 1.0
+                return 0.0
+            values[base + TOKENS] = tokens
+            return (1.0 - tokens) / rate
+
+    def acquire(self, key):
+        while True:
+            wait = self.take(key)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, key):
+        while True:
+            wait = self.take(key)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def success(self, key):
+        # Additive increase
+        with self.lock:
+            base = self.slot(key, time.time()) * FIELDS
+            self.values[base + RATE] = min(self.cfg['maximum'], self.values[base + RATE] + self.cfg['increase'])
+
+    def throttled(self, key):
+        # Multiplicative decrease and pause for all workers using the key
+        with self.lock:
+            now = time.time()
+            base = self.slot(key, now) * FIELDS
+            rate = max(self.cfg['minimum'], self.values[base + RATE] * self.cfg['decrease'])
+            self.values[base + RATE] = rate
+            self.values[base + TOKENS] = 0.0
+            self.values[base + BACKOFF_UNTIL] = max(self.values[base + BACKOFF_UNTIL], now + self.cfg['backoff'])
+        log.debug(f'{key} | Throttled by registry | Rate decreased to {rate:.2f}/s')
+
+
+def start(check_cfg):
+    # Called by main process before check run. Returns shared state for pool workers or None if disabled.
+    global limiter
+    if check_cfg.get('rate_limit', 'no') != 'yes':
+        limiter = None
+        return None
+    if limiter is None:
+        limiter = Limiter(settings(check_cfg))
+    return limiter.shared()
+
+
+def attach(shared):
+    # Called in multi_proc pool worker initializer
+    global limiter
+    limiter = Limiter(*shared) if shared is not None else None
+
+
+def acquire(key):
+    if limiter is not None:
+        limiter.acquire(key)
+
+
+async def acquire_async(key):
+    if limiter is not None:
+        await limiter.acquire_async(key)
+
+
+def report(key, exec_code, err_msg):
+    # Feedback after each query. Returns True if query was throttled (caller should not add its own sleep).
+    if limiter is None:
+        return False
+    if exec_code == 0:
+        limiter.success(key)
+        return False
+    if is_throttle(err_msg):
+        limiter.throttled(key)
+        return True
+    return False
@@ -0,0 +1,170 @@
+# Package: BulkDNS
+# Module: core/raw_archive
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Raw response archive (raw_archive = yes in [CHECK] config section). Every RDAP JSON / WHOIS text payload is
+# appended to compressed segment files, so other fields (status codes, registrar, nameservers, ...) can be parsed
+# later locally instead of querying registries again.
+# Layout in raw_archive_location, each process writes its own segments (no locking between processes):
+#   <started>-<pid>-<seq>.gz  - concatenated gzip members (blocks), each of them JSON lines records
+#                               {"domain", "protocol", "time", "code", "payload"} - code is exit code of
+#                               rdap / whois binary or HTTP status of native RDAP client
+#   <started>-<pid>-<seq>.idx - offset index, line per record: domain, protocol, time, block offset in segment file,
+#                               record offset and length in uncompressed block (tab separated)
+# Block is written when it reaches raw_archive_block_size uncompressed bytes, when its oldest record waits
+# BLOCK_MAX_AGE seconds or at process exit. Segment is rotated when it reaches raw_archive_segment_size bytes.
+# Single record is read by decompressing just its block (index(), read()), whole archive is read sequentially by
+# records() - gzip reads concatenated members as single stream.
+
+import multiprocessing.util
+import threading
+import datetime
+import json
+import gzip
+import zlib
+import glob
+import time
+import os
+import logging
+
+log = logging.getLogger('main')
+
+BLOCK_MAX_AGE = 60  # seconds
+
+sink = None  # Archive writer of current process, None when raw archive is disabled
+
+
+def settings(check_cfg):
+    return {
+        'location': check_cfg.get('raw_archive_location', './db/raw'),
+        'segment_size': int(check_cfg.get('raw_archive_segment_size', 268435456)),
+        'block_size': int(check_cfg.get('raw_archive_block_size', 1048576)),
+    }
+
+
+class Sink:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.lock = threading.Lock()  # Shared by all threads of process
+        self.prefix = f'{datetime.datetime.now(datetime.UTC).strftime("%Y%m%d%H%M%S")}-{os.getpid()}'
+        self.seq = 0
+        self.segment = None  # Current segment file path without extension
+        self.size = 0  # Current segment file size
+        self.block = []  # Encoded records of current block
+        self.entries = []  # Index lines of current block (without block offset)
+        self.block_bytes = 0
+        self.block_started = 0.0
+        os.makedirs(cfg['location'], exist_ok=True)
+        # Runs at process exit, also in multi_proc pool workers (atexit handlers are not executed there)
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    def append(self, protocol, domain, code, payload):
+        if payload is None:
+            return
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8', errors='replace')
+        now = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%d %H:%M:%S")
+        record = json.dumps({'domain': domain, 'protocol': protocol, 'time': now, 'code': code,
+                             'payload': payload}, ensure_ascii=False).encode('utf-8') + b'\n'
+        with self.lock:
+            if not self.block:
+                self.block_started = time.monotonic()
+            self.entries.append((domain, protocol, now, self.block_bytes, len(record)))
+            self.block.append(record)
+            self.block_bytes += len(record)
+            if (self.block_bytes >= self.cfg['block_size']
+                    or time.monotonic() - self.block_started >= BLOCK_MAX_AGE):
+                self.write_block()
+
+    def write_block(self):
+        # Must be called with lock held
+        if not self.block:
+            return
+        if self.segment is None or self.size >= self.cfg['segment_size']:
+            self.seq += 1
+            self.segment = os.path.join(self.cfg['location'], f'{self.prefix}-{self.seq:04d}')
+            self.size = 0
+            log.debug(f'Raw archive segment: {self.segment}.gz')
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 - complete gzip member
+        data = compressor.compress(b''.join(self.block)) + compressor.flush()
+        try:
+            with open(f'{self.segment}.gz', 'ab') as file:
+                file.write(data)
+            # Index is written after data, so every index line points to complete block
+            with open(f'{self.segment}.idx', 'a', encoding='utf-8') as file:
+                file.writelines(f'{domain}\t{protocol}\t{stored}\t{self.size}\t{offset}\t{length}\n'
+                                for domain, protocol, stored, offset, length in self.entries)
+        except OSError as err:
+            log.error(f'Raw archive block of {len(self.entries)} records not written: {err}')
+        self.size += len(data)
+        self.block = []
+        self.entries = []
+        self.block_bytes = 0
+
+    def flush(self):
+        with self.lock:
+            self.write_block()
+
+
+def start(check_cfg):
+    # Called by main process before check run. Returns settings for pool workers or None if disabled.
+    global sink
+    if check_cfg.get('raw_archive', 'no') != 'yes':
+        sink = None
+        return None
+    if sink is None:
+        sink = Sink(settings(check_cfg))
+        log.info(f'Raw archive: {os.path.abspath(sink.cfg["location"])}')
+    return sink.cfg
+
+
+def attach(cfg):
+    # Called in multi_proc pool worker initializer
+    global sink
+    sink = Sink(cfg) if cfg is not None else None
+
+
+def append(protocol, domain, code, payload):
+    if sink is not None:
+        sink.append(protocol, domain, code, payload)
+
+
+# Readers for analytics jobs
+
+def index(location, protocol=None):
+    # {domain: (segment .gz path, block offset, record offset, length)} of the latest archived record of each domain
+    entries = {}
+    latest = {}  # domain -> time of record in entries (segments of more processes overlap in time)
+    for idx_file in sorted(glob.glob(os.path.join(location, '*.idx'))):
+        segment = f'{idx_file[:-4]}.gz'
+        with open(idx_file, encoding='utf-8') as file:
+            for line in file:
+                domain, record_protocol, stored, block, offset, length = line.rstrip('\n').split('\t')
+                if (protocol is None or protocol == record_protocol) and stored >= latest.get(domain, ''):
+                    entries[domain] = (segment, int(block), int(offset), int(length))
+                    latest[domain] = stored
+    return entries
+
+
+def read(entry):
+    # Single record by index entry - only its block is decompressed
+    segment, block, offset, length = entry
+    decompressor = zlib.decompressobj(31)
+    data = b''
+    with open(segment, 'rb') as file:
+        file.seek(block)
+        while len(data) < offset + length and not decompressor.eof:
+            chunk = file.read(65536)
+            if not chunk:
+                break
+            data += decompressor.decompress(chunk)
+    return json.loads(data[offset:offset + length])
+
+
+def records(location):
+    # All archived records, segment by segment in order of writing
+    for segment in sorted(glob.glob(os.path.join(location, '*.gz'))):
+        with gzip.open(segment, 'rb') as file:
+            for line in file:
+                yield json.loads(line)
@@ -1,7 +1,7 @@
 # Package: BulkDNS
 # Module: core/rdap
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-22
+# Rev: 2026-10-18
 
 import subprocess
 import json
@@ -10,6 +10,10 @@ import datetime
 import random
 import logging
 
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+from core import drop_lane
 
 log = logging.getLogger('main')
 
@@ -42,16 +46,18 @@ def rdap(domain):
     return cmd_code, cmd_output
 
 
-def rdap_run(domain):
+# Interpretation of rdap binary result (cmd_code, cmd_output). Shared with asyncio subprocess engine (core/async_proc).
+# Deletion phase statuses of the domain are passed to drop-catch lane (core/drop_lane).
+def rdap_parse(res, domain=None):
     exec_code = None
     available = None
     expiry_date = None
     err_msg = None
 
-    res = rdap(domain)
-
     if res[0] == 0: # Executed correctly
         json_data = json.loads(res[1])
+        if domain is not None:
+            drop_lane.observe(domain, json_data)
         if json_data["events"][1]['eventAction'] == 'expiration':
             exec_code = 0
             available = 'N'
@@ -80,7 +86,17 @@ def rdap_run(domain):
     return exec_code, available, expiry_date, err_msg
 
 
+def rdap_run(domain):
+    res = rdap(domain)
+    raw_archive.append('rdap', domain, res[0], res[1])
+    return rdap_parse(res, domain)
+
+
 def query(name, tld, retry):
+    cached = lookup_cache.get(name, tld)
+    if cached is not None:
+        return cached
+
     available = None
     expiry_date = None
     updated = None
@@ -93,23 +109,28 @@ def query(name, tld, retry):
     if retry < 0:
         retry = 0
 
+    limit_key = f'rdap:{tld}'
+
     while retry_count <= retry:
 
+        rate_limit.acquire(limit_key)
         res = rdap_run(domain)
 
         available = res[1]
         expiry_date = res[2]
         exec_code = res[0]
         err_msg = res[3]
+        throttled = rate_limit.report(limit_key, exec_code, err_msg)
 
         if exec_code == 0:
             dt = datetime.datetime.now(datetime.UTC)
             updated = dt.strftime("%Y-%m-%d %H:%M:%S")
             break
         else:
-            time.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
+            if not throttled:  # Throttled key is already paused by rate limiter
+                time.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
             retry_count += 1
             updated = None
 
     log.debug(f'{domain} | Returning domain data: {domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count}')
-    return domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count
+    return lookup_cache.put((domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count))
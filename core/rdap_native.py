@@ -0,0 +1,294 @@
+# Package: BulkDNS
+# Module: core/rdap_native
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# In-process asyncio RDAP client, alternative to core/rdap which forks external 'rdap -r' binary for every domain.
+# Client keeps HTTP/1.1 keep-alive connections open per RDAP server (scheme, host, port) and reuses them between
+# queries, so TCP and TLS handshakes are done once per connection instead of once per domain.
+# RDAP base URL for TLD is taken from IANA bootstrap file (RFC 9224) or from 'rdap_servers' config override
+# (e.g. com:http://127.0.0.1:8080/ to run against local stand-in RDAP server).
+# query() returns the same 9 items tuple as rdap.query(), so it can be used as drop-in replacement.
+
+import asyncio
+import ssl
+import json
+import datetime
+import random
+import threading
+import urllib.parse
+import logging
+
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+from core import drop_lane
+
+log = logging.getLogger('main')
+
+BOOTSTRAP_URL = 'https://data.iana.org/rdap/dns.json'
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+REDIRECT_LIMIT = 5
+
+
+def parse_servers(value):
+    # 'com:http://127.0.0.1:8080/, net:https://rdap.example/' -> {'com': 'http://127.0.0.1:8080/', 'net': ...}
+    servers = {}
+    if not value:
+        return servers
+    for item in value.replace(" ", "").split(","):
+        if not item:
+            continue
+        tld, url = item.split(":", 1)
+        servers[tld.lower()] = url
+    return servers
+
+
+def client_settings(check_cfg):
+    # Translate [CHECK] config section items into Client() keyword arguments
+    if check_cfg is None:
+        check_cfg = {}
+    return {
+        'servers': parse_servers(check_cfg.get('rdap_servers', '')),
+        'bootstrap_url': check_cfg.get('rdap_bootstrap', '') or BOOTSTRAP_URL,
+        'max_connections': int(check_cfg.get('rdap_connections', 4)),
+        'timeout': float(check_cfg.get('rdap_timeout', 30)),
+    }
+
+
+class Client:
+    def __init__(self, servers=None, bootstrap_url=BOOTSTRAP_URL, max_connections=4, timeout=30.0):
+        self.servers = servers or {}
+        self.bootstrap_url = bootstrap_url
+        self.max_connections = max_connections  # Max parallel connections to single RDAP server
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()  # Shared by all connections of this client
+        self.bootstrap = None  # tld -> base url, loaded on first use
+        self.bootstrap_lock = None
+        self.idle = {}  # (scheme, host, port) -> list of idle keep-alive connections (reader, writer)
+        self.slots = {}  # (scheme, host, port) -> asyncio.Semaphore limiting parallel connections
+
+    async def open_connection(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return await asyncio.open_connection(host, port, ssl=self.ssl_context, server_hostname=host)
+        return await asyncio.open_connection(host, port)
+
+    @staticmethod
+    def close_connection(conn):
+        try:
+            conn[1].close()
+        except Exception as ex:
+            log.debug(f'Connection close error: {ex}')
+
+    @staticmethod
+    async def exchange(conn, host, path):
+        reader, writer = conn
+        request = (f'GET {path} HTTP/1.1\r\n'
+                   f'Host: {host}\r\n'
+                   f'User-Agent: BulkDNS\r\n'
+                   f'Accept: application/rdap+json, application/json\r\n'
+                   f'Connection: keep-alive\r\n\r\n')
+        writer.write(request.encode('ascii'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if size == 0:
+                    # Skip optional trailer headers up to final empty line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            # No length information - body ends with connection close
+            body = await reader.read()
+            keep_alive = False
+
+        return status, headers, body, keep_alive
+
+    async def request(self, url):
+        for _ in range(REDIRECT_LIMIT + 1):
+            parts = urllib.parse.urlsplit(url)
+            scheme = parts.scheme.lower()
+            port = parts.port or (443 if scheme == 'https' else 80)
+            key = (scheme, parts.hostname, port)
+            host = parts.netloc.rpartition('@')[2]
+            path = parts.path or '/'
+            if parts.query:
+                path = f'{path}?{parts.query}'
+
+            if key not in self.slots:
+                self.slots[key] = asyncio.Semaphore(self.max_connections)
+                self.idle[key] = []
+
+            async with self.slots[key]:
+                idle = self.idle[key]
+                conn = idle.pop() if idle else None
+                reused = conn is not None
+                if conn is None:
+                    conn = await asyncio.wait_for(self.open_connection(key), self.timeout)
+                try:
+                    status, headers, body, keep_alive = await asyncio.wait_for(self.exchange(conn, host, path), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError, IndexError, ValueError):
+                    self.close_connection(conn)
+                    if not reused:
+                        raise
+                    # Idle keep-alive connection might have been dropped by server in meantime - retry on fresh one
+                    log.debug(f'{key} | Stale keep-alive connection, reconnecting')
+                    conn = await asyncio.wait_for(self.open_connection(key), self.timeout)
+                    status, headers, body, keep_alive = await asyncio.wait_for(self.exchange(conn, host, path), self.timeout)
+                except BaseException:
+                    self.close_connection(conn)
+                    raise
+
+                if keep_alive:
+                    idle.append(conn)
+                else:
+                    self.close_connection(conn)
+
+            if status in REDIRECT_CODES and 'location' in headers:
+                url = urllib.parse.urljoin(url, headers['location'])
+                log.debug(f'Redirected to {url}')
+                continue
+            return status, headers, body
+
+        raise ConnectionError(f'Too many redirects: {url}')
+
+    async def base_url(self, tld):
+        tld = tld.lower()
+        if tld in self.servers:
+            return self.servers[tld]
+
+        if self.bootstrap is None:
+            if self.bootstrap_lock is None:
+                self.bootstrap_lock = asyncio.Lock()
+            async with self.bootstrap_lock:
+                if self.bootstrap is None:
+                    status, headers, body = await self.request(self.bootstrap_url)
+                    if status != 200:
+                        raise ConnectionError(f'RDAP bootstrap returned {status}')
+                    bootstrap = {}
+                    for service in json.loads(body)['services']:
+                        urls = service[1]
+                        # Prefer https entry if available
+                        url = next((item for item in urls if item.startswith('https')), urls[0])
+                        for entry in service[0]:
+                            bootstrap[entry.lower()] = url
+                    self.bootstrap = bootstrap
+                    log.debug(f'RDAP bootstrap loaded: {len(bootstrap)} TLDs')
+
+        if tld not in self.bootstrap:
+            raise LookupError(f'No RDAP service for TLD: {tld}')
+        return self.bootstrap[tld]
+
+    async def rdap_run(self, domain, tld):
+        # Same return contract as rdap.rdap_run(): exec_code, available, expiry_date, err_msg
+        try:
+            url = f"{(await self.base_url(tld)).rstrip('/')}/domain/{domain}"
+            status, headers, body = await self.request(url)
+        except (OSError, asyncio.TimeoutError, LookupError, ValueError) as err:
+            log.debug(f'{domain} | RDAP request error: {err!r}')
+            return -1, None, None, f'RDAP request error: {err!r}'
+        raw_archive.append('rdap', domain, status, body)
+
+        if status == 200:
+            try:
+                json_data = json.loads(body)
+                drop_lane.observe(domain, json_data)
+                for event in json_data.get('events', []):
+                    if event.get('eventAction') == 'expiration':
+                        return 0, 'N', event['eventDate'], None
+            except (ValueError, AttributeError, KeyError):
+                pass
+            print(f'Data decoding error: {body[:200]}')
+            return -1, None, None, 'Data decoding error'
+
+        if status == 404:
+            return 0, 'Y', None, 'RDAP server returned 404, object does not exist'
+
+        log.debug(f'{domain} | RDAP server returned {status}')
+        return -1, None, None, f'RDAP server returned {status}'
+
+    async def query(self, name, tld, retry):
+        cached = await lookup_cache.get_async(name, tld)
+        if cached is not None:
+            return cached
+
+        available = None
+        expiry_date = None
+        updated = None
+        exec_code = None
+        err_msg = None
+        retry_count = 0
+
+        domain = f'{name}.{tld}'
+
+        if retry < 0:
+            retry = 0
+
+        limit_key = f'rdap:{tld}'
+
+        while retry_count <= retry:
+
+            await rate_limit.acquire_async(limit_key)
+            res = await self.rdap_run(domain, tld)
+
+            available = res[1]
+            expiry_date = res[2]
+            exec_code = res[0]
+            err_msg = res[3]
+            throttled = rate_limit.report(limit_key, exec_code, err_msg)
+
+            if exec_code == 0:
+                dt = datetime.datetime.now(datetime.UTC)
+                updated = dt.strftime("%Y-%m-%d %H:%M:%S")
+                break
+            else:
+                if not throttled:  # Throttled key is already paused by rate limiter
+                    await asyncio.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
+                retry_count += 1
+                updated = None
+
+        log.debug(f'{domain} | Returning domain data: {domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count}')
+        return lookup_cache.put((domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count))
+
+    async def close(self):
+        for idle in self.idle.values():
+            for conn in idle:
+                self.close_connection(conn)
+            idle.clear()
+
+
+# Synchronous access for thread/process based check modes. Each thread keeps its own event loop and Client,
+# so keep-alive connections survive between consecutive query() calls of the same worker.
+thread_data = threading.local()
+
+
+def query(name, tld, retry, check_cfg=None):
+    runner = getattr(thread_data, 'runner', None)
+    if runner is None:
+        runner = asyncio.Runner()
+        thread_data.runner = runner
+        thread_data.client = Client(**client_settings(check_cfg))
+    return runner.run(thread_data.client.query(name, tld, retry))
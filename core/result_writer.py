@@ -0,0 +1,156 @@
+# Package: BulkDNS
+# Module: core/result_writer
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Single DB writer for check results of all workers (result_writer = yes in [CHECK] config section).
+# Workers put checked domains rows (avail, expiry, updated, domain) to queue instead of executing UPDATE (and opening
+# DB connection) themselves, so lookups never wait for DB I/O and SQLite is not locked by many processes at once.
+# Writer collects rows per table and flushes them when batch reaches writer_batch_size, when the oldest row waits
+# longer than writer_max_latency seconds, or on shutdown. PostgreSQL batch is written with single set-based
+# UPDATE ... FROM unnest(arrays), SQLite batch with executemany() in single transaction.
+# Writer runs as thread (single_proc, multi_thread, async_proc, pipeline) or as separate process (multi_proc) - queue
+# is then passed to pool workers via attach() in pool initializer, the same way as rate limiter state.
+
+import multiprocessing
+import threading
+import signal
+import queue
+import time
+import logging
+
+from core import check_queue
+
+log = logging.getLogger('main')
+
+STOP = None  # Shutdown marker put to queue
+
+writer_queue = None  # Queue of current process, None when result writer is disabled
+writer = None  # Writer thread or process, main process only
+
+
+def settings(check_cfg):
+    return {
+        'batch_size': int(check_cfg.get('writer_batch_size', 500)),
+        'max_latency': float(check_cfg.get('writer_max_latency', 2)),
+    }
+
+
+def update(db, table, rows, call_id):
+    # rows: (avail, expiry, updated, domain) tuples - the same params as domain.update_query() before
+    # check_queue.params(), next_check is computed here
+    if db.db_type == 'sqlite':
+        db.execute_many_param(f'UPDATE {table} SET avail = ?, expiry = ?, updated = ?, next_check = ? WHERE domain = ?',
+                              check_queue.params(rows), call_id)
+    elif db.db_type == 'postgresql':
+        # Column arrays as text (expiry may come as string or datetime), converted in single statement
+        rows = check_queue.params(rows)
+        columns = [[str(row[i]) if row[i] is not None else None for row in rows] for i in range(5)]
+        sql_update_param = (f'UPDATE {table} AS t SET avail = v.avail, expiry = v.expiry::timestamp, updated = v.updated::timestamp, '
+                            f'next_check = v.next_check::timestamp '
+                            f'FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::text[]) AS v(avail, expiry, updated, next_check, domain) '
+                            f'WHERE t.domain = v.domain')
+        db.execute_single_param(sql_update_param, tuple(columns), call_id)
+    else:
+        log.error(f'Error: Incorrect database type')
+
+
+def run(db, q, batch_size, max_latency, stats=None, stores=None):
+    # Writer loop: consumes (table, rows) items until STOP marker, stats - counters with add() (pipeline.Stats)
+    # stores - {table: common.dense.Store} for tables kept in dense status store instead of DB
+    batches = {}  # table -> rows waiting for DB update
+    oldest = {}  # table -> time of the oldest waiting row
+
+    def flush(table):
+        rows = batches.pop(table)
+        oldest.pop(table)
+        if stores and table in stores:
+            stores[table].update(rows)
+        else:
+            update(db, table, rows, f'{table} | UPDATE {len(rows)} at {rows[-1][3]}')
+        if stats is not None:
+            stats.add('written', len(rows))
+
+    while True:
+        timeout = None
+        if oldest:
+            timeout = max(0.0, min(oldest.values()) + max_latency - time.monotonic())
+        try:
+            item = q.get(timeout=timeout)
+        except queue.Empty:
+            item = ()
+        if item is STOP:
+            break
+        if item:
+            table, rows = item
+            if table not in batches:
+                batches[table] = []
+                oldest[table] = time.monotonic()
+            batches[table].extend(rows)
+            if len(batches[table]) >= batch_size:
+                flush(table)
+        # Flush tables with rows waiting too long
+        now = time.monotonic()
+        for table in [table for table, since in oldest.items() if now - since >= max_latency]:
+            flush(table)
+
+    for table in list(batches):
+        flush(table)
+    for store in (stores or {}).values():
+        store.flush()
+    log.debug(f'Result writer | END')
+
+
+def run_process(db, q, batch_size, max_latency):
+    # Keyboard interrupt is handled by main process, which stops writer with STOP marker, so pending rows are saved
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run(db, q, batch_size, max_latency)
+
+
+def start(db, check_cfg, process=False):
+    # Called by main process before check run. Returns queue for pool workers or None if disabled.
+    global writer_queue, writer
+    if check_cfg.get('result_writer', 'no') != 'yes':
+        writer_queue = None
+        return None
+    cfg = settings(check_cfg)
+    queue_size = int(check_cfg.get('writer_queue_size', 1000))
+    if process:
+        writer_queue = multiprocessing.Queue(queue_size)
+        writer = multiprocessing.Process(target=run_process, name='ResultWriter',
+                                         args=(db, writer_queue, cfg['batch_size'], cfg['max_latency']))
+    else:
+        writer_queue = queue.Queue(queue_size)
+        writer = threading.Thread(target=run, name='ResultWriter',
+                                  args=(db, writer_queue, cfg['batch_size'], cfg['max_latency']))
+    writer.start()
+    log.info(f'Result writer started | Batch size {cfg["batch_size"]} | Max latency {cfg["max_latency"]}s')
+    return writer_queue
+
+
+def attach(q):
+    # Called in multi_proc pool worker initializer
+    global writer_queue
+    writer_queue = q
+
+
+def enabled():
+    return writer_queue is not None
+
+
+def submit(table, rows):
+    writer_queue.put((table, rows))
+
+
+def stop():
+    # Called by main process after check run (also after interrupt) - writes all pending rows and waits for writer
+    global writer_queue, writer
+    if writer is None:
+        return
+    writer_queue.put(STOP)
+    writer.join()
+    if isinstance(writer, multiprocessing.Process):
+        writer_queue.close()
+    log.info(f'Result writer stopped')
+    writer = None
+    writer_queue = None
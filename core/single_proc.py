@@ -1,24 +1,41 @@
 # Package: BulkDNS
 # Module: core/single_proc
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-16
+# Rev: 2026-10-18
 
 import logging
 
 from core import domain
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+from core import drop_lane
+from core import result_writer
 
 log = logging.getLogger('main')
 
 
 # This is using single query for select all domains in single table that should be checked
 # and single param query to update checked domains in that table one by one
-def single_process_run(db, tbl_names, tld, check_type, protocol):
+def single_process_run(db, tbl_names, tld, check_type, protocol, check_cfg):
+    rate_limit.start(check_cfg)
+    lookup_cache.start(check_cfg)
+    raw_archive.start(check_cfg)
+    drop_lane.start(check_cfg)
 
     log.info(f'Preparing params data...')
-    tasks = domain.params_preparation(db, tbl_names, tld, check_type, protocol)
+    tasks = domain.params_preparation(db, tbl_names, tld, check_type, protocol, check_cfg)
     
     worker_id = '0'
 
+    result_writer.start(db, check_cfg)
+    try:
+        run_tasks(tasks, worker_id)
+    finally:
+        result_writer.stop()  # Save pending results also on keyboard interrupt
+
+
+def run_tasks(tasks, worker_id):
     for task in tasks:
         db = task[0]
         table = task[1]
@@ -27,13 +44,14 @@ def single_process_run(db, tbl_names, tld, check_type, protocol):
         updated_date = task[4]
         check_type = task[5]
         protocol = task[6]
+        check_cfg = task[7]
         
         log.info(f'Checking {table} | {param}')
         if protocol == 'rdap':
-            domain.run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id)
+            domain.run_domain_check_param_rdap(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg)
             continue
         elif protocol == 'whois':
-            domain.run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id)
+            domain.run_domain_check_param_whois(db, table, param, exp_date, updated_date, check_type, worker_id, check_cfg)
             continue
         else:
             log.error(f'Unidentified protocol: {protocol}')
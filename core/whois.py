@@ -1,13 +1,19 @@
 # Package: BulkDNS
 # Module: core/whois
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-01-31
+# Rev: 2026-10-18
 
 import whoisdomain
 import logging
 import datetime
 import random
 import time
+import socket
+
+from core import whois_thin
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
 
 log = logging.getLogger('main')
 
@@ -36,7 +42,68 @@ def get_domain_raw_data(name, tld):
         print(f'{domain} | Exception WhoisCommandTimeout: {e}')
 
 
+# Availability-only check for thin registries: direct registry query, no referral follow-up, no full record parsing.
+def get_domain_data_thin(name, tld, retry):
+    domain = f'{name}.{tld}'
+
+    exec_count = 0
+    retry_count = 0
+    available = None
+    expiry_date = None
+    updated = None
+    exec_code = -1  # Assume error as default
+    err_msg = None
+
+    limit_key = f'whois:{tld}'
+
+    while exec_count <= retry_count < retry:
+        exec_count += 1
+        rate_limit.acquire(limit_key)
+        try:
+            log.debug(f'{domain} | Checking domain (thin registry)')
+            text = whois_thin.query(domain, tld)
+            raw_archive.append('whois', domain, 0, text)
+            res = whois_thin.classify(text)
+        except socket.timeout as err:
+            res = (-1, None, None, 'WhoisCommandTimeout')
+            log.debug(f'{domain} | Exception WhoisCommandTimeout | {err}')
+        except OSError as err:
+            res = (-1, None, None, 'WhoisCommandFailed')
+            log.debug(f'{domain} | Exception WhoisCommandFailed | {err}')
+        throttled = rate_limit.report(limit_key, res[0], res[3])
+
+        if res[0] == 0:
+            exec_code = 0
+            available = res[1]
+            expiry_date = res[2]
+            err_msg = None
+            dt = datetime.datetime.now(datetime.UTC)
+            updated = dt.strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            err_msg = res[3]
+            retry_count += 1
+            log.debug(f'{domain} | Exception {err_msg} | Retrying {retry_count}')
+            if not throttled:  # Throttled key is already paused by rate limiter
+                time.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
+
+    if exec_count == retry_count > 0:
+        log.debug(f'{domain} | Exception {err_msg} | Retried: {retry_count} | No more retries...')
+    else:
+        log.debug(f'{domain} | Domain information successfully gained | Retry count: {retry_count}')
+
+    log.debug(f'{domain} | Returning domain data: {domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count}')
+    return domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count
+
+
 def get_domain_data(name, tld, retry):
+    cached = lookup_cache.get(name, tld)
+    if cached is not None:
+        return cached
+
+    # Thin registry holds availability and expiry itself - skip whoisdomain full parsing and registrar referrals
+    if whois_thin.is_thin(tld):
+        return lookup_cache.put(get_domain_data_thin(name, tld, retry))
+
     domain = f'{name}.{tld}'
 
     exec_count = 0
@@ -47,10 +114,15 @@ def get_domain_data(name, tld, retry):
     exec_code = -1  # Assume error as default
     err_msg = None
 
+    limit_key = f'whois:{tld}'
+
     while exec_count <= retry_count < retry:
+        rate_limit.acquire(limit_key)
         try:
             log.debug(f'{domain} | Checking domain')
-            res = whoisdomain.query(domain=domain, cmd='whois', slow_down=0, cache_age=0)
+            # Raw WHOIS text is requested only when it is archived
+            raw = {'include_raw_whois_text': True} if raw_archive.sink is not None else {}
+            res = whoisdomain.query(domain=domain, cmd='whois', slow_down=0, cache_age=0, **raw)
             if res is None:
                 log.debug(f'{domain} | Domain information NOT FOUND')
                 available = 'Y'
@@ -61,6 +133,7 @@ def get_domain_data(name, tld, retry):
                 err_msg = None
             else:
                 log.debug(f'{domain} | Domain information FOUND ')
+                raw_archive.append('whois', domain, 0, getattr(res, 'text', None))
                 available = 'N'
                 expiry_date = str(res.expiration_date)
                 dt = datetime.datetime.now(datetime.UTC)
@@ -68,6 +141,7 @@ def get_domain_data(name, tld, retry):
                 exec_code = 0
                 err_msg = None
             exec_count += 1
+            rate_limit.report(limit_key, exec_code, err_msg)
         except whoisdomain.WhoisPrivateRegistry as err:
             err_msg = 'WhoisPrivateRegistry'
             retry_count += 1
@@ -89,7 +163,9 @@ def get_domain_data(name, tld, retry):
             retry_count += 1
             exec_count += 1
             log.debug(f'{domain} | Exception WhoisQuotaExceeded | {err} | Retrying {retry_count}')
-            time.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
+            # Registry quota hit - rate limiter decreases rate and pauses the key for all workers
+            if not rate_limit.report(limit_key, -1, err_msg):
+                time.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
             continue
 
         except whoisdomain.FailedParsingWhoisOutput as err:
@@ -130,4 +206,4 @@ def get_domain_data(name, tld, retry):
         log.debug(f'{domain} | Domain information successfully gained | Retry count: {retry_count}')
 
     log.debug(f'{domain} | Returning domain data: {domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count}')
-    return domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count
+    return lookup_cache.put((domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count))
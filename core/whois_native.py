@@ -0,0 +1,224 @@
+# Package: BulkDNS
+# Module: core/whois_native
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# In-process asyncio WHOIS (port 43) client, alternative to core/whois which spawns 'whois' binary via whoisdomain
+# package for every domain (and suffers whoisdomain memory leak - see doc/BUGS&TODO.md).
+# Number of parallel TCP sessions is bounded per WHOIS server, server hostnames are resolved once and cached (TTL),
+# WHOIS server for TLD is taken from 'whois_servers' config override or discovered once via IANA (whois.iana.org).
+# Only registry server is queried - registrar referrals are not followed (availability and expiry are in registry data).
+# Responses from thin registries are classified with fast whois_thin.classify(), others with generic parse().
+# query() returns the same 9 items tuple as whois.get_domain_data().
+
+import asyncio
+import re
+import time
+import datetime
+import random
+import threading
+import socket
+import logging
+
+from core import whois_thin
+from core import rate_limit
+from core import lookup_cache
+from core import raw_archive
+
+log = logging.getLogger('main')
+
+IANA_SERVER = 'whois.iana.org'
+WHOIS_PORT = 43
+MAX_RESPONSE_SIZE = 1048576  # Safety limit for single response (1 MB)
+
+# Markers are matched against lowercase response text
+NOT_FOUND_MARKERS = ('no match for', 'not found', 'no data found', 'no entries found', 'no object found',
+                     'nothing found', 'status: free', 'status: available', 'is available for registration')
+QUOTA_MARKERS = ('quota exceeded', 'limit exceeded', 'too many requests', 'rate limit', 'query rate')
+EXPIRY_RE = re.compile(r'^\s*(?:registry expiry date|registrar registration expiration date|expiration date|'
+                       r'expiry date|expire date|expires on|expires|paid-till)\s*:\s*(\S.*?)\s*$', re.IGNORECASE | re.MULTILINE)
+REFER_RE = re.compile(r'^(?:whois|refer):\s*(\S+)', re.IGNORECASE | re.MULTILINE)
+
+
+def parse_servers(value):
+    # 'com:whois.verisign-grs.com, net:127.0.0.1:4343' -> {'com': ('whois.verisign-grs.com', 43), 'net': ('127.0.0.1', 4343)}
+    servers = {}
+    if not value:
+        return servers
+    for item in value.replace(" ", "").split(","):
+        if not item:
+            continue
+        tld, server = item.split(":", 1)
+        host, _, port = server.partition(":")
+        servers[tld.lower()] = (host, int(port) if port else WHOIS_PORT)
+    return servers
+
+
+def client_settings(check_cfg):
+    # Translate [CHECK] config section items into Client() keyword arguments
+    if check_cfg is None:
+        check_cfg = {}
+    return {
+        'servers': parse_servers(check_cfg.get('whois_servers', '')),
+        'max_connections': int(check_cfg.get('whois_connections', 8)),
+        'timeout': float(check_cfg.get('whois_timeout', 30)),
+        'dns_ttl': float(check_cfg.get('whois_dns_ttl', 300)),
+    }
+
+
+def parse(text):
+    # Returns exec_code, available, expiry_date, err_msg (the same contract as rdap.rdap_run())
+    if not text.strip():
+        return -1, None, None, 'Empty WHOIS response'
+    match = EXPIRY_RE.search(text)
+    if match:
+        return 0, 'N', match.group(1), None
+    lower = text.lower()
+    if any(marker in lower for marker in QUOTA_MARKERS):
+        return -1, None, None, 'WhoisQuotaExceeded'
+    if any(marker in lower for marker in NOT_FOUND_MARKERS):
+        return 0, 'Y', None, None
+    if 'domain name:' in lower or 'domain:' in lower:
+        return 0, 'N', None, None  # Registered, but registry does not publish expiry date
+    return -1, None, None, 'FailedParsingWhoisOutput'
+
+
+class Client:
+    def __init__(self, servers=None, max_connections=8, timeout=30.0, dns_ttl=300.0):
+        self.servers = dict(servers or {})  # tld -> (host, port), extended by IANA discovery
+        self.max_connections = max_connections  # Max parallel TCP sessions to single WHOIS server
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self.addresses = {}  # (host, port) -> (expires_at, [sockaddr, ...])
+        self.slots = {}  # (host, port) -> asyncio.Semaphore
+        self.discovery_lock = None
+
+    async def resolve(self, host, port):
+        cached = self.addresses.get((host, port))
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = [info[4][:2] for info in infos]
+        self.addresses[(host, port)] = (time.monotonic() + self.dns_ttl, addresses)
+        log.debug(f'{host} resolved to {addresses}')
+        return addresses
+
+    async def whois(self, host, port, query):
+        key = (host, port)
+        if key not in self.slots:
+            self.slots[key] = asyncio.Semaphore(self.max_connections)
+
+        async with self.slots[key]:
+            error = None
+            for address in await self.resolve(host, port):
+                try:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(address[0], address[1]), self.timeout)
+                except (OSError, asyncio.TimeoutError) as err:
+                    error = err
+                    continue
+                try:
+                    writer.write(f'{query}\r\n'.encode('utf-8'))
+                    await writer.drain()
+                    data = await asyncio.wait_for(reader.read(MAX_RESPONSE_SIZE), self.timeout)
+                    # Server closes connection after response - read the rest if first read was partial
+                    while len(data) < MAX_RESPONSE_SIZE:
+                        chunk = await asyncio.wait_for(reader.read(MAX_RESPONSE_SIZE - len(data)), self.timeout)
+                        if not chunk:
+                            break
+                        data += chunk
+                finally:
+                    writer.close()
+                return data.decode('utf-8', errors='replace')
+            raise error if error is not None else OSError(f'No address for {host}')
+
+    async def server(self, tld):
+        tld = tld.lower()
+        if tld in self.servers:
+            return self.servers[tld]
+        if whois_thin.is_thin(tld):
+            return whois_thin.THIN_REGISTRIES[tld][0], WHOIS_PORT
+        if self.discovery_lock is None:
+            self.discovery_lock = asyncio.Lock()
+        async with self.discovery_lock:
+            if tld not in self.servers:
+                text = await self.whois(IANA_SERVER, WHOIS_PORT, tld)
+                match = REFER_RE.search(text)
+                if match is None:
+                    raise LookupError(f'No WHOIS server for TLD: {tld}')
+                self.servers[tld] = (match.group(1), WHOIS_PORT)
+                log.debug(f'WHOIS server for {tld}: {match.group(1)}')
+        return self.servers[tld]
+
+    async def whois_run(self, domain, tld):
+        try:
+            host, port = await self.server(tld)
+            text = await self.whois(host, port, domain)
+        except (OSError, asyncio.TimeoutError, LookupError) as err:
+            log.debug(f'{domain} | WHOIS request error: {err!r}')
+            return -1, None, None, 'WhoisCommandFailed'
+        raw_archive.append('whois', domain, 0, text)
+        if whois_thin.is_thin(tld):
+            res = whois_thin.classify(text)
+            if res[0] == 0:
+                return res
+        return parse(text)  # Generic parser also recognizes quota / rate limit responses
+
+    async def query(self, name, tld, retry):
+        cached = await lookup_cache.get_async(name, tld)
+        if cached is not None:
+            return cached
+
+        domain = f'{name}.{tld}'
+
+        exec_count = 0
+        retry_count = 0
+        available = None
+        expiry_date = None
+        updated = None
+        exec_code = -1  # Assume error as default
+        err_msg = None
+
+        limit_key = f'whois:{tld}'
+
+        while exec_count <= retry_count < retry:
+            log.debug(f'{domain} | Checking domain')
+            await rate_limit.acquire_async(limit_key)
+            res = await self.whois_run(domain, tld)
+            exec_count += 1
+            throttled = rate_limit.report(limit_key, res[0], res[3])
+            if res[0] == 0:
+                exec_code = 0
+                available = res[1]
+                expiry_date = res[2]
+                err_msg = None
+                dt = datetime.datetime.now(datetime.UTC)
+                updated = dt.strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                err_msg = res[3]
+                retry_count += 1
+                log.debug(f'{domain} | Exception {err_msg} | Retrying {retry_count}')
+                if not throttled:  # Throttled key is already paused by rate limiter
+                    await asyncio.sleep(random.random())  # random floating point number in the range 0.0 <= X < 1.0
+
+        if exec_count == retry_count > 0:
+            log.debug(f'{domain} | Exception {err_msg} | Retried: {retry_count} | No more retries...')
+        else:
+            log.debug(f'{domain} | Domain information successfully gained | Retry count: {retry_count}')
+
+        log.debug(f'{domain} | Returning domain data: {domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count}')
+        return lookup_cache.put((domain, name, tld, available, expiry_date, updated, exec_code, err_msg, retry_count))
+
+
+# Synchronous access for thread/process based check modes. Each thread keeps its own event loop and Client,
+# so resolved addresses and discovered servers are reused between consecutive query() calls of the same worker.
+thread_data = threading.local()
+
+
+def query(name, tld, retry, check_cfg=None):
+    runner = getattr(thread_data, 'runner', None)
+    if runner is None:
+        runner = asyncio.Runner()
+        thread_data.runner = runner
+        thread_data.client = Client(**client_settings(check_cfg))
+    return runner.run(thread_data.client.query(name, tld, retry))
@@ -0,0 +1,62 @@
+# Package: BulkDNS
+# Module: core/whois_thin
+# Author: Michal Selma <michal@selma.cc>
+# Rev: 2026-10-18
+
+# Availability-only WHOIS check for thin registries (e.g. Verisign .com/.net).
+# Thin registry response holds all we need (availability and expiry date), so registry server is queried directly
+# over port 43 - no whois binary, no registrar referral - and response is classified with single precompiled
+# regex scan instead of full record parsing.
+
+import re
+import socket
+import logging
+
+from core import rate_limit
+
+log = logging.getLogger('main')
+
+WHOIS_PORT = 43
+MAX_RESPONSE_SIZE = 1048576  # Safety limit for single response (1 MB)
+
+# tld -> (registry WHOIS server, query format). 'domain' keyword limits Verisign response to domain records only.
+THIN_REGISTRIES = {
+    'com': ('whois.verisign-grs.com', 'domain {}'),
+    'net': ('whois.verisign-grs.com', 'domain {}'),
+}
+
+# Single pass over response: whichever comes first - not found marker or registry expiry date
+THIN_RE = re.compile(r'^(No match for )|^\s*Registry Expiry Date:\s*(\S+)', re.MULTILINE)
+
+
+def is_thin(tld):
+    return tld.lower() in THIN_REGISTRIES
+
+
+def classify(text):
+    # Returns exec_code, available, expiry_date, err_msg (the same contract as rdap.rdap_run())
+    match = THIN_RE.search(text)
+    if match is None:
+        # Query quota / connection limit reply (e.g. 'Your connection limit exceeded') - throttling for rate limiter
+        if rate_limit.is_throttle(text):
+            return -1, None, None, 'WhoisQuotaExceeded'
+        return -1, None, None, 'FailedParsingWhoisOutput'
+    if match.group(1) is not None:
+        return 0, 'Y', None, None
+    return 0, 'N', match.group(2), None
+
+
+def query(domain, tld, timeout=30):
+    # Raw registry query. Raises OSError (socket.timeout included) on network failure.
+    server, query_format = THIN_REGISTRIES[tld.lower()]
+    with socket.create_connection((server, WHOIS_PORT), timeout=timeout) as sock:
+        sock.sendall(f'{query_format.format(domain)}\r\n'.encode('utf-8'))
+        chunks = []
+        size = 0
+        while size < MAX_RESPONSE_SIZE:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+    return b''.join(chunks).decode('utf-8', errors='replace')
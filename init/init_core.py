@@ -1,7 +1,7 @@
 # Package: BulkDNS
 # Module: init/init_core
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-22
+# Rev: 2026-10-18
 
 import logging
 
@@ -10,6 +10,8 @@ from init import init_domain
 from init import init_dict
 from common import sqlite
 from common import postgresql
+from common import name_gen
+from common import dense
 
 log = logging.getLogger('main')
 
@@ -21,6 +23,8 @@ def run(config_dta):
     tld_domain = config_dta['DOMAIN']['tld']
     # remove spaces and split key/value(string) to list using comma as separator of items
     tbl_domain_names = config_dta['DOMAIN']['tbl_names'].replace(" ", "").split(",")
+    tbl_dense_names = [item for item in config_dta['DOMAIN'].get('dense_tables', '').replace(" ", "").split(",") if item]
+    dense_location = config_dta['DOMAIN'].get('dense_location', './db/dense')
 
     db_dict_type = config_dta['DICTIONARY']['db_type']
     db_dict_name = config_dta['DICTIONARY']['db_name']
@@ -39,9 +43,10 @@ def run(config_dta):
     if db_domain_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
+        db_pragmas = sqlite.settings(cfg_db)
         sys_db = cfg_db['sys_db']  # Taken from config based on specific DB.* config section driven by db_type
-        db_domain = sqlite.DB(db_domain_type, db_path, sys_db, db_retry_limit)
-        db_domain_arch = sqlite.DB(db_domain_type, db_path, db_domain_archive_name, db_retry_limit)
+        db_domain = sqlite.DB(db_domain_type, db_path, sys_db, db_retry_limit, db_pragmas)
+        db_domain_arch = sqlite.DB(db_domain_type, db_path, db_domain_archive_name, db_retry_limit, db_pragmas)
     elif db_domain_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         sys_db = cfg_db['sys_db']  # Taken from config based on specific DB.* config section driven by db_type
@@ -49,8 +54,10 @@ def run(config_dta):
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
-        db_domain = postgresql.DB(db_domain_type, sys_db, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
-        db_domain_arch = postgresql.DB(db_domain_type, db_domain_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
+        db_domain = postgresql.DB(db_domain_type, sys_db, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
+        db_domain_arch = postgresql.DB(db_domain_type, db_domain_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -59,9 +66,10 @@ def run(config_dta):
     if db_dict_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
+        db_pragmas = sqlite.settings(cfg_db)
         sys_db = cfg_db['sys_db']  # Taken from config based on specific DB.* config section driven by db_type
-        db_dict = sqlite.DB(db_dict_type, db_path, sys_db, db_retry_limit)
-        db_dict_arch = sqlite.DB(db_dict_type, db_path, db_dict_archive_name, db_retry_limit)
+        db_dict = sqlite.DB(db_dict_type, db_path, sys_db, db_retry_limit, db_pragmas)
+        db_dict_arch = sqlite.DB(db_dict_type, db_path, db_dict_archive_name, db_retry_limit, db_pragmas)
     elif db_dict_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         sys_db = cfg_db['sys_db']  # Taken from config based on specific DB.* config section driven by db_type
@@ -69,8 +77,10 @@ def run(config_dta):
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
-        db_dict = postgresql.DB(db_dict_type, sys_db, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
-        db_dict_arch = postgresql.DB(db_dict_type, db_dict_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
+        db_dict = postgresql.DB(db_dict_type, sys_db, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
+        db_dict_arch = postgresql.DB(db_dict_type, db_dict_archive_name, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -79,8 +89,9 @@ def run(config_dta):
     if db_backup_type == 'sqlite':
         cfg_db = config_dta['DB.sqlite']
         db_path = cfg_db['db_location']
+        db_pragmas = sqlite.settings(cfg_db)
         sys_db = cfg_db['sys_db']  # Taken from config based on specific DB.* config section driven by db_type
-        db_backup = sqlite.DB(db_backup_type, db_path, sys_db, db_retry_limit)
+        db_backup = sqlite.DB(db_backup_type, db_path, sys_db, db_retry_limit, db_pragmas)
     elif db_backup_type == 'postgresql':
         cfg_db = config_dta['DB.postgres']
         sys_db = cfg_db['sys_db']  # Taken from config based on specific DB.* config section driven by db_type
@@ -88,7 +99,9 @@ def run(config_dta):
         db_port = cfg_db['db_port']
         user_name = cfg_db['user_name']
         user_password = cfg_db['user_password']
-        db_backup = postgresql.DB(db_backup_type, sys_db, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time)
+        pool_min_size = int(cfg_db.get('pool_min_size', 0))
+        pool_max_size = int(cfg_db.get('pool_max_size', 0))
+        db_backup = postgresql.DB(db_backup_type, sys_db, db_host, db_port, user_name, user_password, db_retry_limit, db_retry_sleep_time, pool_min_size, pool_max_size)
     else:
         log.critical(f'Error: Incorrect database type')
         return
@@ -98,6 +111,7 @@ def run(config_dta):
     log.info('3 - Upload dictionaries')
     log.info('4 - Create dictionary domains')
     log.info('5 - Generate and create dictionary domains combinations')
+    log.info('6 - Create dense status stores (dense_tables) with current state of DB tables')
     log.info('Choose option and press Enter: ')
     user_option = input()
 
@@ -134,7 +148,10 @@ def run(config_dta):
     elif user_option == '2':
         # Generate char-based domain dictionaries (one, two, three and four char combinations)
         db_domain.db_name = db_domain_name  # Modify default db_name to use domain database
-        init_domain.create_domain_dta(db_domain, tbl_domain_names, tld_domain)
+        patterns = name_gen.load_patterns(config_dta)  # Built-in and [PATTERN.<table name>] config patterns
+        gen_workers = int(config_dta['DOMAIN'].get('gen_workers', 1))
+        gen_shard = init_domain.parse_shard(config_dta['DOMAIN'].get('gen_shard', ''))
+        init_domain.create_domain_dta(db_domain, tbl_domain_names, tld_domain, patterns, gen_workers, gen_shard)
 
     elif user_option == '3':
         # Upload language words list and generic list
@@ -149,8 +166,17 @@ def run(config_dta):
     elif user_option == '5':
         # Generate dictionary combinations
         db_dict.db_name = db_dict_name
-        init_dict.create_comb_domains(db_dict, db_dict_arch, tbl_dict_names_dictionary, tld_dict)
-        init_dict.create_comb_domains_two_tables(db_dict, db_dict_arch, tbl_dict_names_dictionary[1], tbl_dict_names_dictionary[0], tld_dict)
+        comb_cfg = init_dict.comb_settings(config_dta['DICTIONARY'])
+        init_dict.create_comb_domains(db_dict, db_dict_arch, tbl_dict_names_dictionary, tld_dict, comb_cfg)
+        init_dict.create_comb_domains_two_tables(db_dict, db_dict_arch, tbl_dict_names_dictionary[1], tbl_dict_names_dictionary[0], tld_dict, comb_cfg)
+
+    elif user_option == '6':
+        # Dense status stores for tables listed in dense_tables, existing check results are imported from DB tables
+        db_domain.db_name = db_domain_name
+        patterns = name_gen.load_patterns(config_dta)
+        stores = dense.open_stores(dense_location, tbl_dense_names, tld_domain, patterns)
+        for store in stores.values():
+            store.import_table(db_domain)
 
     else:
         log.info('Incorrect option picked')
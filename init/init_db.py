@@ -1,7 +1,7 @@
 # Package: BulkDNS
 # Module: init/init_db
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-22
+# Rev: 2026-10-18
 
 import logging
 
@@ -25,10 +25,12 @@ def create_db(db, new_db_name):
 def create_tbl(db, tbl_names, tld):
     for tbl_name in tbl_names:
         table = f'{tbl_name}_{tld}'
+        # next_check - check queue (see core/check_queue), new rows are due immediately
         query = (f'CREATE TABLE {table} (domain VARCHAR(300) PRIMARY KEY NOT NULL, name VARCHAR(255), '
-                 f'tld VARCHAR(40), avail CHARACTER(1), expiry TIMESTAMP, updated TIMESTAMP)')
+                 f"tld VARCHAR(40), avail CHARACTER(1), expiry TIMESTAMP, updated TIMESTAMP, next_check TIMESTAMP DEFAULT '1970-01-01 00:00:00')")
         call_id = f'{table} | CREATE TABLE'
         db.execute_single(query, call_id)
+        db.execute_single(f'CREATE INDEX {table}_next_check ON {table} (avail, next_check)', f'{table} | CREATE INDEX')
 
 
 def create_dict_tbl(db, tbl_names):
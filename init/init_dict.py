@@ -1,60 +1,124 @@
 # Package: BulkDNS
 # Module: init/init_dict
 # Author: Michal Selma <michal@selma.cc>
-# Rev: 2024-02-22
+# Rev: 2026-10-18
 
+import multiprocessing
 import logging
 import itertools
+import bisect
+import csv
+import gzip
+import lzma
+import os
+import re
 
 log = logging.getLogger('main')
 
+COLUMNS = ('domain', 'name', 'tld', 'avail', 'expiry', 'updated')
+DICT_COLUMNS = ('domain_name', 'dictionary_term', 'term_type', 'category', 'comb_use')
+ARCHIVE_CHUNK_SIZE = 10000  # Domains per single archive lookup query
+UPLOAD_CHUNK_SIZE = 100000  # Dictionary lines per single DB insert (COPY) batch
+SOURCE_SUFFIXES = ('.txt', '.txt.gz', '.txt.xz')  # Dictionary file name after table name, first existing is used
+LABEL_RE = re.compile(r'^[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$')  # Valid domain label (name part of domain)
+
+
+# Duplicates are detected by DB, no destination data is loaded into memory:
+#  - names already in destination table are skipped on insert (bulk_load skip_existing - ON CONFLICT DO NOTHING /
+#    INSERT OR IGNORE),
+#  - names already moved to archive (_taken) DB are filtered out chunk by chunk with primary key lookup in archive.
+def not_archived(db_arch, table, rows, stats):
+    # Passes through rows (domain first) not existing in archive table
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, ARCHIVE_CHUNK_SIZE)):
+        existing = db_arch.existing_keys(table, 'domain', [row[0] for row in chunk], f'{table} | SELECT archived')
+        stats['archived'] += len(existing)
+        for row in chunk:
+            if row[0] not in existing:
+                yield row
+
+
+def insert_domains(db, db_arch, table, names, tld):
+    # Inserts names (iterable) as new domains of table, skipping names existing in table or in archive.
+    # Returns amount of inserted domains, None on DB error.
+    stats = {'archived': 0}
+    rows = ([f'{name}.{tld}', name, tld, None, None, None] for name in names)
+    call_id = f'{table} | INSERT'
+    inserted = db.bulk_load(table, COLUMNS, not_archived(db_arch, table, rows, stats), call_id, skip_existing=True)
+    if inserted is None:
+        log.error(f'{table} | Insert failed, domains not complete | Skipped as archived {stats["archived"]}')
+        return None
+    log.info(f'{table} | Inserted {inserted} | Skipped as archived {stats["archived"]}')
+    return inserted
+
+
+def open_source(source):
+    # Dictionary file opened as text, gzip / xz compressed files are decompressed on the fly
+    if source.endswith('.gz'):
+        return gzip.open(source, 'rt', encoding='utf-8', newline='')
+    if source.endswith('.xz'):
+        return lzma.open(source, 'rt', encoding='utf-8', newline='')
+    return open(source, 'r', encoding='utf-8', newline='')
+
+
+def validate_term(line_items):
+    # Returns reason of rejection or None for valid dictionary line
+    if len(line_items) != len(DICT_COLUMNS):
+        return f'{len(line_items)} fields instead of {len(DICT_COLUMNS)}'
+    if not LABEL_RE.match(line_items[0]):
+        return f'invalid domain label: {line_items[0]}'
+    if line_items[4] not in ('Y', 'N'):
+        return f'comb_use not Y/N: {line_items[4]}'
+    return None
+
+
+def read_terms(file, rejects, stats):
+    # Streams valid, not repeated dictionary lines; invalid lines go to rejects csv writer (line, reason, content).
+    # Repeated terms are detected by hash of domain_name (64 bit, so set size does not depend on term length).
+    seen = set()
+    for line_items in csv.reader(file):
+        stats['lines'] += 1
+        if not line_items or not ''.join(line_items).strip():
+            continue  # Empty line
+        reason = validate_term(line_items)
+        if reason is None and hash(line_items[0]) in seen:
+            reason = 'duplicate term'
+        if reason is not None:
+            stats['rejected'] += 1
+            rejects.writerow([stats['lines'], reason, ','.join(line_items)])
+            continue
+        seen.add(hash(line_items[0]))
+        stats['valid'] += 1
+        if stats['valid'] % 100000 == 0:
+            print(f'{stats["valid"]} read', end="\r", flush=True)
+        yield line_items
+
 
 def upload_dta(db, tbl_name, source):
+    # Streaming load of dictionary csv file (domain_name, dictionary_term, term_type, category, comb_use) into
+    # dictionary table in chunks. Invalid and repeated lines are written to <source>.rejects file instead of
+    # stopping the upload, terms already in dictionary table are skipped by DB.
     log.info(f'Opening file {source}')
+    rejects_file = f'{source}.rejects'
+    stats = {'lines': 0, 'valid': 0, 'rejected': 0}
     try:
-        with open(source, 'r') as file:
-            file_data = file.read().splitlines()
-            file.close()
-    except Exception as ex:
-        log.error(f'Exception: {ex}')
+        with open_source(source) as file, open(rejects_file, 'w', newline='') as rejects:
+            log.info(f'Uploading data into {tbl_name}')
+            call_id = f'{db.db_type} | {tbl_name} | INSERT'
+            terms = read_terms(file, csv.writer(rejects), stats)
+            inserted = db.bulk_load(tbl_name, DICT_COLUMNS, terms, call_id, chunk_size=UPLOAD_CHUNK_SIZE, skip_existing=True)
+    except (OSError, EOFError, lzma.LZMAError, UnicodeDecodeError, csv.Error) as ex:
+        log.error(f'{source} | Exception: {ex}')
         return
-
-    log.info(f'Uploading data into {tbl_name}')
-    param_array = []
-    count = 0
-
-    # Get data already in the dictionary tables
-    log.debug(f'Querying destination table: {tbl_name}')
-    query = f'SELECT domain_name FROM {tbl_name}'
-    call_id = f'{tbl_name} | SELECT'
-    res = db.execute_single(query, call_id)
-    db_data = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-
-    for line in file_data:
-        # split each line comma separated values and store as list
-        line_items = line.split(",")
-        count += 1
-        # print(line_items)  #
-        if len(line_items) != 5:
-            log.error(f'Data validation failed. Something wrong with content of the file at line {count} : {line}')
-            return
-        if line_items[0] in db_data:
-            log.warning(f'Data already exists. Skipping input line {count} : {line}')
-            continue
-        else:
-            param_array.append(line_items)
-
-    # Execute insert
-    call_id = f'{db.db_type} | {tbl_name} | INSERT'
-    if db.db_type == 'sqlite':
-        param_query = f'INSERT INTO {tbl_name}(domain_name, dictionary_term, term_type, category, comb_use) VALUES(?,?,?,?,?)'
-        db.execute_many_param(param_query, param_array, call_id)
-    elif db.db_type == 'postgresql':
-        param_query = f'INSERT INTO {tbl_name}(domain_name, dictionary_term, term_type, category, comb_use) VALUES(%s,%s,%s,%s,%s)'
-        db.execute_many_param(param_query, param_array, call_id)
-    else:
-        log.error(f'Incorrect database type')
+    if inserted is None:
+        log.error(f'{tbl_name} | Upload of {source} failed, dictionary not complete | Lines read {stats["lines"]}')
         return
+    if stats['rejected'] == 0:
+        os.remove(rejects_file)
+    else:
+        log.warning(f'{source} | {stats["rejected"]} lines rejected, see {rejects_file}')
+    log.info(f'{tbl_name} | Lines {stats["lines"]} | Valid {stats["valid"]} | Inserted {inserted} | '
+             f'Already existing {stats["valid"] - inserted} | Rejected {stats["rejected"]}')
 
 
 def create_dict_domains(db, db_arch, tbl_names, tld):
@@ -67,184 +131,118 @@ def create_dict_domains(db, db_arch, tbl_names, tld):
         log.debug(f'Source DB data: {db_data_source}')
 
         table = f'{tbl_name[5:]}_{tld}'
-
-        # Get data already in the dictionary domain tables (destination)
-        log.debug(f'Querying destination (dictionary domain) table: {db.db_name} | {table}')
-        query = f'SELECT name FROM {table}'
-        call_id = f'{table} | SELECT'
-        res = db.execute_single(query, call_id)
-        db_data_dest = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-        log.debug(f'Destination DB data: {db_data_dest}')
-
-        log.debug(f'Querying destination archive (dictionary domain archive) table: {db_arch.db_name} | {table}')
-        query = f'SELECT name FROM {table}'
-        call_id = f'{table} | SELECT'
-        res = db_arch.execute_single(query, call_id)
-        db_data_dest_arch = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-        log.debug(f'Destination DB data: {db_data_dest_arch}')
-
-        sql_params_array = []
-        for name in db_data_source:
-            if name in db_data_dest:
-                log.warning(f'Data already exists. Skipping source item: {name}')
-                continue
-            elif name in db_data_dest_arch:
-                log.debug(f'Data already exists in archive {table}. Skipping source item: {name}')
-                continue
-            else:
-                domain = f'{name}.{tld}'
-                sql_params_array.append([domain, name, tld, None, None, None])
-
-        # When params array prepared for exact table, execute
-        log.debug(f'Data preparation finished. Executing insert into {table}')
-
-        call_id = f'{table} | INSERT'
-        if db.db_type == 'sqlite':
-            sql_param_query = f'INSERT INTO {table} VALUES(?,?,?,?,?,?)'
-            db.execute_many_param(sql_param_query, sql_params_array, call_id)
-        elif db.db_type == 'postgresql':
-            sql_param_query = f'INSERT INTO {table} VALUES(%s,%s,%s,%s,%s,%s)'
-            db.execute_many_param(sql_param_query, sql_params_array, call_id)
-        else:
-            log.critical(f'Error: Incorrect database type. (Should not see me!)')
+        log.debug(f'Executing insert into {table}')
+        insert_domains(db, db_arch, table, db_data_source, tld)
+
+
+# Combination engine: names are concatenations of 2 (or 3 with comb_triples) dictionary terms. Parts are taken from
+# term lists sorted by length, so combinations longer than comb_max_length are cut off before they are built, and
+# only valid domain labels are passed on. Product is split into shards by first part term (every comb_workers-th
+# term), each shard is streamed into destination table in chunks by its own worker process. Combinations repeated
+# within or across shards (e.g. 'ab' + 'c' and 'a' + 'bc') are skipped by DB on insert.
+comb_terms = []  # Term lists of current combination run (set in worker processes by pool initializer)
+
+
+def comb_settings(cfg=None):
+    # Translate [DICTIONARY] config section items into combination engine settings
+    if cfg is None:
+        cfg = {}
+    return {
+        'max_length': int(cfg.get('comb_max_length', 63)),
+        'triples': cfg.get('comb_triples', 'no') == 'yes',
+        'workers': int(cfg.get('comb_workers', 1)),
+    }
+
+
+def init_comb_worker(terms):
+    global comb_terms
+    comb_terms = terms
+
+
+def comb_names(terms, spec, shard, shards, max_length):
+    # Yields combinations of terms lists in order given by spec (indexes of terms), first part limited to shard
+    parts = [sorted(terms[item], key=len) for item in spec]
+    lengths = [[len(term) for term in part] for part in parts]
+    # Minimal length of the rest of combination after each part
+    rest = [sum(part[0] for part in lengths[position + 1:]) for position in range(len(parts))]
+
+    def extend(prefix, position):
+        if position == len(parts):
+            if len(prefix) > 3 and prefix[2:4] == '--':
+                return  # Reserved for IDN (xn--)
+            if LABEL_RE.match(prefix):
+                yield prefix
             return
+        limit = bisect.bisect_right(lengths[position], max_length - len(prefix) - rest[position])
+        for term in parts[position][:limit]:
+            yield from extend(prefix + term, position + 1)
 
+    if not all(parts):
+        return
+    first = parts[0][shard::shards]
+    parts[0] = first
+    lengths[0] = [len(term) for term in first]
+    yield from extend('', 0)
 
-def create_comb_domains(db, db_arch, tbl_names, tld):
-    for tbl_name in tbl_names:
-        # Get dictionary items
-        log.info(f'Querying source (dictionary) table: {tbl_name}')
-        query = f"SELECT domain_name FROM {tbl_name} WHERE comb_use = 'Y'"
-        call_id = f'{tbl_name} | SELECT'
-        res = db.execute_single(query, call_id)
-        db_data_source = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-        log.debug(f'Source DB data: {db_data_source}')
-
-        # Generate combinations
-        log.info(f'Generating combinations based on {tbl_name}')
-        # itertools.product is ~10-30% faster
-        # ret = [(a+b) for a in db_data_source for b in db_data_source]
-        ret = itertools.product(db_data_source, repeat=2)
-        combinations = [''.join(item) for item in ret]
-        combinations = list(set(combinations))  # Remove duplicates
-        log.debug(f'Generated combinations: {combinations}')
 
-        table = f'{tbl_name[5:]}_comb_{tld}'
+def load_comb_shard(db, db_arch, table, tld, spec, shard, shards, max_length):
+    names = comb_names(comb_terms, spec, shard, shards, max_length)
+    return insert_domains(db, db_arch, table, names, tld)
 
-        # Get data already in the dictionary domain tables (destination)
-        log.info(f'Querying destination (dictionary domain) table: {table}')
-        query = f'SELECT name FROM {table}'
-        call_id = f'{table} | SELECT'
-        res = db.execute_single(query, call_id)
-        db_data_dest = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-        log.debug(f'Destination DB data: {db_data_dest}')
-
-        log.info(f'Querying destination archive (dictionary domain archive) table: {table}')
-        query = f'SELECT name FROM {table}'
-        call_id = f'{table} | SELECT'
-        res = db_arch.execute_single(query, call_id)
-        db_data_dest_arch = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-        log.debug(f'Destination DB data: {db_data_dest_arch}')
-
-        sql_params_array = []
-        for name in combinations:
-            if name in db_data_dest:
-                log.debug(f'Data already exists in {table}. Skipping source item: {name}')
-                continue
-            elif name in db_data_dest_arch:
-                log.debug(f'Data already exists in archive {table}. Skipping source item: {name}')
-                continue
-            else:
-                domain = f'{name}.{tld}'
-                sql_params_array.append([domain, name, tld, None, None, None])
-
-        # When params array prepared for exact table, execute
-        log.info(f'Data preparation finished. Executing insert into {table}')
-
-        call_id = f'{table} | INSERT'
-        if db.db_type == 'sqlite':
-            sql_param_query = f'INSERT INTO {table} VALUES(?,?,?,?,?,?)'
-            db.execute_many_param(sql_param_query, sql_params_array, call_id)
-        elif db.db_type == 'postgresql':
-            sql_param_query = f'INSERT INTO {table} VALUES(%s,%s,%s,%s,%s,%s)'
-            db.execute_many_param(sql_param_query, sql_params_array, call_id)
-        else:
-            log.critical(f'Error: Incorrect database type. (Should not see me!)')
-            return
 
+def create_combinations(db, db_arch, table, tld, terms, specs, comb_cfg):
+    # terms - list of term lists, specs - tuples of terms indexes, each one product of combination parts
+    workers = max(1, comb_cfg['workers'])
+    units = [(db, db_arch, table, tld, spec, shard, workers, comb_cfg['max_length']) for spec in specs for shard in range(workers)]
+    log.info(f'Generating combinations into {table} | Products {len(specs)} | Shards {len(units)} | Workers {workers}')
+    if workers == 1:
+        init_comb_worker(terms)
+        results = [load_comb_shard(*unit) for unit in units]
+    else:
+        with multiprocessing.Pool(workers, initializer=init_comb_worker, initargs=(terms,)) as pool:
+            results = pool.starmap(load_comb_shard, units)
+    if None in results:
+        log.error(f'{table} | Insert of {results.count(None)} of {len(units)} shards failed, combinations not complete')
+    log.info(f'{table} | {sum(item for item in results if item is not None)} new combinations inserted')
 
-def create_comb_domains_two_tables(db, db_arch, tbl_name_dict, tbl_generic_dict, tld):
-    # Get table1 dictionary items
-    log.info(f'Querying first source (dictionary) table: {tbl_name_dict}')
-    query = f"SELECT domain_name FROM {tbl_name_dict} WHERE comb_use = 'Y'"
-    call_id = f'{tbl_name_dict} | SELECT'
-    res = db.execute_single(query, call_id)
-    db_data_source_1 = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-    log.debug(f'Source DB data: {db_data_source_1}')
 
-    # Get table2 dictionary items
-    log.info(f'Querying second source (dictionary) table: {tbl_generic_dict}')
-    query = f"SELECT domain_name FROM {tbl_generic_dict} WHERE comb_use = 'Y'"
-    call_id = f'{tbl_generic_dict} | SELECT'
+def comb_source(db, tbl_name):
+    # Dictionary terms used for combinations
+    log.info(f'Querying source (dictionary) table: {tbl_name}')
+    query = f"SELECT domain_name FROM {tbl_name} WHERE comb_use = 'Y'"
+    call_id = f'{tbl_name} | SELECT'
     res = db.execute_single(query, call_id)
-    db_data_source_2 = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-    log.debug(f'Source DB data: {db_data_source_2}')
-
-    # Generate combinations
-    log.info(f'Generating combinations based on {tbl_name_dict} & {tbl_generic_dict}')
-    # itertools.product is ~10-30% faster
-    # ret = [(a+b) for a in db_data_source for b in db_data_source]
-    ret = itertools.chain(itertools.product(db_data_source_1, db_data_source_2), itertools.product(db_data_source_2, db_data_source_1))
-    combinations = [''.join(item) for item in ret]
-    combinations = list(set(combinations))  # Remove duplicates
-    log.debug(f'Generated combinations: {combinations}')
+    return [row[0] for row in res or []]  # Change tuple of single-item tuples to tuple of single-items
 
-    table = f'{tbl_name_dict[5:]}_comb_{tld}'
 
-    # Get data already in the dictionary domain tables (destination)
-    log.info(f'Querying destination (dictionary domain) table: {table}')
-    query = f'SELECT name FROM {table}'
-    call_id = f'{table} | SELECT'
-    res = db.execute_single(query, call_id)
-    db_data_dest = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-    log.debug(f'Destination DB data: {db_data_dest}')
-
-    log.info(f'Querying destination archive (dictionary domain archive) table: {table}')
-    query = f'SELECT name FROM {table}'
-    call_id = f'{table} | SELECT'
-    res = db_arch.execute_single(query, call_id)
-    db_data_dest_arch = [row[0] for row in res]  # Change tuple of single-item tuples to tuple of single-items
-    log.debug(f'Destination DB data: {db_data_dest_arch}')
-
-    sql_params_array = []
-    for name in combinations:
-        if name in db_data_dest:
-            log.debug(f'Data already exists in {table}. Skipping source item: {name}')
-            continue
-        elif name in db_data_dest_arch:
-            log.debug(f'Data already exists in archive {table}. Skipping source item: {name}')
-            continue
-        else:
-            domain = f'{name}.{tld}'
-            sql_params_array.append([domain, name, tld, None, None, None])
+def create_comb_domains(db, db_arch, tbl_names, tld, comb_cfg=None):
+    if comb_cfg is None:
+        comb_cfg = comb_settings()
+    for tbl_name in tbl_names:
+        terms = [comb_source(db, tbl_name)]
+        specs = [(0, 0)] + ([(0, 0, 0)] if comb_cfg['triples'] else [])
+        table = f'{tbl_name[5:]}_comb_{tld}'
+        create_combinations(db, db_arch, table, tld, terms, specs, comb_cfg)
 
-    # When params array prepared for exact table, execute
-    log.info(f'Data preparation finished. Executing insert into {table}')
 
-    call_id = f'{table} | INSERT'
-    if db.db_type == 'sqlite':
-        sql_param_query = f'INSERT INTO {table} VALUES(?,?,?,?,?,?)'
-        db.execute_many_param(sql_param_query, sql_params_array, call_id)
-    elif db.db_type == 'postgresql':
-        sql_param_query = f'INSERT INTO {table} VALUES(%s,%s,%s,%s,%s,%s)'
-        db.execute_many_param(sql_param_query, sql_params_array, call_id)
-    else:
-        log.critical(f'Error: Incorrect database type. (Should not see me!)')
-        return
+def create_comb_domains_two_tables(db, db_arch, tbl_name_dict, tbl_generic_dict, tld, comb_cfg=None):
+    if comb_cfg is None:
+        comb_cfg = comb_settings()
+    terms = [comb_source(db, tbl_name_dict), comb_source(db, tbl_generic_dict)]
+    # Both tables in every combination, in any order
+    specs = [(0, 1), (1, 0)]
+    if comb_cfg['triples']:
+        specs += [spec for spec in itertools.product((0, 1), repeat=3) if 0 in spec and 1 in spec]
+    table = f'{tbl_name_dict[5:]}_comb_{tld}'
+    create_combinations(db, db_arch, table, tld, terms, specs, comb_cfg)
 
 
-def upload_dict(db,tbl_names):
+def upload_dict(db, tbl_names):
     for tbl_name in tbl_names:
-        source = f'db/{tbl_name}.txt'
+        sources = [f'db/{tbl_name}{suffix}' for suffix in SOURCE_SUFFIXES]
+        source = next((item for item in sources if os.path.exists(item)), None)
+        if source is None:
+            log.error(f'No dictionary file for {tbl_name}: {", ".join(sources)}')
+            continue
         log.info(f'Processing {source} into {tbl_name}')
         upload_dta(db, tbl_name, source)
@@ -8,7 +8,6 @@ import sys
 import configparser
 import logging
 
-from init import init_core
 from core import proc_core
 from arch import arch_core
 
@@ -33,6 +32,7 @@ if __name__ == '__main__':
     log.info('Choose option and press Enter: ')
     user_option = input()
     if user_option == '1':
+        from init import init_core  # Names generator needs NumPy, domains check and archiving do not
         init_core.run(config)
     elif user_option == '2':
         proc_core.run(config)